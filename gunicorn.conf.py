@@ -0,0 +1,39 @@
+import os
+import multiprocessing
+
+# ==========================================
+# 多 worker 部署配置 (gunicorn + UvicornWorker)
+# ==========================================
+# 启动: gunicorn new_report:app -c gunicorn.conf.py
+# 单进程 uvicorn 启动方式保持不变；使用本配置时自动开启 MULTI_WORKER=1，
+# 任务状态、会话、模型状态与并发信号量改用 Redis 在 worker 间共享 (见 utils/shared_state.py)。
+#
+# worker 数量: WEB_CONCURRENCY 优先；否则按 CPU 核数的一半，并受 GUNICORN_MAX_WORKERS 限制。
+# 每个 worker 有独立的数据库连接池 (同步引擎约 15 + 异步引擎 15)，
+# 扩大 worker 数时需同步确认 MySQL max_connections，详见 docs/devops/MULTI_WORKER_DEPLOYMENT.md。
+
+# worker 进程在导入应用前读取该变量，必须在这里设置
+os.environ.setdefault("MULTI_WORKER", "1")
+
+_cpu = multiprocessing.cpu_count()
+_max_workers = int(os.getenv("GUNICORN_MAX_WORKERS", 40))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '34521')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", 0)) or max(2, min(_cpu // 2, _max_workers))
+
+# 不预加载：每个 worker 独立导入应用，各自创建连接池、线程池和后台线程 (fork 后不可共享)
+preload_app = False
+
+# SSE 长连接与大文档导入可能持续数分钟
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 300))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 60))
+keepalive = 5
+
+# 定期轮换 worker，抑制 python-docx / lxml 大文档处理后的内存碎片增长
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+accesslog = None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
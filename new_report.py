@@ -1,5 +1,6 @@
 import os
 import sys
+from contextlib import asynccontextmanager
 
 # 将当前目录添加到 Python 路径，确保能找到 routers 等模块
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -10,7 +11,7 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles  # 1. 引入 StaticFiles
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from routers import (
     query_modul_api,
     import_modul_api,
@@ -38,11 +39,31 @@ from routers import (
 import server_config
 from routers import lyf_router
 from utils.log_config import setup_logging
+from utils.shared_state import check_shared_state
+from utils.deletion_reaper import start_reaper
+from utils.llm_router import llm_router
+from utils.metrics import (
+    METRICS_ENABLED, MetricsMiddleware, instrument_sqlalchemy_pools, instrument_threadpool, instrument_logging,
+    render_metrics
+)
 
 # 0. 初始化日志系统 (最优先执行)
 setup_logging()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 多 worker 模式 (gunicorn.conf.py) 下检查共享状态后端，Redis 不可用时拒绝启动
+    check_shared_state()
+    # 线程池占用指标 (需要在事件循环中取 AnyIO 默认线程池)
+    if METRICS_ENABLED:
+        instrument_threadpool()
+    # 后台物理删除线程 (报告/合并报告/上传文件删除时只登记墓碑，目录树由该线程删除；启动时恢复未完成的墓碑)
+    start_reaper()
+    # 模型多副本健康检查线程 (配置了 LLM_ROUTER_POOLS 时启动，见 utils/llm_router.py)
+    llm_router.start_health_checks()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # 配置 CORS 中间件
 app.add_middleware(
@@ -53,6 +74,16 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有请求头
 )
 
+# 指标采集 (Prometheus 文本格式，GET /metrics)
+if METRICS_ENABLED:
+    instrument_sqlalchemy_pools()
+    instrument_logging()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # 全局请求体验证错误处理
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -1,9 +1,9 @@
 import logging
 from fastapi import APIRouter, Depends, Query
-from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from routers.dependencies import require_user
+from utils.sse import sse_response
 
 # 引入核心函数
 from utils.zzp.ai_generate_langchain import Chat_generator_stream
@@ -18,16 +18,6 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# ==========================================
-# 通用响应头
-# ==========================================
-STREAM_HEADERS = {
-    "Cache-Control": "no-cache",
-    "Connection": "keep-alive",
-    "Content-Type": "text/event-stream",
-    "X-Accel-Buffering": "no"
-}
-
 # ==========================================
 # 数据模型 (Request Models)
 # ==========================================
@@ -48,6 +38,7 @@ class OptimizeTextRequest(BaseModel):
     id: int                     # 模型ID
     text: str                   
     prompt_ids: List[int]       # 前端选中的 ID 列表
+    regenerate_nonce: Optional[str] = None  # 生成标识：重试带相同值、重新生成换新值 (响应缓存用)
 
 class SummaryRequest(BaseModel):
     task_id: str                
@@ -56,6 +47,7 @@ class SummaryRequest(BaseModel):
     id: int                     
     text: str
     instruction: Optional[str] = None
+    regenerate_nonce: Optional[str] = None  # 生成标识：重试带相同值、重新生成换新值 (响应缓存用)
 
 # ==========================================
 # 1. 提示词管理接口 (新增)
@@ -98,16 +90,15 @@ async def Optimize_Text_Stream_endpoint(request: OptimizeTextRequest, current_us
     logger.info(f'✨ [润色] 接收任务: {request.task_id} | 真实用户: {current_user.username} (强制使用用户7的权限)')
     logger.info(f'    原文长度: {len(request.text)}, Prompt IDs: {request.prompt_ids}')
 
-    return StreamingResponse(
+    return sse_response(
         optimize_text_stream(
             text=request.text,
             prompt_ids=request.prompt_ids,
             model_id=request.id,
             task_id=request.task_id,
-            user_id=user_id
-        ),
-        media_type="text/event-stream",
-        headers=STREAM_HEADERS
+            user_id=user_id,
+            regenerate_nonce=request.regenerate_nonce,
+        )
     )
 
 @router.post("/Generate_Summary_Stream/")
@@ -116,7 +107,7 @@ async def Generate_Summary_Stream_endpoint(request: GenerateSummaryRequest, curr
     【写作生成】流式接口
     """
     user_id = current_user.id
-    return StreamingResponse(
+    return sse_response(
         Chat_generator_stream(
             folder_name=request.folder_name,
             material_name_list=request.material_name_list,
@@ -124,9 +115,7 @@ async def Generate_Summary_Stream_endpoint(request: GenerateSummaryRequest, curr
             model_id=request.id,    
             task_id=request.task_id,
             user_id=user_id
-        ),
-        media_type="text/event-stream",
-        headers=STREAM_HEADERS
+        )
     )
 
 @router.post("/ai_summary/stream")
@@ -134,11 +123,7 @@ async def api_summary(req: SummaryRequest, current_user: dict = Depends(require_
     """
     【文本总结】流式接口
     """
-    return StreamingResponse(
-        ai_summary_stream(req.text, req.id, req.instruction, current_user.id),
-        media_type="text/event-stream",
-        headers=STREAM_HEADERS
-    )
+    return sse_response(ai_summary_stream(req.text, req.id, req.instruction, current_user.id, req.regenerate_nonce))
 
 # ==========================================
 # 3. 系统检查
@@ -3,24 +3,17 @@ import json
 import time
 import traceback
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 
 # 核心逻辑文件
 from utils.lyf.ai_search import Search_Chat_Generator_Stream
 from utils.zzp.ai_generate_langchain import get_llm_config_by_id
+from utils.sse import event, sse_response, DONE
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-STREAM_HEADERS = {
-    "Cache-Control": "no-cache",
-    "Connection": "keep-alive",
-    "Content-Type": "text/event-stream",
-    "X-Accel-Buffering": "no" 
-}
-
 class SearchRequest(BaseModel):
     task_id: str
     user_query: str
@@ -54,9 +47,9 @@ async def ai_search_endpoint(req: SearchRequest):
             # 直接返回错误流，避免后续连接超时
             async def error_generator():
                 msg = f"❌ 配置错误: 数据库中未找到 ID={req.id} 的模型配置，请检查前端选择或数据库记录。"
-                yield f"data: {json.dumps({'content': msg}, ensure_ascii=False)}\n\n"
-                yield "data: [DONE]\n\n"
-            return StreamingResponse(error_generator(), media_type="text/event-stream")
+                yield event({'content': msg})
+                yield DONE
+            return sse_response(error_generator())
 
     # 1. 记录请求进入的详细元数据
     start_time = time.time()
@@ -82,7 +75,8 @@ async def ai_search_endpoint(req: SearchRequest):
                 model_name=model_name,
                 base_url=base_url,
                 api_key=api_key,
-                task_id=req.task_id
+                task_id=req.task_id,
+                user_id=req.agentUserId
             ):
                 yield chunk
                 chunk_count += 1
@@ -99,15 +93,10 @@ async def ai_search_endpoint(req: SearchRequest):
             
             # 向前端推送一个符合 SSE 格式的错误消息
             # 改为 content 字段，确保前端能显示
-            error_payload = json.dumps({"content": f"\n\n❌ [系统错误] 接口处理中断: {str(e)}", "task_id": req.task_id}, ensure_ascii=False)
-            yield f"data: {error_payload}\n\n"
+            yield event({"content": f"\n\n❌ [系统错误] 接口处理中断: {str(e)}", "task_id": req.task_id})
 
     try:
-        return StreamingResponse(
-            wrapped_generator(),
-            media_type="text/event-stream",
-            headers=STREAM_HEADERS
-        )
+        return sse_response(wrapped_generator())
     except Exception as e:
         # 这里捕获的是初始化 StreamingResponse 之前的错误
         logger.error(f"🚨 [AI Search] 接口启动失败 | TaskID: {req.task_id} | Error: {str(e)}")
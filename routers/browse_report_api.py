@@ -9,6 +9,7 @@ from routers.dependencies import require_user, CurrentUser
 from natsort import natsorted  # ✅ 新增：用于文件名自然排序 (1.2 在 1.10 前面)
 from utils.zzp.create_catalogue import safe_path_component
 from utils.zzp import sql_config as config
+from utils.zzp.report_path_index import lookup_report_path, SOURCE_REPORT, SOURCE_MERGE
 
 # 添加父目录到 sys.path 以导入 server_config
 import sys
@@ -60,6 +61,119 @@ class BrowseReport(BaseModel):
     report_name: str
     source_type: Optional[str] = None  # 新增字段: draft 或 merge
 
+def candidate_report_names(report, user_id):
+    """报告目录名候选列表，优先级: storage_dir > safe_name (归一化) > report_name (原始)"""
+    # [NEW] 1. 尝试从数据库获取 storage_dir (物理路径)
+    storage_dir_name = resolve_storage_dir(report.type_name, report.report_name, user_id)
+    
+    # [NEW] 2. 准备候选目录名列表
+    # 优先级: storage_dir > safe_name (归一化) > report_name (原始)
+    candidate_names = []
+    if storage_dir_name:
+        candidate_names.append(storage_dir_name)
+    
+    safe_name = safe_path_component(report.report_name)
+    if safe_name not in candidate_names:
+        candidate_names.append(safe_name)
+        
+    if report.report_name not in candidate_names:
+        candidate_names.append(report.report_name)
+    return candidate_names
+
+
+def probe_report_path(report, user_id):
+    """
+    旧的路径探测逻辑：storage_dir / 归一化名称 / 原始名称 × 用户私有 / 公共目录逐个尝试。
+    仅在路径索引未命中时使用。
+    :return: (found_path, candidate_names)
+    """
+    user_base_dir = server_config.get_user_report_dir(user_id)
+    user_merge_dir = server_config.get_user_merge_dir(user_id)
+    public_base_dir = server_config.get_user_report_dir(None)
+    public_merge_dir = server_config.get_user_merge_dir(None)
+
+    found_path = None
+    candidate_names = candidate_report_names(report, user_id)
+    logger.info(f"路径查找候选列表: {candidate_names}")
+
+    # 新增分支处理逻辑
+    if report.source_type == 'merge':
+        # 分支 1: 只在 MERGE_DIR 查找 .docx 文件
+        # 注意: merge 文件的文件名通常就是 report_name.docx，不涉及文件夹名 (除非是 type 文件夹)
+        # 但这里我们主要关注的是 merge 后的文件是否存在
+        
+        roots = [user_merge_dir, public_merge_dir]
+        
+        # 对于 merge 文件，文件名本身可能也需要尝试归一化?
+        # 通常 merge 文件名直接使用 report_name.docx (create_catalogue.py 生成时似乎没有归一化文件名，只归一化了目录)
+        # 但为了保险，我们可以对文件名也做候选检查
+        
+        file_candidates = []
+        for c in candidate_names:
+            if not c.lower().endswith('.docx'):
+                file_candidates.append(c + '.docx')
+            else:
+                file_candidates.append(c)
+        
+        logger.info(f"source_type='merge'，在 MERGE_DIR 查找文件: {file_candidates}")
+        
+        for root in roots:
+            if not root: continue
+            for fname in file_candidates:
+                p = os.path.join(root, report.type_name, fname)
+                if os.path.exists(p) and os.path.isfile(p):
+                    found_path = p
+                    logger.info(f"✅ [merge] 精确匹配到文件: {found_path}")
+                    break
+            if found_path: break
+                
+    elif report.source_type == 'draft':
+        # 分支 2: 只在 REPORT_DIR 查找目录
+        roots = [user_base_dir, public_base_dir]
+        logger.info(f"source_type='draft'，在 REPORT_DIR 查找目录, 候选: {candidate_names}")
+        
+        for root in roots:
+            if not root: continue
+            for dname in candidate_names:
+                p = os.path.join(root, report.type_name, dname)
+                if os.path.exists(p) and os.path.isdir(p):
+                    found_path = p
+                    logger.info(f"✅ [draft] 精确匹配到目录: {found_path}")
+                    break
+            if found_path: break
+    
+    else:
+        # 兼容旧逻辑：原有的自动查找逻辑
+        # 混合查找文件和目录
+        logger.info(f"未指定 source_type，使用兼容模式查找")
+        
+        # 候选路径生成 (Type/Name)
+        for dname in candidate_names:
+            # 假设是目录
+            roots_dir = [user_base_dir, public_base_dir]
+            for root in roots_dir:
+                if not root: continue
+                p = os.path.join(root, report.type_name, dname)
+                if os.path.exists(p) and os.path.isdir(p):
+                    found_path = p
+                    logger.info(f"✅ [legacy] 找到目录: {found_path}")
+                    break
+            if found_path: break
+            
+            # 假设是文件
+            fname = dname + '.docx' if not dname.lower().endswith('.docx') else dname
+            roots_file = [user_merge_dir, public_merge_dir]
+            for root in roots_file:
+                if not root: continue
+                p = os.path.join(root, report.type_name, fname)
+                if os.path.exists(p) and os.path.isfile(p):
+                    found_path = p
+                    logger.info(f"✅ [legacy] 找到文件: {found_path}")
+                    break
+            if found_path: break
+
+    return found_path, candidate_names
+
 @router.post("/Browse_Report/")
 def Browse_Report_endpoint(report: BrowseReport, current_user: CurrentUser = Depends(require_user)):
     logger.info(f'接收到的参数：{report}')
@@ -69,111 +183,31 @@ def Browse_Report_endpoint(report: BrowseReport, current_user: CurrentUser = Dep
     # 获取用户专属目录和公共目录
     user_base_dir = server_config.get_user_report_dir(user_id)
     user_merge_dir = server_config.get_user_merge_dir(user_id)
-    public_base_dir = server_config.get_user_report_dir(None) # same as server_config.REPORT_DIR
-    public_merge_dir = server_config.get_user_merge_dir(None) # same as server_config.MERGE_DIR
 
     try:
-        found_path = None
-        
-        # [NEW] 1. 尝试从数据库获取 storage_dir (物理路径)
-        storage_dir_name = resolve_storage_dir(report.type_name, report.report_name, user_id)
-        
-        # [NEW] 2. 准备候选目录名列表
-        # 优先级: storage_dir > safe_name (归一化) > report_name (原始)
-        candidate_names = []
-        if storage_dir_name:
-            candidate_names.append(storage_dir_name)
-        
-        safe_name = safe_path_component(report.report_name)
-        if safe_name not in candidate_names:
-            candidate_names.append(safe_name)
-            
-        if report.report_name not in candidate_names:
-            candidate_names.append(report.report_name)
-            
-        logger.info(f"路径查找候选列表: {candidate_names}")
-
-        # 新增分支处理逻辑
+        # [Optimization] 1. 优先读取路径索引 (内存缓存 -> report_path_index 表，多个类型一次查询)，命中时不再探测文件系统
         if report.source_type == 'merge':
-            # 分支 1: 只在 MERGE_DIR 查找 .docx 文件
-            # 注意: merge 文件的文件名通常就是 report_name.docx，不涉及文件夹名 (除非是 type 文件夹)
-            # 但这里我们主要关注的是 merge 后的文件是否存在
-            
-            roots = [user_merge_dir, public_merge_dir]
-            
-            # 对于 merge 文件，文件名本身可能也需要尝试归一化?
-            # 通常 merge 文件名直接使用 report_name.docx (create_catalogue.py 生成时似乎没有归一化文件名，只归一化了目录)
-            # 但为了保险，我们可以对文件名也做候选检查
-            
-            file_candidates = []
-            for c in candidate_names:
-                if not c.lower().endswith('.docx'):
-                    file_candidates.append(c + '.docx')
-                else:
-                    file_candidates.append(c)
-            
-            logger.info(f"source_type='merge'，在 MERGE_DIR 查找文件: {file_candidates}")
-            
-            for root in roots:
-                if not root: continue
-                for fname in file_candidates:
-                    p = os.path.join(root, report.type_name, fname)
-                    if os.path.exists(p) and os.path.isfile(p):
-                        found_path = p
-                        logger.info(f"✅ [merge] 精确匹配到文件: {found_path}")
-                        break
-                if found_path: break
-                    
+            source_types = (SOURCE_MERGE,)
         elif report.source_type == 'draft':
-            # 分支 2: 只在 REPORT_DIR 查找目录
-            roots = [user_base_dir, public_base_dir]
-            logger.info(f"source_type='draft'，在 REPORT_DIR 查找目录, 候选: {candidate_names}")
-            
-            for root in roots:
-                if not root: continue
-                for dname in candidate_names:
-                    p = os.path.join(root, report.type_name, dname)
-                    if os.path.exists(p) and os.path.isdir(p):
-                        found_path = p
-                        logger.info(f"✅ [draft] 精确匹配到目录: {found_path}")
-                        break
-                if found_path: break
-        
+            source_types = (SOURCE_REPORT,)
         else:
-            # 兼容旧逻辑：原有的自动查找逻辑
-            # 混合查找文件和目录
-            logger.info(f"未指定 source_type，使用兼容模式查找")
-            
-            # 候选路径生成 (Type/Name)
-            for dname in candidate_names:
-                # 假设是目录
-                roots_dir = [user_base_dir, public_base_dir]
-                for root in roots_dir:
-                    if not root: continue
-                    p = os.path.join(root, report.type_name, dname)
-                    if os.path.exists(p) and os.path.isdir(p):
-                        found_path = p
-                        logger.info(f"✅ [legacy] 找到目录: {found_path}")
-                        break
-                if found_path: break
-                
-                # 假设是文件
-                fname = dname + '.docx' if not dname.lower().endswith('.docx') else dname
-                roots_file = [user_merge_dir, public_merge_dir]
-                for root in roots_file:
-                    if not root: continue
-                    p = os.path.join(root, report.type_name, fname)
-                    if os.path.exists(p) and os.path.isfile(p):
-                        found_path = p
-                        logger.info(f"✅ [legacy] 找到文件: {found_path}")
-                        break
-                if found_path: break
+            source_types = (SOURCE_REPORT, SOURCE_MERGE)
+
+        # 2. 索引未命中 (历史数据未回填) 时退回到旧的路径探测，探测结果 (包括未找到) 同样进入缓存
+        probed = {}
+
+        def resolve():
+            path, probed["candidates"] = probe_report_path(report, user_id)
+            return path
+
+        found_path = lookup_report_path(user_id, source_types, report.type_name, report.report_name, resolver=resolve)
         
         if found_path:
+            logger.info(f"✅ [index] 报告路径: {found_path}")
             full_report_path = found_path
         else:
             # 如果都没找到，保持回落逻辑 (优先使用 storage_dir 或 safe_name)
-            fallback_name = candidate_names[0]
+            fallback_name = (probed.get("candidates") or candidate_report_names(report, user_id))[0]
             if report.report_name.lower().endswith('.docx'):
                  full_report_path = os.path.join(user_merge_dir, report.type_name, fallback_name)
             else:
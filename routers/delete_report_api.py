@@ -6,6 +6,7 @@ from typing import List
 
 # 引入之前写好的核心删除函数
 from utils.zzp.delete_report import delete_report_task
+from utils.deletion_reaper import get_tombstones
 
 # ==========================
 # 日志配置
@@ -119,6 +120,19 @@ def delete_report_batch_endpoint(request: DeleteReportRequest, current_user: Cur
         }
 
 
+# ==========================
+# 3. 后台物理删除进度
+# ==========================
+@router.get("/delete_report_progress/")
+def delete_report_progress_endpoint(current_user: CurrentUser = Depends(require_user)):
+    """
+    当前用户最近的删除任务进度。
+    删除接口提交数据库删除后即返回，目录和文件由后台回收线程物理删除 (utils/deletion_reaper.py)，
+    status: pending (排队) / running (删除中) / done (完成) / failed (多次重试失败)
+    """
+    return {"code": 200, "message": "success", "data": get_tombstones(current_user.id)}
+
+
 # ==========================
 # 健康检查
 # ==========================
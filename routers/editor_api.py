@@ -15,6 +15,8 @@ from utils.zzp.image_cleaner import clean_orphaned_images
 from utils.zzp.docx_to_html import convert_docx_to_html
 from utils.zzp.create_catalogue import safe_path_component
 from utils.zzp import sql_config as config
+from utils.zzp.report_path_index import lookup_report_path, SOURCE_REPORT, SOURCE_MERGE
+from utils.blob_store import write_text
 
 # 添加父目录到 sys.path 以导入 server_config
 import sys
@@ -61,6 +63,8 @@ def get_file_path(type_name, report_name, file_name, source_type="report", user_
     1. 严格遵循 user_path_refactor_plan.md 的路径隔离定义。
     2. [UPDATE] 引入 storage_dir (数据库字段) 和 safe_path_component (归一化) 的多重查找策略
        优先查库获取 storage_dir，其次尝试归一化路径，最后尝试原始路径。
+    3. [Optimization] 优先读取路径索引 (内存缓存 -> report_path_index 表)，
+       命中时直接返回规范路径，未命中才执行上述探测逻辑。
     """
     user_merge_dir = server_config.get_user_merge_dir(user_id)
     user_report_dir = server_config.get_user_report_dir(user_id)
@@ -72,6 +76,10 @@ def get_file_path(type_name, report_name, file_name, source_type="report", user_
     expected_merged_filename = f"{report_name}.docx"
     
     if source_type == "merge" and file_name == expected_merged_filename:
+        indexed_path = lookup_report_path(user_id, SOURCE_MERGE, type_name, report_name)
+        if indexed_path:
+            return indexed_path
+
         # 查找顺序：用户私有 -> 公共兜底
         # 路径结构：.../report_merge/{uid}/{Type}/{Name}.docx (扁平结构，通常不涉及文件夹重命名问题)
         paths = [
@@ -85,7 +93,11 @@ def get_file_path(type_name, report_name, file_name, source_type="report", user_
         return paths[0]
 
     # 2. 尝试定位 Report 资源 (源文件)
-    # 涉及文件夹名称可能被归一化的问题
+    indexed_dir = lookup_report_path(user_id, SOURCE_REPORT, type_name, report_name)
+    if indexed_dir:
+        return os.path.join(indexed_dir, file_name)
+
+    # 索引未命中：涉及文件夹名称可能被归一化的问题，逐个探测
     
     def resolve_candidates(t_name, r_name, uid):
         """
@@ -355,8 +367,7 @@ def Save_Content_endpoint(req: SaveContentRequest, current_user: CurrentUser = D
         
         # 覆盖写入 HTML
         try:
-            with open(html_path, "w", encoding="utf-8") as f:
-                f.write(req.html_content)
+            write_text(html_path, req.html_content)
             logger.info(f"✅ HTML 内容已更新: {html_path}")
             
             # 2. 执行转换并覆盖
@@ -3,12 +3,17 @@ import os
 import shutil
 import uuid
 import zipfile
-import threading
 import json
+import time
 from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, Depends, HTTPException, status
 from utils.zzp.import_doc_to_db import process_document, scan_docx_structure
 from routers.dependencies import require_user, CurrentUser
-from utils.redis_client import get_redis_client
+from utils.redis_client import get_redis_client, get_async_redis_client
+from utils.stage_profiler import StageProfiler
+from utils.shared_state import redis_state_enabled, get_semaphore
+from utils.metrics import (
+    IMPORT_TASKS_QUEUED, IMPORT_TASKS_RUNNING, IMPORT_TASK_SLOTS, IMPORT_TASKS, IMPORT_QUEUE_WAIT
+)
 
 # 配置日志
 logging.basicConfig(level=logging.INFO,
@@ -21,13 +26,17 @@ class TaskStatusManager:
     """
     Manages task status persistence, switching between Redis and Memory based on configuration.
     Handles JSON serialization for complex fields.
+    同步方法供后台线程和同步接口使用；async 接口请使用 aset_initial，避免阻塞事件循环。
     """
+    JSON_FIELDS = ('structure', 'result', 'stages')
+    INT_FIELDS = ('progress', 'owner_user_id')
+
     def __init__(self):
         self.memory_store = {}
         self.redis_prefix = os.getenv("REDIS_PREFIX", "langextract")
         # Check specific feature flag first, then general enabled flag
-        self.redis_enabled = (os.getenv("REDIS_TASK_STATUS_ENABLED", "0") == "1") and \
-                             (os.getenv("REDIS_ENABLED", "0") == "1")
+        # 多 worker 模式 (MULTI_WORKER=1) 下强制使用 Redis，否则轮询请求落到其他 worker 时查不到任务
+        self.redis_enabled = redis_state_enabled("REDIS_TASK_STATUS_ENABLED")
         self.ttl = 24 * 60 * 60  # 24 hours
         self.env = os.getenv("ENV", "dev")
         
@@ -48,11 +57,50 @@ class TaskStatusManager:
             logger.error(f"Failed to get Redis client: {e}")
         return None
 
-    def update(self, task_id, data, user_id):
+    @staticmethod
+    def _serialize(data):
+        """Prepare data for HSET (serialize complex types, skip None)"""
+        processed_data = {}
+        for k, v in data.items():
+            if isinstance(v, (dict, list)):
+                processed_data[k] = json.dumps(v, ensure_ascii=False)
+            elif v is not None:
+                processed_data[k] = str(v)
+        return processed_data
+
+    def _deserialize(self, data):
+        result = {}
+        for k, v in data.items():
+            if k in self.JSON_FIELDS:
+                try:
+                    result[k] = json.loads(v)
+                except:
+                    result[k] = v
+            elif k in self.INT_FIELDS:
+                try:
+                    result[k] = int(v)
+                except:
+                    result[k] = v
+            else:
+                result[k] = v
+        return result
+
+    def _update_memory(self, task_id, data, user_id):
+        if task_id not in self.memory_store:
+             self.memory_store[task_id] = {}
+        
+        # Ensure owner_user_id is set in memory for consistency
+        if "owner_user_id" not in self.memory_store[task_id] and user_id:
+            self.memory_store[task_id]["owner_user_id"] = user_id
+            
+        self.memory_store[task_id].update(data)
+
+    def update(self, task_id, data, user_id, reset=False):
         """
         Update task status.
         data: dict containing fields to update.
         user_id: required for key generation in Redis mode.
+        reset: clear previous fields first (DEL + HSET + EXPIRE in one pipeline round trip)
         """
         # 1. Try Redis if enabled
         if self.redis_enabled:
@@ -60,19 +108,14 @@ class TaskStatusManager:
             if client:
                 try:
                     key = self._get_key(user_id, task_id)
-                    # Prepare data for HSET (serialize complex types)
-                    processed_data = {}
-                    for k, v in data.items():
-                        if isinstance(v, (dict, list)):
-                            processed_data[k] = json.dumps(v, ensure_ascii=False)
-                        elif v is None:
-                            pass # Skip None
-                        else:
-                            processed_data[k] = str(v)
-                    
+                    processed_data = self._serialize(data)
+                    pipe = client.pipeline(transaction=False)
+                    if reset:
+                        pipe.delete(key)
                     if processed_data:
-                        client.hset(key, mapping=processed_data)
-                        client.expire(key, self.ttl)
+                        pipe.hset(key, mapping=processed_data)
+                        pipe.expire(key, self.ttl)
+                    pipe.execute()
                     return
                 except Exception as e:
                     logger.error(f"Redis update failed for task {task_id}: {e}")
@@ -82,14 +125,9 @@ class TaskStatusManager:
                     # For now, let's just log error to avoid blocking the process.
 
         # 2. Memory Fallback (or Primary if Redis disabled)
-        if task_id not in self.memory_store:
-             self.memory_store[task_id] = {}
-        
-        # Ensure owner_user_id is set in memory for consistency
-        if "owner_user_id" not in self.memory_store[task_id] and user_id:
-            self.memory_store[task_id]["owner_user_id"] = user_id
-            
-        self.memory_store[task_id].update(data)
+        if reset:
+            self.memory_store.pop(task_id, None)
+        self._update_memory(task_id, data, user_id)
 
     def get(self, task_id, user_id):
         """
@@ -101,27 +139,8 @@ class TaskStatusManager:
             client = self._get_redis()
             if client:
                 try:
-                    key = self._get_key(user_id, task_id)
-                    data = client.hgetall(key)
-                    if data:
-                        # Deserialize
-                        result = {}
-                        for k, v in data.items():
-                            if k in ['structure', 'result']: # Fields known to be JSON
-                                try:
-                                    result[k] = json.loads(v)
-                                except:
-                                    result[k] = v
-                            elif k in ['progress', 'owner_user_id']:
-                                try:
-                                    result[k] = int(v)
-                                except:
-                                    result[k] = v
-                            else:
-                                result[k] = v
-                        return result
-                    else:
-                        return None # Not found
+                    data = client.hgetall(self._get_key(user_id, task_id))
+                    return self._deserialize(data) if data else None # Not found
                 except Exception as e:
                     logger.error(f"Redis get failed for task {task_id}: {e}")
         
@@ -130,19 +149,26 @@ class TaskStatusManager:
 
     def set_initial(self, task_id, data, user_id):
         """Initialize task data (clears previous if any)"""
+        self.update(task_id, data, user_id, reset=True)
+
+    async def aset_initial(self, task_id, data, user_id):
+        """set_initial 的 asyncio 版本，供 async 接口调用"""
         if self.redis_enabled:
-            client = self._get_redis()
+            client = get_async_redis_client()
             if client:
                 try:
                     key = self._get_key(user_id, task_id)
-                    client.delete(key) # Clear old
-                except:
-                    pass
-        
-        if task_id in self.memory_store:
-            del self.memory_store[task_id]
-            
-        self.update(task_id, data, user_id)
+                    pipe = client.pipeline(transaction=False)
+                    pipe.delete(key)
+                    pipe.hset(key, mapping=self._serialize(data))
+                    pipe.expire(key, self.ttl)
+                    await pipe.execute()
+                    return
+                except Exception as e:
+                    logger.error(f"Redis update failed for task {task_id}: {e}")
+
+        self.memory_store.pop(task_id, None)
+        self._update_memory(task_id, data, user_id)
 
 # Initialize Manager
 task_manager = TaskStatusManager()
@@ -151,12 +177,17 @@ task_manager = TaskStatusManager()
 # 服务器配置：251GB 内存，80 核 CPU。
 # 即使配置很高，为了防止极端并发导致 OOM，设置一个安全上限。
 # 假设每个大文件处理消耗 2-4GB 内存，20 个并发约占用 40-80GB，非常安全。
+# 上限针对整台服务器：多 worker 模式下由 Redis 信号量在所有 worker 间共享
 MAX_CONCURRENT_TASKS = 20
-task_semaphore = threading.Semaphore(MAX_CONCURRENT_TASKS)
+task_semaphore = get_semaphore("import_tasks", MAX_CONCURRENT_TASKS)
+IMPORT_TASK_SLOTS.set(MAX_CONCURRENT_TASKS)
 
 def background_process_wrapper(task_id: str, type_name: str, report_name: str, file_path: str, user_id: int):
     """后台任务包装器，用于更新任务状态并执行处理"""
     acquired = False
+    final_status = "error"
+    # 各阶段耗时/CPU/内存：每个阶段结束时计入 /metrics，并随任务状态返回给 /check_import_status
+    profiler = StageProfiler(on_update=lambda stages: task_manager.update(task_id, {"stages": stages}, user_id))
     
     # 定义进度回调函数
     def update_progress(percent: int, msg: str):
@@ -175,8 +206,15 @@ def background_process_wrapper(task_id: str, type_name: str, report_name: str, f
             "progress": 5
         }, user_id)
         
-        task_semaphore.acquire()
+        IMPORT_TASKS_QUEUED.inc()
+        wait_start = time.perf_counter()
+        try:
+            lease = task_semaphore.acquire()
+        finally:
+            IMPORT_TASKS_QUEUED.dec()
         acquired = True
+        IMPORT_TASKS_RUNNING.inc()
+        IMPORT_QUEUE_WAIT.observe(time.perf_counter() - wait_start)
         
         logger.info(f"▶️ [任务开始] ID: {task_id} 获取到执行槽位")
         task_manager.update(task_id, {
@@ -188,7 +226,8 @@ def background_process_wrapper(task_id: str, type_name: str, report_name: str, f
         # 1. 后台扫描文档结构 (优化响应速度)
         try:
             logger.info(f"📑 [后台任务] ID: {task_id} 开始扫描文档结构...")
-            doc_structure = scan_docx_structure(file_path)
+            with profiler.stage("scan_structure"):
+                doc_structure = scan_docx_structure(file_path)
             # 更新状态中的结构信息，供前端轮询获取
             task_manager.update(task_id, {
                 "structure": doc_structure,
@@ -199,8 +238,10 @@ def background_process_wrapper(task_id: str, type_name: str, report_name: str, f
             logger.warning(f"⚠️ [后台任务] ID: {task_id} 结构扫描失败: {e}")
         
         # 调用核心处理逻辑，传入回调和 user_id
-        is_success, result_msg = process_document(type_name, report_name, file_path, progress_callback=update_progress, user_id=user_id)
+        is_success, result_msg = process_document(type_name, report_name, file_path, progress_callback=update_progress,
+                                                  user_id=user_id, profiler=profiler)
         
+        final_status = "success" if is_success else "failed"
         if is_success:
             task_manager.update(task_id, {
                 "status": "success", 
@@ -245,8 +286,14 @@ def background_process_wrapper(task_id: str, type_name: str, report_name: str, f
             "error_code": error_code
         }, user_id)
     finally:
+        IMPORT_TASKS.inc(status=final_status)
+        stages = profiler.snapshot()
+        if stages:
+            task_manager.update(task_id, {"stages": stages}, user_id)
+            logger.info(f"⏱️ [阶段耗时] ID: {task_id} {profiler.summary()}")
         if acquired:
-            task_semaphore.release()
+            IMPORT_TASKS_RUNNING.dec()
+            task_semaphore.release(lease)
             logger.info(f"⏹️ [任务释放] ID: {task_id} 释放执行槽位")
             
         # 清理临时文件
@@ -378,7 +425,7 @@ async def Import_Doc_endpoint(  # 改为async
             }
 
         # 9. 初始化任务状态 (记录 owner_user_id)
-        task_manager.set_initial(task_id, {
+        await task_manager.aset_initial(task_id, {
             "status": "pending",
             "message": "已进入处理队列",
             "progress": 0,
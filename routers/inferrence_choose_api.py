@@ -19,6 +19,7 @@ from utils.lyf.add_folder import add_folder
 from utils.lyf.add_file import add_file
 from utils.lyf.query_prompts import get_prompts_by_folder_name
 from utils.lyf.del_file import del_file
+from utils.blob_store import adopt_file, atomic_write
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -266,9 +267,11 @@ async def upload_file_endpoint(
             logger.warning(f"自动创建文件夹记录失败 (非致命): {db_err}")
         # -------------------------------------------------------
         
-        # 保存文件
-        with open(file_path, "wb") as buffer:
+        # 保存文件 (同名文件可能已与 blob 共享 inode，不能原地覆盖)
+        with atomic_write(file_path) as tmp_path, open(tmp_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
+        # 重复上传的相同内容只保留一份 (硬链接到 blob 存储)
+        adopt_file(file_path)
         
         logger.info(f"文件上传成功: {file_path}")
         return {
@@ -1,10 +1,10 @@
 import logging
-import json
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from routers.dependencies import require_user
 from utils.lyf.prompt_chat import PromptChat
+from utils.llm_admission import QueueUpdate
+from utils.sse import TokenBuffer, event, sse_response, DONE
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -14,13 +14,6 @@ router = APIRouter()
 class ChatRequest(BaseModel):
     query: str
 
-STREAM_HEADERS = {
-    "Cache-Control": "no-cache",
-    "Connection": "keep-alive",
-    "Content-Type": "text/event-stream",
-    "X-Accel-Buffering": "no",  # 禁用 Nginx 缓冲
-}
-
 # 伪造一个 require_user 用于测试（如果需要的话），或者直接用真实的
 # 这里我们假设 dependencies.py 里的 require_user 是可用的
 # 但为了防止循环依赖或其他问题，我们先确认 import 是否正确
@@ -65,17 +58,29 @@ def chat_stream_endpoint(request: ChatRequest, current_user: dict = Depends(requ
 
         def event_generator():
             chat_service = PromptChat()
+            buffer = TokenBuffer()
             try:
                 for content in chat_service.chat_stream(user_id, request.query):
-                    payload = json.dumps({"content": content}, ensure_ascii=False)
-                    yield f"data: {payload}\n\n"
-                
-                yield "data: [DONE]\n\n"
+                    if isinstance(content, QueueUpdate):
+                        yield content.sse()
+                        continue
+                    frame = buffer.push(content)
+                    if frame:
+                        yield frame
+                frame = buffer.flush()
+                if frame:
+                    yield frame
+
+                yield DONE
             except Exception as e:
                 logger.error(f"Stream generation error: {e}", exc_info=True)
-                yield f"data: {json.dumps({'content': f'[Error: {str(e)}]'}, ensure_ascii=False)}\n\n"
+                frame = buffer.flush()
+                if frame:
+                    yield frame
+                yield event({'content': f'[Error: {str(e)}]'})
 
-        return StreamingResponse(event_generator(), media_type="text/event-stream", headers=STREAM_HEADERS)
+        # 客户端断开时关闭生成器，中止上游生成并释放准入名额
+        return sse_response(event_generator())
     except Exception as e:
         logger.error(f"Endpoint error: {e}", exc_info=True)
         return {"error": str(e)}
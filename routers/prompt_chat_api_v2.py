@@ -1,22 +1,15 @@
 import logging
-import json
 from fastapi import APIRouter, Depends, HTTPException, Path, Query
-from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from routers.dependencies import require_user
 from utils.lyf.prompt_chat_async import prompt_chat_service
+from utils.llm_admission import QueueUpdate
+from utils.sse import TokenBuffer, event, sse_response, DONE
 from typing import Any, Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-STREAM_HEADERS = {
-    "Cache-Control": "no-cache",
-    "Connection": "keep-alive",
-    "Content-Type": "text/event-stream",
-    "X-Accel-Buffering": "no"
-}
-
 class ChatRequest(BaseModel):
     query: str
     user_id: Optional[int] = None # 如果 require_user 没给，可以手动传
@@ -77,18 +70,26 @@ async def chat_stream_endpoint(request: ChatRequest, current_user: dict = Depend
         try:
             # 第一帧：发送元数据（包含 session_id），以便前端保存
             if is_new_session:
-                yield f"data: {json.dumps({'meta': {'session_id': session_id, 'is_new': True}}, ensure_ascii=False)}\n\n"
+                yield event({'meta': {'session_id': session_id, 'is_new': True}})
             
-            # 后续帧：发送内容
-            async for chunk in prompt_chat_service.chat_stream(int(session_id), query):
-                # 模仿 SSE 格式包装
-                yield f"data: {json.dumps({'content': chunk}, ensure_ascii=False)}\n\n"
-            yield "data: [DONE]\n\n"
+            # 后续帧：发送内容 (按时间窗口合并 token)
+            buffer = TokenBuffer()
+            async for chunk in prompt_chat_service.chat_stream(int(session_id), query, user_id=user_id):
+                if isinstance(chunk, QueueUpdate):
+                    yield chunk.sse()
+                    continue
+                frame = buffer.push(chunk)
+                if frame:
+                    yield frame
+            frame = buffer.flush()
+            if frame:
+                yield frame
+            yield DONE
         except Exception as e:
             logger.warning(f"[chat_stream_endpoint] Client disconnected or error: {e}")
             # Client disconnected, stream will be closed automatically
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream", headers=STREAM_HEADERS)
+    return sse_response(event_generator())
 
 @router.post("/sessions")
 async def create_session_endpoint(
@@ -134,6 +135,7 @@ async def get_messages_endpoint(
     session_id: int = Path(..., ge=1),
     current_user: dict = Depends(require_user),
     limit: int = Query(200, ge=1, le=500),
+    after_id: Optional[int] = Query(None, ge=1, description="游标：上一页返回的 next_cursor"),
 ) -> Dict[str, Any]:
     user_id = int(current_user.id)
     # 获取会话元数据（包含 final_content）
@@ -141,11 +143,15 @@ async def get_messages_endpoint(
     if not meta:
         raise HTTPException(status_code=404, detail="session 不存在或无权限")
 
-    messages = await prompt_chat_service.get_messages(session_id=session_id, user_id=user_id, limit=limit)
+    messages = await prompt_chat_service.get_messages(
+        session_id=session_id, user_id=user_id, limit=limit, after_id=after_id, meta=meta
+    )
 
     return {
         "session": meta,
-        "messages": messages
+        "messages": messages,
+        # 本页已满时返回下一页游标，否则为 None (已到末尾)
+        "next_cursor": messages[-1]["id"] if len(messages) == limit else None
     }
 
 @router.patch("/sessions/{session_id}")
@@ -257,6 +263,7 @@ async def regenerate_message_endpoint(
         raise HTTPException(status_code=404, detail="session 不存在或无权限")
 
     async def event_generator():
+        buffer = TokenBuffer()
         try:
             async for chunk in prompt_chat_service.regenerate_stream(
                 session_id=int(session_id),
@@ -264,8 +271,16 @@ async def regenerate_message_endpoint(
                 user_message_id=int(message_id),
                 query=query,
             ):
-                yield f"data: {json.dumps({'content': chunk}, ensure_ascii=False)}\n\n"
-            yield "data: [DONE]\n\n"
+                if isinstance(chunk, QueueUpdate):
+                    yield chunk.sse()
+                    continue
+                frame = buffer.push(chunk)
+                if frame:
+                    yield frame
+            frame = buffer.flush()
+            if frame:
+                yield frame
+            yield DONE
         except ValueError as e:
             code = str(e)
             detail = "regenerate_failed"
@@ -277,13 +292,16 @@ async def regenerate_message_endpoint(
                 detail = "empty_query"
             elif code == "session_not_found":
                 detail = "session_not_found"
-            yield f"data: {json.dumps({'content': f'[Error: {detail}]'}, ensure_ascii=False)}\n\n"
-            yield "data: [DONE]\n\n"
+            frame = buffer.flush()
+            if frame:
+                yield frame
+            yield event({'content': f'[Error: {detail}]'})
+            yield DONE
         except Exception as e:
             logger.warning(f"[regenerate_message_endpoint] Client disconnected or error: {e}")
             # Client disconnected, stream will be closed automatically
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream", headers=STREAM_HEADERS)
+    return sse_response(event_generator())
 
 @router.post("/sessions/{session_id}/messages/{message_id}/optimize-inplace/stream")
 async def optimize_inplace_endpoint(
@@ -300,14 +318,20 @@ async def optimize_inplace_endpoint(
         raise HTTPException(status_code=404, detail="session 不存在或无权限")
 
     async def event_generator():
+        buffer = TokenBuffer()
         try:
             async for chunk in prompt_chat_service.optimize_inplace_stream(
                 session_id=int(session_id),
                 user_id=user_id,
                 target_message_id=int(message_id),
             ):
-                yield f"data: {json.dumps({'content': chunk}, ensure_ascii=False)}\n\n"
-            yield "data: [DONE]\n\n"
+                frame = buffer.push(chunk)
+                if frame:
+                    yield frame
+            frame = buffer.flush()
+            if frame:
+                yield frame
+            yield DONE
         except ValueError as e:
             code = str(e)
             detail = "optimize_failed"
@@ -317,9 +341,12 @@ async def optimize_inplace_endpoint(
                 detail = "message_not_assistant"
             elif code == "session_not_found":
                 detail = "session_not_found"
-            yield f"data: {json.dumps({'content': f'[Error: {detail}]'}, ensure_ascii=False)}\n\n"
-            yield "data: [DONE]\n\n"
+            frame = buffer.flush()
+            if frame:
+                yield frame
+            yield event({'content': f'[Error: {detail}]'})
+            yield DONE
         except Exception as e:
             logger.warning(f"[optimize_inplace_endpoint] Client disconnected or error: {e}")
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream", headers=STREAM_HEADERS)
+    return sse_response(event_generator())
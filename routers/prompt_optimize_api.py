@@ -1,23 +1,16 @@
-import json
 import logging
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from routers.dependencies import require_user
 from utils.lyf.prompt_optimize import prompt_optimize_service
+from utils.llm_admission import QueueUpdate
+from utils.sse import TokenBuffer, event, sse_response, DONE
 from utils.lyf.prompt_chat_async import prompt_chat_service
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-STREAM_HEADERS = {
-    "Cache-Control": "no-cache",
-    "Connection": "keep-alive",
-    "Content-Type": "text/event-stream",
-    "X-Accel-Buffering": "no"
-}
-
 class OptimizeRequest(BaseModel):
     raw_prompt: str
     target_scene: str  # 目标场景，如“公文写作”、“代码生成”
@@ -54,12 +47,22 @@ async def optimize_stream_endpoint(request: OptimizeRequest, current_user: dict
             raise HTTPException(status_code=404, detail="session 不存在或无权限")
         logger.info(f"🔄 [Optimize] Resuming session: {session_id} for User: {user_id}")
 
-    async def event_generator():
+    # 同步生成器：由 StreamingResponse 放到线程池迭代，排队等待和模型调用都不阻塞事件循环
+    def event_generator():
         if is_new_session:
-            yield f"data: {json.dumps({'meta': {'session_id': session_id, 'is_new': True}}, ensure_ascii=False)}\n\n"
+            yield event({'meta': {'session_id': session_id, 'is_new': True}})
         
-        for chunk in prompt_optimize_service.optimize_stream(request.raw_prompt, request.target_scene):
-            yield f"data: {json.dumps({'content': chunk}, ensure_ascii=False)}\n\n"
-        yield "data: [DONE]\n\n"
+        buffer = TokenBuffer()
+        for chunk in prompt_optimize_service.optimize_stream(request.raw_prompt, request.target_scene, user_id=user_id):
+            if isinstance(chunk, QueueUpdate):
+                yield chunk.sse()
+                continue
+            frame = buffer.push(chunk)
+            if frame:
+                yield frame
+        frame = buffer.flush()
+        if frame:
+            yield frame
+        yield DONE
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream", headers=STREAM_HEADERS)
+    return sse_response(event_generator())
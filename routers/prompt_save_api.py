@@ -42,10 +42,11 @@ async def save_prompt_from_studio(
         service = PromptSaveService(session)
         
         try:
-            # 有会话模式需要验证会话
+            # 会话元数据与原提示词并发查询 (有会话模式需要验证会话)
+            session_meta, existing_prompt = await service.prefetch_save_context(
+                request.session_id, request.prompt_id, user_id
+            )
             if not is_standalone_mode:
-                logger.info(f"[PromptSave] Getting session meta for session_id={request.session_id}, user_id={user_id}")
-                session_meta = await service.get_session_meta(request.session_id, user_id)
                 if not session_meta:
                     logger.error(f"[PromptSave] Session not found or no permission: session_id={request.session_id}, user_id={user_id}")
                     raise HTTPException(status_code=404, detail="会话不存在或无权限")
@@ -94,7 +95,9 @@ async def save_prompt_from_studio(
                         raise HTTPException(status_code=400, detail="部门不存在")
             
             # 创建或更新提示词
-            prompt_id, is_forked = await service.create_or_update_prompt(current_user, request, content)
+            prompt_id, is_forked = await service.create_or_update_prompt(
+                current_user, request, content, existing=existing_prompt
+            )
             
             # 关联标签
             await service.update_tag_relations(prompt_id, request.tag_ids, user_id)
@@ -2,6 +2,7 @@
 Prompt 服务类
 包含提示词保存、标签管理、用户统计等核心业务逻辑
 """
+import asyncio
 import logging
 import uuid
 from datetime import datetime
@@ -13,9 +14,17 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from routers.dependencies import CurrentUser
 from routers.prompt_models import CreateTagRequest, SavePromptRequest
+from utils.lyf.db_async_config import AsyncSessionLocal
+from utils.lyf.chat_session_stats import recount
 
 logger = logging.getLogger(__name__)
 
+# create_or_update_prompt 的 existing 参数未传入时的占位值 (None 表示"已查询，不存在或无权限")
+_NOT_LOADED = object()
+
+# "表.列" -> 是否存在。表结构在进程生命周期内不变，进程内共享 (原来每个 service 实例各查一次 INFORMATION_SCHEMA)
+_column_cache: Dict[str, bool] = {}
+
 
 def format_time_ago(dt) -> str:
     """格式化时间为'xx前'格式"""
@@ -54,11 +63,10 @@ class PromptSaveService:
     
     def __init__(self, session: AsyncSession):
         self.session = session
-        self._column_cache: Dict[str, bool] = {}
 
     async def _column_exists(self, table_name: str, column_name: str) -> bool:
         key = f"{table_name}.{column_name}"
-        cached = self._column_cache.get(key)
+        cached = _column_cache.get(key)
         if cached is not None:
             return cached
         try:
@@ -75,10 +83,10 @@ class PromptSaveService:
                 {"t": table_name, "c": column_name},
             )
             exists = (res.scalar() or 0) > 0
-            self._column_cache[key] = exists
+            _column_cache[key] = exists
             return exists
         except Exception:
-            self._column_cache[key] = False
+            # 查询失败不缓存，下次重试
             return False
     
     async def get_session_meta(self, session_id: int, user_id: int) -> Optional[Dict[str, Any]]:
@@ -115,6 +123,31 @@ class PromptSaveService:
             raise HTTPException(status_code=400, detail="只能保存AI回复消息")
         return row["content"]
     
+    async def _read(self, method: str, *args):
+        """在独立会话 (独立连接) 中执行只读查询，可以与其他查询并发"""
+        async with AsyncSessionLocal() as session:
+            return await getattr(PromptSaveService(session), method)(*args)
+
+    async def prefetch_save_context(
+        self, session_id: Optional[int], prompt_id: Optional[int], user_id: int
+    ):
+        """
+        并发获取保存所需的会话元数据和原提示词。
+        同一个 AsyncSession 不能并发执行查询，两次查询各自使用独立连接；只需要其中一项时直接用当前会话。
+        :return: (session_meta, existing_prompt)，未传入对应 ID 时为 None
+        """
+        if session_id is not None and prompt_id:
+            session_meta, existing = await asyncio.gather(
+                self._read("get_session_meta", session_id, user_id),
+                self._read("get_prompt_by_id", prompt_id, user_id),
+            )
+            return session_meta, existing
+        if session_id is not None:
+            return await self.get_session_meta(session_id, user_id), None
+        if prompt_id:
+            return None, await self.get_prompt_by_id(prompt_id, user_id)
+        return None, None
+
     async def get_prompt_by_id(self, prompt_id: int, user_id: int) -> Optional[Dict[str, Any]]:
         """获取提示词并验证所有权"""
         has_origin_prompt_id = await self._column_exists("ai_prompts", "origin_prompt_id")
@@ -145,9 +178,13 @@ class PromptSaveService:
         self,
         user: CurrentUser,
         request: SavePromptRequest,
-        content: str
+        content: str,
+        existing: Any = _NOT_LOADED
     ) -> int:
-        """创建或更新提示词，返回prompt_id"""
+        """
+        创建或更新提示词，返回prompt_id
+        :param existing: 调用方已通过 prefetch_save_context 查询到的原提示词 (可为 None)，未传入时在这里查询
+        """
         
         user_id = int(user.id)
         user_name = user.username
@@ -162,14 +199,14 @@ class PromptSaveService:
             department_id = request.department_id
             status = 2
         
-        session_meta = await self.get_session_meta(request.session_id, user_id)
         # 注意：session_meta["origin_prompt_id"] 是会话关联的提示词ID
         # 而 ai_prompts.origin_prompt_id 是提示词的原始模板ID(溯源)
         # 两者含义不同，不要混淆
 
         origin_prompt_id = None
         if request.prompt_id:
-            existing = await self.get_prompt_by_id(request.prompt_id, user_id)
+            if existing is _NOT_LOADED:
+                existing = await self.get_prompt_by_id(request.prompt_id, user_id)
             if existing:
                 await self.session.execute(
                     text("""
@@ -249,22 +286,20 @@ class PromptSaveService:
         return prompt_id, origin_prompt_id is not None
     
     async def update_tag_relations(self, prompt_id: int, tag_ids: List[int], user_id: int):
-        """更新提示词与标签的关联关系"""
-        if not tag_ids:
-            await self.session.execute(
-                text("DELETE FROM ai_prompt_tag_relation WHERE prompt_id = :prompt_id"),
-                {"prompt_id": prompt_id}
-            )
-            return
+        """
+        更新提示词与标签的关联关系
+        与现有关联做差集：最多一条 DELETE + 一条多行 INSERT，往返次数与标签数量无关
+        """
+        desired = {int(tag_id) for tag_id in tag_ids or []}
         
-        if tag_ids:
+        if desired:
             result = await self.session.execute(
                 text("""
                     SELECT id, type, user_id
                     FROM ai_prompt_tags
                     WHERE id IN :tag_ids
                 """),
-                {"tag_ids": tuple(tag_ids)}
+                {"tag_ids": tuple(desired)}
             )
             tags = result.mappings().all()
             
@@ -275,26 +310,47 @@ class PromptSaveService:
                         detail=f"无权使用个人标签: {tag['id']}"
                     )
         
-        await self.session.execute(
-            text("DELETE FROM ai_prompt_tag_relation WHERE prompt_id = :prompt_id"),
+        result = await self.session.execute(
+            text("SELECT tag_id FROM ai_prompt_tag_relation WHERE prompt_id = :prompt_id"),
             {"prompt_id": prompt_id}
         )
+        current = {int(row[0]) for row in result.fetchall()}
         
-        for tag_id in set(tag_ids):
+        to_delete = current - desired
+        if to_delete:
             await self.session.execute(
                 text("""
-                    INSERT INTO ai_prompt_tag_relation (prompt_id, tag_id)
-                    VALUES (:prompt_id, :tag_id)
+                    DELETE FROM ai_prompt_tag_relation
+                    WHERE prompt_id = :prompt_id AND tag_id IN :tag_ids
                 """),
-                {"prompt_id": prompt_id, "tag_id": tag_id}
+                {"prompt_id": prompt_id, "tag_ids": tuple(to_delete)}
+            )
+        
+        to_insert = sorted(desired - current)
+        if to_insert:
+            values = ", ".join(f"(:prompt_id, :tag_{i})" for i in range(len(to_insert)))
+            params = {f"tag_{i}": tag_id for i, tag_id in enumerate(to_insert)}
+            params["prompt_id"] = prompt_id
+            await self.session.execute(
+                text(f"INSERT INTO ai_prompt_tag_relation (prompt_id, tag_id) VALUES {values}"),
+                params
             )
     
     async def update_directory_relation(self, prompt_id: int, directory_id: Optional[int]):
-        """更新提示词与目录的关联关系"""
-        await self.session.execute(
-            text("DELETE FROM ai_prompt_directory_rel WHERE prompt_id = :prompt_id"),
+        """更新提示词与目录的关联关系 (目录未变化时只有一次查询)"""
+        result = await self.session.execute(
+            text("SELECT directory_id FROM ai_prompt_directory_rel WHERE prompt_id = :prompt_id"),
             {"prompt_id": prompt_id}
         )
+        current = [row[0] for row in result.fetchall()]
+        if current == ([directory_id] if directory_id else []):
+            return
+        
+        if current:
+            await self.session.execute(
+                text("DELETE FROM ai_prompt_directory_rel WHERE prompt_id = :prompt_id"),
+                {"prompt_id": prompt_id}
+            )
         
         if directory_id:
             await self.session.execute(
@@ -393,6 +449,10 @@ class PromptSaveService:
             )
             logger.info(f"[PromptSave] Marked other messages as deleted in session {session_id}, kept message {message_id}")
 
+        if message_id:
+            # 新增助手消息 / 软删除其他消息后，刷新会话列表统计字段
+            await recount(self.session, session_id)
+
         logger.info(f"[PromptSave] Finalized session {session_id} with prompt {prompt_id}")
     
     async def create_personal_tag(
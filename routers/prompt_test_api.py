@@ -1,21 +1,14 @@
-import json
 import logging
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from routers.dependencies import require_user
+from utils.llm_admission import QueueUpdate
+from utils.sse import TokenBuffer, event, sse_response, DONE
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-STREAM_HEADERS = {
-    "Cache-Control": "no-cache",
-    "Connection": "keep-alive",
-    "Content-Type": "text/event-stream",
-    "X-Accel-Buffering": "no"
-}
-
 class TestRequest(BaseModel):
     system_prompt: str
     user_input: Optional[str] = None  # 可选，如果不提供则只根据 system_prompt 测试
@@ -39,22 +32,35 @@ async def test_stream_endpoint(request: TestRequest, current_user: dict = Depend
             
         logger.info(f"🚀 [Test] User: {user_id} 正在测试 Prompt")
 
-        async def event_generator():
+        # 同步生成器：由 StreamingResponse 放到线程池迭代，排队等待和模型调用都不阻塞事件循环
+        def event_generator():
             from utils.lyf.prompt_test import PromptTest
             test_service = PromptTest()
+            buffer = TokenBuffer()
             
             try:
                 logger.info(f"开始生成测试流... User: {user_id}")
-                for chunk in test_service.run_test_stream(request.system_prompt, request.user_input):
-                    yield f"data: {json.dumps({'content': chunk}, ensure_ascii=False)}\n\n"
+                for chunk in test_service.run_test_stream(request.system_prompt, request.user_input, user_id=user_id):
+                    if isinstance(chunk, QueueUpdate):
+                        yield chunk.sse()
+                        continue
+                    frame = buffer.push(chunk)
+                    if frame:
+                        yield frame
+                frame = buffer.flush()
+                if frame:
+                    yield frame
                 
                 logger.info(f"测试流生成完成. User: {user_id}")
-                yield "data: [DONE]\n\n"
+                yield DONE
             except Exception as e:
                 logger.error(f"Test stream generation error: {e}", exc_info=True)
-                yield f"data: {json.dumps({'content': f'[Error: {str(e)}]'}, ensure_ascii=False)}\n\n"
+                frame = buffer.flush()
+                if frame:
+                    yield frame
+                yield event({'content': f'[Error: {str(e)}]'})
 
-        return StreamingResponse(event_generator(), media_type="text/event-stream", headers=STREAM_HEADERS)
+        return sse_response(event_generator())
     except Exception as e:
         logger.error(f"Test endpoint error: {e}", exc_info=True)
         if isinstance(e, HTTPException):
@@ -0,0 +1,79 @@
+import os
+import sys
+import logging
+import argparse
+from sqlalchemy import text
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Add paths to sys.path to import project modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir) # generate_report_test
+sys.path.append(project_root)
+
+try:
+    from utils.zzp.catalogue_cache import get_db_connection
+    from utils.lyf.chat_session_stats import STATS_COLUMNS, ensure_stats_columns, rebuild_stats
+except ImportError as e:
+    logger.error(f"Import failed: {e}")
+    logger.error(f"sys.path: {sys.path}")
+    sys.exit(1)
+
+
+def backfill(dry_run=True):
+    """
+    Add message_count / last_message_at / last_message_preview and the sidebar index to
+    ai_chat_sessions, then recount every session from ai_chat_messages. Safe to re-run.
+    """
+    logger.info(f"Starting chat session stats backfill. Mode: {'DRY RUN' if dry_run else 'EXECUTE'}")
+
+    try:
+        engine = get_db_connection()
+        conn = engine.connect()
+    except Exception as e:
+        logger.error(f"Failed to connect to database: {e}")
+        return
+
+    try:
+        existing = {
+            row[0]
+            for row in conn.execute(text(
+                """
+                SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ai_chat_sessions'
+                """
+            ))
+        }
+        missing = [c for c in STATS_COLUMNS if c not in existing]
+        sessions = conn.execute(text("SELECT COUNT(*) FROM ai_chat_sessions")).scalar()
+        logger.info(f"Missing columns: {missing or 'none'}. {sessions} sessions to recount.")
+
+        if dry_run:
+            logger.info("Dry run completed. No DB changes committed.")
+            return
+
+        ensure_stats_columns(conn)
+        rebuild_stats(conn)
+        conn.commit()
+        logger.info(f"Backfill completed. Recounted {sessions} sessions.")
+
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error occurred during backfill: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Add and backfill chat session list stats columns.')
+    parser.add_argument('--execute', action='store_true', help='Write to the database (default is dry-run)')
+    args = parser.parse_args()
+
+    # Default is dry_run=True unless --execute is passed
+    backfill(dry_run=not args.execute)
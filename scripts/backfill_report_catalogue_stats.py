@@ -0,0 +1,72 @@
+import os
+import sys
+import logging
+import argparse
+from sqlalchemy import text
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Add paths to sys.path to import project modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir) # generate_report_test
+sys.path.append(project_root)
+
+try:
+    from utils.zzp.catalogue_cache import get_db_connection
+    from utils.zzp.report_stats import ensure_stats_table, rebuild_report_stats
+except ImportError as e:
+    logger.error(f"Import failed: {e}")
+    logger.error(f"sys.path: {sys.path}")
+    sys.exit(1)
+
+
+def backfill(dry_run=True):
+    """
+    Create report_catalogue_stats and rebuild it from report_catalogue in one grouped INSERT ... SELECT.
+    Safe to re-run. Reports missing from the table are also filled lazily on first query.
+    """
+    logger.info(f"Starting catalogue stats backfill. Mode: {'DRY RUN' if dry_run else 'EXECUTE'}")
+
+    try:
+        engine = get_db_connection()
+        conn = engine.connect()
+    except Exception as e:
+        logger.error(f"Failed to connect to database: {e}")
+        return
+
+    trans = conn.begin()
+    try:
+        reports = conn.execute(text("SELECT COUNT(*) FROM report_name")).scalar()
+        logger.info(f"Found {reports} reports.")
+
+        if dry_run:
+            trans.rollback()
+            logger.info("Dry run completed. No DB changes committed.")
+            return
+
+        ensure_stats_table(conn)
+        rebuild_report_stats(conn)
+        trans.commit()
+        rows = conn.execute(text("SELECT COUNT(*) FROM report_catalogue_stats")).scalar()
+        logger.info(f"Backfill completed. {rows} report stats rows written.")
+
+    except Exception as e:
+        trans.rollback()
+        logger.error(f"Error occurred during backfill: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create and backfill the report_catalogue_stats table.')
+    parser.add_argument('--execute', action='store_true', help='Write to the database (default is dry-run)')
+    args = parser.parse_args()
+
+    # Default is dry_run=True unless --execute is passed
+    backfill(dry_run=not args.execute)
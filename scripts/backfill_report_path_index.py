@@ -0,0 +1,129 @@
+import os
+import sys
+import logging
+import argparse
+from sqlalchemy import text
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Add paths to sys.path to import project modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir) # generate_report_test
+sys.path.append(project_root)
+
+try:
+    from server_config import get_user_report_dir
+    from utils.zzp.create_catalogue import safe_path_component
+    from utils.zzp.catalogue_cache import get_db_connection
+    from utils.zzp.report_path_index import (
+        ensure_path_index_table, register_report_path, SOURCE_REPORT, SOURCE_MERGE
+    )
+except ImportError as e:
+    logger.error(f"Import failed: {e}")
+    logger.error(f"sys.path: {sys.path}")
+    sys.exit(1)
+
+
+def probe_report_dir(user_id, type_name, report_name, storage_dir):
+    """
+    Legacy probing, run once per report:
+    storage_dir > safe name > raw name, under both raw and normalized type folders.
+    """
+    base_dir = get_user_report_dir(user_id)
+    dir_names = [d for d in [storage_dir, safe_path_component(report_name), report_name] if d]
+    type_dirs = [type_name, safe_path_component(type_name)]
+    for t_dir in dict.fromkeys(type_dirs):
+        for d_name in dict.fromkeys(dir_names):
+            path = os.path.join(base_dir, t_dir, d_name)
+            if os.path.isdir(path):
+                return path
+    return None
+
+
+def backfill(dry_run=True):
+    """
+    One-time backfill of report_path_index from report_name / report_merged_record.
+    Safe to re-run: rows are upserted on (user_id, source_type, type_name, report_name).
+    """
+    logger.info(f"Starting path index backfill. Mode: {'DRY RUN' if dry_run else 'EXECUTE'}")
+
+    try:
+        engine = get_db_connection()
+        conn = engine.connect()
+    except Exception as e:
+        logger.error(f"Failed to connect to database: {e}")
+        return
+
+    trans = conn.begin()
+    indexed, missing = 0, 0
+
+    try:
+        if not dry_run:
+            ensure_path_index_table(conn)
+
+        # 1. Report chapter directories
+        reports = conn.execute(text("""
+            SELECT r.id, r.report_name, r.user_id, r.storage_dir, t.type_name
+            FROM report_name r
+            JOIN report_type t ON r.type_id = t.id
+        """)).fetchall()
+        logger.info(f"Found {len(reports)} reports.")
+
+        for rid, rname, uid, storage_dir, tname in reports:
+            path = probe_report_dir(uid, tname, rname, storage_dir)
+            if not path:
+                missing += 1
+                logger.warning(f"  Directory not found: [{tname}] {rname} (ID: {rid}, User: {uid})")
+                continue
+            indexed += 1
+            if dry_run:
+                logger.info(f"  [Dry Run] Would index report {rid}: {path}")
+            else:
+                register_report_path(uid, SOURCE_REPORT, tname, rname, path, report_name_id=rid, connection=conn)
+
+        # 2. Merged report files
+        merged = conn.execute(text("""
+            SELECT m.report_name_id, m.merged_report_name, m.user_id, m.file_path, t.type_name
+            FROM report_merged_record m
+            JOIN report_type t ON m.type_id = t.id
+        """)).fetchall()
+        logger.info(f"Found {len(merged)} merged reports.")
+
+        for rid, mname, uid, file_path, tname in merged:
+            if not file_path or not os.path.isfile(file_path):
+                missing += 1
+                logger.warning(f"  Merged file not found: [{tname}] {mname} -> {file_path}")
+                continue
+            indexed += 1
+            if dry_run:
+                logger.info(f"  [Dry Run] Would index merged report {mname}: {file_path}")
+            else:
+                register_report_path(uid, SOURCE_MERGE, tname, mname, file_path, report_name_id=rid, connection=conn)
+
+        if dry_run:
+            trans.rollback()
+            logger.info(f"Dry run completed. {indexed} paths resolvable, {missing} missing. No DB changes committed.")
+        else:
+            trans.commit()
+            logger.info(f"Backfill completed. {indexed} paths indexed, {missing} missing.")
+
+    except Exception as e:
+        trans.rollback()
+        logger.error(f"Error occurred during backfill: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create and backfill the report_path_index table.')
+    parser.add_argument('--execute', action='store_true', help='Write to the database (default is dry-run)')
+    args = parser.parse_args()
+
+    # Default is dry_run=True unless --execute is passed
+    backfill(dry_run=not args.execute)
@@ -0,0 +1,168 @@
+-- 压测用替身数据库：只包含被压测接口用到的表和最少的种子数据
+-- 由 docker-compose.bench.yml 挂载到 /docker-entrypoint-initdb.d，在容器首次启动时执行
+
+CREATE DATABASE IF NOT EXISTS `generating_reports_bench` DEFAULT CHARSET utf8mb4;
+CREATE DATABASE IF NOT EXISTS `agent_report_bench` DEFAULT CHARSET utf8mb4;
+
+USE `generating_reports_bench`;
+
+CREATE TABLE IF NOT EXISTS `llm_config` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `llm_type` VARCHAR(32) NOT NULL,
+  `model_name` VARCHAR(255) NOT NULL,
+  `api_key` VARCHAR(1024) NULL,
+  `base_url` VARCHAR(512) NULL,
+  `user_id` INT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `file_structure` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `folder_name` VARCHAR(255) NOT NULL,
+  `user_id` INT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `file_item` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `file_name` VARCHAR(255) NOT NULL,
+  `folder_id` INT NOT NULL,
+  `file_path` VARCHAR(1024) NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `ai_chat_sessions` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `user_id` BIGINT NOT NULL,
+  `title` VARCHAR(255) NULL,
+  `status` TINYINT DEFAULT 0,
+  `ref_prompt_id` BIGINT NULL,
+  `origin_prompt_id` BIGINT NULL,
+  `final_content` LONGTEXT NULL,
+  `create_time` DATETIME DEFAULT CURRENT_TIMESTAMP,
+  `update_time` DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  `message_count` INT NOT NULL DEFAULT 0,
+  `last_message_at` DATETIME NULL,
+  `last_message_preview` VARCHAR(200) NULL,
+  PRIMARY KEY (`id`),
+  INDEX `idx_session_user` (`user_id`),
+  INDEX `idx_session_sidebar` (`user_id`, `status`, `update_time`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `ai_chat_messages` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `session_id` BIGINT NOT NULL,
+  `role` VARCHAR(20) NOT NULL,
+  `content` TEXT NOT NULL,
+  `create_time` DATETIME DEFAULT CURRENT_TIMESTAMP,
+  `round_index` INT DEFAULT 1,
+  `is_deleted` TINYINT DEFAULT 0,
+  `deleted_at` DATETIME DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  INDEX `idx_msg_session` (`session_id`),
+  INDEX `idx_round` (`session_id`, `round_index`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `ai_chat_context_state` (
+  `session_id` BIGINT NOT NULL,
+  `window_start_round` INT NOT NULL DEFAULT 1,
+  `history_content` LONGTEXT NULL,
+  PRIMARY KEY (`session_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 文档拆分导入 (run_pipeline_benchmark.py 的 split 阶段)
+CREATE TABLE IF NOT EXISTS `report_type` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `type_name` VARCHAR(255) NOT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `report_name` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `type_id` INT NOT NULL,
+  `report_name` VARCHAR(255) NOT NULL,
+  `user_id` INT NULL,
+  `storage_dir` VARCHAR(255) NULL,
+  PRIMARY KEY (`id`),
+  INDEX `idx_report_type` (`type_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `report_catalogue` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `type_id` INT NOT NULL,
+  `report_name_id` INT NOT NULL,
+  `catalogue_name` VARCHAR(255) NOT NULL,
+  `level` INT NOT NULL,
+  `sortOrder` INT NOT NULL DEFAULT 0,
+  `parent_id` INT NOT NULL DEFAULT 0,
+  `file_name` VARCHAR(512) NULL,
+  PRIMARY KEY (`id`),
+  INDEX `idx_catalogue_report` (`report_name_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `report_path_index` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `user_id` INT NOT NULL DEFAULT 0,
+  `source_type` VARCHAR(16) NOT NULL,
+  `type_name` VARCHAR(255) NOT NULL,
+  `report_name` VARCHAR(255) NOT NULL,
+  `report_name_id` INT NULL,
+  `path` VARCHAR(1024) NOT NULL,
+  `update_time` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_path_index` (`user_id`, `source_type`, `type_name`, `report_name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `report_catalogue_stats` (
+  `report_name_id` INT NOT NULL,
+  `level_1` INT NOT NULL DEFAULT 0,
+  `level_2` INT NOT NULL DEFAULT 0,
+  `level_3` INT NOT NULL DEFAULT 0,
+  `update_time` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`report_name_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS `deletion_tombstone` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `kind` VARCHAR(32) NOT NULL,
+  `user_id` INT NULL,
+  `label` VARCHAR(512) NULL,
+  `paths` TEXT NOT NULL,
+  `status` VARCHAR(16) NOT NULL DEFAULT 'pending',
+  `paths_total` INT NOT NULL DEFAULT 0,
+  `paths_done` INT NOT NULL DEFAULT 0,
+  `removed_entries` INT NOT NULL DEFAULT 0,
+  `attempts` INT NOT NULL DEFAULT 0,
+  `last_error` TEXT NULL,
+  `claim_token` VARCHAR(64) NULL,
+  `claimed_at` DATETIME NULL,
+  `create_time` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `finish_time` DATETIME NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_status_claimed` (`status`, `claimed_at`),
+  KEY `idx_user` (`user_id`, `id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 模型配置：1 = OpenAI 兼容 (桩服务 /v1)，2 = Ollama 兼容 (桩服务根路径)
+-- api_key 以 sk- 开头时 decrypt_text 直接返回明文，无需 Fernet 加密
+INSERT INTO `llm_config` (`id`, `llm_type`, `model_name`, `api_key`, `base_url`, `user_id`) VALUES
+  (1, 'online', 'stub-model', 'sk-bench-0000000000', 'http://127.0.0.1:18005/v1', NULL),
+  (2, 'local', 'stub-model', '', 'http://127.0.0.1:18005', NULL)
+ON DUPLICATE KEY UPDATE `model_name` = VALUES(`model_name`);
+
+USE `agent_report_bench`;
+
+CREATE TABLE IF NOT EXISTS `user_prompts` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `title` VARCHAR(255) NOT NULL,
+  `content` TEXT NOT NULL,
+  `folder_id` INT NOT NULL,
+  `user_id` INT NOT NULL,
+  `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 润色接口固定使用用户 7 / 文件夹 402 的提示词
+INSERT INTO `user_prompts` (`id`, `title`, `content`, `folder_id`, `user_id`) VALUES
+  (1, '商务润色', '请使用正式的商务语气改写，保持原意。', 402, 7)
+ON DUPLICATE KEY UPDATE `content` = VALUES(`content`);
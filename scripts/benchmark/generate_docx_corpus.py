@@ -0,0 +1,188 @@
+import os
+import json
+import zlib
+import struct
+import random
+import logging
+import argparse
+
+from docx import Document
+from docx.shared import Inches
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# 合成 DOCX 语料生成器
+# ==========================================
+# 生成结构可控的报告模板，供 run_pipeline_benchmark.py 使用：
+#   - 标题使用内置 "Heading N" 样式，拆分器 get_heading_level 按样式识别
+#   - 每个章节包含若干正文段落，可选表格与图片
+#   - 图片为随机噪点 PNG (纯 zlib 编码，不依赖 Pillow)，每张内容不同，避免被内容哈希去重
+# 相同参数 + 相同 seed 生成的文档内容完全一致，保证基准可复现。
+
+_SENTENCES = [
+    "本项目围绕业务系统现状开展需求调研与分析。",
+    "现有系统存在数据分散、接口标准不统一等问题。",
+    "建设内容包括平台升级、数据治理与安全加固三个部分。",
+    "项目实施后将显著提升业务协同效率和数据共享水平。",
+    "投资估算依据国家及行业相关定额标准编制。",
+    "系统采用微服务架构，支持横向扩展与灰度发布。",
+    "运维保障体系覆盖监控告警、备份恢复与应急演练。",
+    "风险分析从技术、管理、进度三个维度展开论证。",
+]
+
+_TITLES = ["概述", "现状分析", "需求分析", "总体设计", "建设内容", "实施计划",
+           "投资估算", "效益分析", "风险分析", "运维保障", "安全设计", "结论与建议"]
+
+
+class CorpusSpec:
+    """语料参数，写入 manifest.json 供基准对比时校验"""
+
+    def __init__(self, docs=3, chapters=8, heading_depth=3, children=2, paragraphs=6,
+                 sentences=4, tables=1, table_rows=8, table_cols=4, images=1, image_size=256, seed=42):
+        self.docs = docs                    # 文档数量
+        self.chapters = chapters            # 每个文档的一级章节数
+        self.heading_depth = heading_depth  # 标题最大层级 (1-9)
+        self.children = children            # 每个非叶子章节的子章节数
+        self.paragraphs = paragraphs        # 每个章节的正文段落数
+        self.sentences = sentences          # 每个段落的句子数
+        self.tables = tables                # 每个叶子章节的表格数
+        self.table_rows = table_rows
+        self.table_cols = table_cols
+        self.images = images                # 每个叶子章节的图片数
+        self.image_size = image_size        # 图片边长 (像素)
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def make_png(width, height, rng):
+    """生成随机噪点 RGB PNG 的字节内容"""
+    raw = bytearray()
+    for _ in range(height):
+        raw.append(0)  # filter type: None
+        raw.extend(rng.getrandbits(8) for _ in range(width * 3))
+
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(bytes(raw), 6)) + chunk(b"IEND", b""))
+
+
+def _paragraph_text(spec, rng):
+    return "".join(rng.choice(_SENTENCES) for _ in range(spec.sentences))
+
+
+def _add_table(doc, spec, rng):
+    table = doc.add_table(rows=spec.table_rows, cols=spec.table_cols)
+    table.style = "Table Grid"
+    for j in range(spec.table_cols):
+        table.rows[0].cells[j].text = f"指标{j + 1}"
+    for i in range(1, spec.table_rows):
+        for j in range(spec.table_cols):
+            table.rows[i].cells[j].text = str(rng.randint(1, 100000))
+
+
+def _add_section(doc, spec, rng, level, image_dir, counter):
+    doc.add_heading(f"{rng.choice(_TITLES)}{counter['sections']}", level=level)
+    counter["sections"] += 1
+    for _ in range(spec.paragraphs):
+        doc.add_paragraph(_paragraph_text(spec, rng))
+
+    if level < spec.heading_depth:
+        for _ in range(spec.children):
+            _add_section(doc, spec, rng, level + 1, image_dir, counter)
+        return
+
+    # 叶子章节放表格和图片
+    for _ in range(spec.tables):
+        _add_table(doc, spec, rng)
+    for _ in range(spec.images):
+        image_path = os.path.join(image_dir, f"img_{counter['images']}.png")
+        with open(image_path, "wb") as f:
+            f.write(make_png(spec.image_size, spec.image_size, rng))
+        doc.add_paragraph().add_run().add_picture(image_path, width=Inches(4.0))
+        counter["images"] += 1
+
+
+def generate_corpus(output_dir, spec):
+    """
+    按 spec 生成语料到 output_dir，返回 manifest
+    :return: {"spec": {...}, "files": [...], "sections": n, "images": n}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    image_dir = os.path.join(output_dir, ".images")
+    os.makedirs(image_dir, exist_ok=True)
+
+    rng = random.Random(spec.seed)
+    files = []
+    counter = {"sections": 0, "images": 0}
+    for d in range(spec.docs):
+        doc = Document()
+        for _ in range(spec.chapters):
+            _add_section(doc, spec, rng, 1, image_dir, counter)
+        path = os.path.join(output_dir, f"corpus_{d + 1:03d}.docx")
+        doc.save(path)
+        files.append(path)
+        logger.info(f"📄 {os.path.basename(path)} ({os.path.getsize(path) / 1024 / 1024:.2f} MB)")
+
+    for name in os.listdir(image_dir):
+        os.remove(os.path.join(image_dir, name))
+    os.rmdir(image_dir)
+
+    manifest = {
+        "spec": spec.to_dict(),
+        "files": [os.path.basename(f) for f in files],
+        "sections": counter["sections"],
+        "images": counter["images"],
+        "bytes": sum(os.path.getsize(f) for f in files),
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def add_spec_arguments(parser):
+    """语料参数，run_pipeline_benchmark.py 复用"""
+    defaults = CorpusSpec()
+    parser.add_argument('--docs', type=int, default=defaults.docs, help='Number of documents')
+    parser.add_argument('--chapters', type=int, default=defaults.chapters, help='Top level chapters per document')
+    parser.add_argument('--heading-depth', type=int, default=defaults.heading_depth, help='Deepest heading level (1-9)')
+    parser.add_argument('--children', type=int, default=defaults.children, help='Sub sections per non-leaf section')
+    parser.add_argument('--paragraphs', type=int, default=defaults.paragraphs, help='Body paragraphs per section')
+    parser.add_argument('--sentences', type=int, default=defaults.sentences, help='Sentences per paragraph')
+    parser.add_argument('--tables', type=int, default=defaults.tables, help='Tables per leaf section')
+    parser.add_argument('--table-rows', type=int, default=defaults.table_rows)
+    parser.add_argument('--table-cols', type=int, default=defaults.table_cols)
+    parser.add_argument('--images', type=int, default=defaults.images, help='Images per leaf section')
+    parser.add_argument('--image-size', type=int, default=defaults.image_size, help='Image edge length in pixels')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+
+
+def spec_from_args(args):
+    return CorpusSpec(
+        docs=args.docs, chapters=args.chapters, heading_depth=min(max(args.heading_depth, 1), 9),
+        children=args.children, paragraphs=args.paragraphs, sentences=args.sentences,
+        tables=args.tables, table_rows=args.table_rows, table_cols=args.table_cols,
+        images=args.images, image_size=args.image_size, seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic DOCX corpus for pipeline benchmarks.')
+    parser.add_argument('--output', default='bench_corpus', help='Output directory')
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+
+    result = generate_corpus(args.output, spec_from_args(args))
+    logger.info(f"✅ {len(result['files'])} documents, {result['sections']} sections, "
+                f"{result['images']} images -> {args.output}")
@@ -0,0 +1,383 @@
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import asyncio
+import logging
+import argparse
+import subprocess
+
+import httpx
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+# ==========================================
+# 离线流式接口压测
+# ==========================================
+# 1. 启动 stub_llm_server.py (OpenAI / Ollama 兼容桩服务)
+# 2. 以替身 MySQL / Redis (docker-compose.bench.yml) 启动 new_report:app
+# 3. 对每个流式接口发起并发 SSE 请求，统计 TTFT、字符间隔、吞吐
+#    服务端按 SSE_COALESCE_MS 把多个 token 合并成一帧，所以按帧内字符数计量，不按帧数
+# 4. 压测期间轮询 /metrics，统计 AnyIO 线程池占用 (同步流式生成器在线程池中执行)
+
+BENCH_USER_ID = 7
+JWT_SECRET = "bench-secret"
+
+ENDPOINTS = ["chat", "generate", "summary", "optimize", "search"]
+
+
+def build_request(endpoint, stub_url, model_id):
+    """返回 (path, payload)，每次请求使用独立 task_id，避免共享多轮历史"""
+    task_id = f"bench-{uuid.uuid4().hex[:12]}"
+    text = "近年来，各地持续推进节能降碳工作，在工业、建筑、交通等重点领域实施节能改造。" * 4
+    if endpoint == "chat":
+        return "/api/ai/chat/v2/prompt_chat/stream", {"query": "请帮我写一段工作总结的开头"}
+    if endpoint == "generate":
+        return "/Generate_Summary_Stream/", {
+            "task_id": task_id, "status": 1, "agentUserId": BENCH_USER_ID, "id": model_id,
+            "folder_name": "工作总结", "material_name_list": [], "instruction": "撰写本章节正文"
+        }
+    if endpoint == "summary":
+        return "/ai_summary/stream", {
+            "task_id": task_id, "status": 1, "agentUserId": BENCH_USER_ID, "id": model_id, "text": text
+        }
+    if endpoint == "optimize":
+        return "/Optimize_Text_Stream/", {
+            "task_id": task_id, "status": 1, "agentUserId": BENCH_USER_ID, "id": model_id,
+            "text": text, "prompt_ids": [1]
+        }
+    if endpoint == "search":
+        return "/ai_search/stream", {
+            "task_id": task_id, "user_query": "节能降碳最新政策", "id": model_id,
+            "model_name": "stub-model", "base_url": f"{stub_url}/v1", "api_key": "sk-bench-0000000000"
+        }
+    raise ValueError(f"unknown endpoint: {endpoint}")
+
+
+def bench_env(args, stub_url):
+    """new_report 子进程环境变量：模型指向桩服务，数据库 / Redis 指向替身容器"""
+    env = dict(os.environ)
+    env.update({
+        "ENV": "benchmark",
+        "JWT_SECRET": JWT_SECRET,
+        "AI_BASE_URL": f"{stub_url}/v1",
+        "AI_API_KEY": "sk-bench-0000000000",
+        "AI_MODEL_NAME": "stub-model",
+        "LOCAL_BASE_URL": f"{stub_url}/v1",
+        "REPORT_DB_HOST": args.db_host,
+        "REPORT_DB_PORT": str(args.db_port),
+        "REPORT_DB_USER": args.db_user,
+        "REPORT_DB_PASSWORD": args.db_password,
+        "REPORT_DB_NAME": "generating_reports_bench",
+        "AGENT_DB_HOST": args.db_host,
+        "AGENT_DB_PORT": str(args.db_port),
+        "AGENT_DB_USER": args.db_user,
+        "AGENT_DB_PASSWORD": args.db_password,
+        "AGENT_DB_NAME": "agent_report_bench",
+        "REDIS_ENABLED": "1",
+        "REDIS_HOST": args.redis_host,
+        "REDIS_PORT": str(args.redis_port),
+        "REDIS_PASSWORD": "",
+        "REDIS_PREFIX": "bench",
+        "METRICS_ENABLED": "1",
+    })
+    return env
+
+
+def point_llm_config_at_stub(args, stub_url):
+    """种子数据中的模型地址按实际桩服务端口更新"""
+    import pymysql
+    conn = pymysql.connect(host=args.db_host, port=args.db_port, user=args.db_user,
+                           password=args.db_password, database="generating_reports_bench")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE llm_config SET base_url = %s WHERE id = 1", (f"{stub_url}/v1",))
+            cursor.execute("UPDATE llm_config SET base_url = %s WHERE id = 2", (stub_url,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def mint_token():
+    os.environ["JWT_SECRET"] = JWT_SECRET
+    from utils.lyf.auth_utils import create_access_token
+    return create_access_token(BENCH_USER_ID, "bench", ["user"])
+
+
+def wait_until_up(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+# ==========================================
+# 1. 单个 SSE 请求
+# ==========================================
+
+async def run_one(client, endpoint, path, payload, token):
+    result = {"endpoint": endpoint, "ok": False, "ttft": None, "gaps": [], "frame_gaps": [],
+              "chars": 0, "frames": 0, "total": None}
+    headers = {"Authorization": f"Bearer {token}"}
+    start = time.perf_counter()
+    last = None
+    try:
+        async with client.stream("POST", path, json=payload, headers=headers) as resp:
+            if resp.status_code != 200:
+                result["error"] = f"HTTP {resp.status_code}"
+                return result
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if data == "[DONE]":
+                    break
+                try:
+                    event = json.loads(data)
+                except ValueError:
+                    continue
+                if event.get("error"):
+                    result["error"] = str(event["error"])[:200]
+                    break
+                content = event.get("content")
+                if not content:
+                    continue
+                now = time.perf_counter()
+                if last is None:
+                    result["ttft"] = now - start
+                else:
+                    # 一帧内的字符在同一时刻到达，帧间隔均摊到每个字符
+                    gap = now - last
+                    result["frame_gaps"].append(gap)
+                    result["gaps"].extend([gap / len(content)] * len(content))
+                last = now
+                result["chars"] += len(content)
+                result["frames"] += 1
+        result["ok"] = result["chars"] > 0 and "error" not in result
+    except httpx.HTTPError as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["total"] = time.perf_counter() - start
+    return result
+
+# ==========================================
+# 2. 线程池占用采样
+# ==========================================
+
+def parse_gauges(text, names):
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        parts = line.split(" ")
+        if len(parts) == 2 and parts[0] in names:
+            values[parts[0]] = float(parts[1])
+    return values
+
+
+async def sample_threadpool(client, samples, stop_event, interval):
+    names = {"report_threadpool_in_use", "report_threadpool_limit", "report_http_requests_in_flight"}
+    while not stop_event.is_set():
+        try:
+            resp = await client.get("/metrics")
+            samples.append(parse_gauges(resp.text, names))
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+# ==========================================
+# 3. 统计
+# ==========================================
+
+def pct(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+def summarize(endpoint, results, wall, samples):
+    ok = [r for r in results if r["ok"]]
+    ttft = [r["ttft"] for r in ok if r["ttft"] is not None]
+    gaps = [g for r in ok for g in r["gaps"]]
+    frame_gaps = [g for r in ok for g in r["frame_gaps"]]
+    totals = [r["total"] for r in ok]
+    chars = sum(r["chars"] for r in ok)
+    frames = sum(r["frames"] for r in ok)
+    in_use = [s.get("report_threadpool_in_use", 0) for s in samples]
+    limit = max((s.get("report_threadpool_limit", 0) for s in samples), default=0)
+    saturated = [v for v in in_use if limit and v >= limit]
+
+    def ms(v):
+        return round(v * 1000, 1) if v is not None else None
+
+    return {
+        "endpoint": endpoint,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_samples": list({r.get("error") for r in results if r.get("error")})[:3],
+        "ttft_ms": {"p50": ms(pct(ttft, 50)), "p95": ms(pct(ttft, 95)), "p99": ms(pct(ttft, 99))},
+        "inter_char_ms": {"p50": ms(pct(gaps, 50)), "p95": ms(pct(gaps, 95)), "p99": ms(pct(gaps, 99))},
+        "frame_gap_ms": {"p50": ms(pct(frame_gaps, 50)), "p99": ms(pct(frame_gaps, 99))},
+        "chars_per_frame": round(chars / frames, 1) if frames else 0,
+        "total_ms": {"p50": ms(pct(totals, 50)), "p95": ms(pct(totals, 95))},
+        "throughput_chars_per_s": round(chars / wall, 1) if wall else 0,
+        "requests_per_s": round(len(ok) / wall, 2) if wall else 0,
+        "threadpool": {
+            "limit": limit,
+            "max_in_use": max(in_use, default=0),
+            "mean_in_use": round(sum(in_use) / len(in_use), 2) if in_use else 0,
+            "saturated_ratio": round(len(saturated) / len(in_use), 3) if in_use else 0,
+        },
+    }
+
+
+async def bench_endpoint(args, endpoint, token, stub_url):
+    timeout = httpx.Timeout(args.request_timeout, connect=10)
+    limits = httpx.Limits(max_connections=args.concurrency + 4, max_keepalive_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.app_url, timeout=timeout, limits=limits) as client:
+        queue = asyncio.Queue()
+        for _ in range(args.requests):
+            queue.put_nowait(build_request(endpoint, stub_url, args.model_id))
+        results = []
+
+        async def worker():
+            while True:
+                try:
+                    path, payload = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results.append(await run_one(client, endpoint, path, payload, token))
+
+        samples = []
+        stop_event = asyncio.Event()
+        sampler = asyncio.create_task(sample_threadpool(client, samples, stop_event, args.sample_interval))
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - start
+        stop_event.set()
+        await sampler
+
+    return summarize(endpoint, results, wall, samples)
+
+
+def print_report(reports):
+    header = (f"{'endpoint':<10}{'req':>5}{'err':>5}{'ttft p50/p95 ms':>20}{'char gap p50/p99 ms':>22}"
+              f"{'frame gap p50/p99 ms':>22}{'chars/s':>9}{'pool max/limit':>16}{'saturated':>11}")
+    print("\n" + header)
+    print("-" * len(header))
+    for r in reports:
+        tp = r["threadpool"]
+        print(f"{r['endpoint']:<10}{r['requests']:>5}{r['errors']:>5}"
+              f"{str(r['ttft_ms']['p50']) + '/' + str(r['ttft_ms']['p95']):>20}"
+              f"{str(r['inter_char_ms']['p50']) + '/' + str(r['inter_char_ms']['p99']):>22}"
+              f"{str(r['frame_gap_ms']['p50']) + '/' + str(r['frame_gap_ms']['p99']):>22}"
+              f"{r['throughput_chars_per_s']:>9}"
+              f"{str(int(tp['max_in_use'])) + '/' + str(int(tp['limit'])):>16}"
+              f"{tp['saturated_ratio']:>11}")
+        for err in r["error_samples"]:
+            print(f"    ! {err}")
+
+
+async def run_all(args, token, stub_url):
+    reports = []
+    for endpoint in args.endpoints:
+        logger.info(f"▶️ {endpoint}: {args.requests} requests, concurrency {args.concurrency}")
+        reports.append(await bench_endpoint(args, endpoint, token, stub_url))
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline SSE benchmark for the streaming endpoints of new_report:app.')
+    parser.add_argument('--endpoints', default=",".join(ENDPOINTS), help=f'Comma separated subset of {ENDPOINTS}')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=32, help='Requests per endpoint')
+    parser.add_argument('--model-id', type=int, default=1, help='llm_config id (1 = OpenAI stub, 2 = Ollama stub)')
+    parser.add_argument('--request-timeout', type=float, default=300)
+    parser.add_argument('--sample-interval', type=float, default=0.2, help='Seconds between /metrics samples')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    # 桩服务
+    parser.add_argument('--stub-port', type=int, default=18005)
+    parser.add_argument('--ttft', type=float, default=0.2)
+    parser.add_argument('--token-latency', type=float, default=0.05)
+    parser.add_argument('--tokens', type=int, default=200)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--tool-mode', choices=['none', 'builtin', 'web_search'], default='none')
+    # 被测应用
+    parser.add_argument('--app-port', type=int, default=18080)
+    parser.add_argument('--app-url', help='Benchmark an already running app instead of starting one')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers for the app under test')
+    # 替身数据库 / Redis
+    parser.add_argument('--db-host', default='127.0.0.1')
+    parser.add_argument('--db-port', type=int, default=13306)
+    parser.add_argument('--db-user', default='root')
+    parser.add_argument('--db-password', default='bench')
+    parser.add_argument('--redis-host', default='127.0.0.1')
+    parser.add_argument('--redis-port', type=int, default=16379)
+    args = parser.parse_args()
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    processes = []
+    try:
+        processes.append(subprocess.Popen([
+            sys.executable, os.path.join(current_dir, "stub_llm_server.py"),
+            "--port", str(args.stub_port), "--ttft", str(args.ttft),
+            "--token-latency", str(args.token_latency), "--tokens", str(args.tokens),
+            "--jitter", str(args.jitter), "--tool-mode", args.tool_mode,
+        ]))
+        if not wait_until_up(f"{stub_url}/v1/models"):
+            logger.error("Stub LLM server did not start")
+            return 1
+
+        point_llm_config_at_stub(args, stub_url)
+
+        if not args.app_url:
+            args.app_url = f"http://127.0.0.1:{args.app_port}"
+            processes.append(subprocess.Popen([
+                sys.executable, "-m", "uvicorn", "new_report:app",
+                "--host", "127.0.0.1", "--port", str(args.app_port),
+                "--workers", str(args.workers), "--log-level", "warning",
+            ], cwd=project_root, env=bench_env(args, stub_url)))
+        if not wait_until_up(f"{args.app_url}/metrics", timeout=120):
+            logger.error(f"App under test is not reachable at {args.app_url}")
+            return 1
+
+        reports = asyncio.run(run_all(args, mint_token(), stub_url))
+        print_report(reports)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"config": {k: v for k, v in vars(args).items() if k != "db_password"},
+                           "results": reports}, f, ensure_ascii=False, indent=2)
+            logger.info(f"Report written to {args.output}")
+        return 0
+    finally:
+        for proc in reversed(processes):
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import contextlib
+import multiprocessing
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+sys.path.append(current_dir)
+
+from generate_docx_corpus import generate_corpus, add_spec_arguments, spec_from_args
+
+# ==========================================
+# 文档处理流水线基准与回归检查
+# ==========================================
+# 每个阶段在独立的 spawn 子进程中执行，子进程先完成模块导入和输入准备，再重置 RSS 峰值开始计时，
+# 因此 peak_rss_mb 只反映该阶段执行期间的内存峰值，不受其他阶段或父进程影响。
+# 结果与 baseline JSON 对比，任一阶段耗时或峰值内存超过阈值即以非零状态退出。
+# 基线文件缺失时同样以非零状态退出 (否则回归检查永远不会生效)；只看结果时使用 --report-only。
+
+STAGES = ["split", "docx_to_html", "html_to_docx", "merge", "merged_html"]
+
+BENCH_USER_ID = 7
+BENCH_REPORT_TYPE = "基准测试"
+DEFAULT_BASELINE = os.path.join(current_dir, "pipeline_baseline.json")
+
+
+def _proc_status_mb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Linux 下把 VmHWM 重置为当前 RSS；ru_maxrss 会跨 exec 继承父进程的峰值，不能直接使用"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    # 非 Linux 兜底: macOS 下 ru_maxrss 单位为字节
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def _current_rss_mb():
+    rss = _proc_status_mb("VmRSS")
+    return rss if rss is not None else _peak_rss_mb()
+
+# ==========================================
+# 1. 各阶段 (在子进程中执行)
+# ==========================================
+
+def _stage_split(corpus_files, workdir):
+    from utils.zzp.import_doc_to_db import WordProjectExtractor
+    from utils.zzp.create_catalogue import safe_path_component
+    from server_config import get_user_report_dir
+
+    def run():
+        for path in corpus_files:
+            report_name = f"bench_{os.path.splitext(os.path.basename(path))[0]}_{uuid.uuid4().hex[:8]}"
+            try:
+                ok, msg = WordProjectExtractor().split_and_import_to_db(
+                    path, BENCH_REPORT_TYPE, report_name, user_id=BENCH_USER_ID)
+                if not ok:
+                    raise RuntimeError(msg)
+            finally:
+                shutil.rmtree(os.path.join(get_user_report_dir(BENCH_USER_ID),
+                                           safe_path_component(BENCH_REPORT_TYPE),
+                                           safe_path_component(report_name)), ignore_errors=True)
+    return run
+
+
+def _stage_docx_to_html(corpus_files, workdir):
+    from utils.zzp.docx_to_html import convert_docx_to_html
+
+    out_dir = os.path.join(workdir, "docx_to_html")
+    image_dir = os.path.join(out_dir, "images")
+    os.makedirs(image_dir, exist_ok=True)
+    targets = []
+    for path in corpus_files:
+        target = os.path.join(out_dir, os.path.basename(path))
+        shutil.copyfile(path, target)
+        targets.append(target)
+
+    def run():
+        for target in targets:
+            if not convert_docx_to_html(target, image_output_dir=image_dir, image_url_prefix="/bench/images/"):
+                raise RuntimeError(f"convert_docx_to_html failed: {target}")
+    return run
+
+
+def _stage_html_to_docx(corpus_files, workdir):
+    from utils.zzp.html_to_docx import convert_html_to_docx
+
+    html_files = [os.path.splitext(p)[0] + ".html" for p in _prepared_files(corpus_files, workdir)]
+    contents = []
+    for html_path in html_files:
+        with open(html_path, "r", encoding="utf-8") as f:
+            contents.append(f.read())
+    out_dir = os.path.join(workdir, "html_to_docx")
+    os.makedirs(out_dir, exist_ok=True)
+
+    def run():
+        for i, content in enumerate(contents):
+            if not convert_html_to_docx(content, os.path.join(out_dir, f"out_{i}.docx")):
+                raise RuntimeError(f"convert_html_to_docx failed: {html_files[i]}")
+    return run
+
+
+def _stage_merge(corpus_files, workdir):
+    from utils.zzp.report_merge import merge_docx_files
+
+    target = os.path.join(workdir, "merge", "merged.docx")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    def run():
+        ok, msg = merge_docx_files(corpus_files, target)
+        if not ok:
+            raise RuntimeError(msg)
+    return run
+
+
+def _stage_merged_html(corpus_files, workdir):
+    from utils.zzp.docx_to_html import convert_docx_list_to_merged_html
+
+    prepared = _prepared_files(corpus_files, workdir)
+    out_dir = os.path.join(workdir, "merged_html")
+    os.makedirs(out_dir, exist_ok=True)
+
+    def run():
+        if not convert_docx_list_to_merged_html(prepared, os.path.join(out_dir, "merged.html"),
+                                                image_output_dir=os.path.join(out_dir, "images"),
+                                                image_url_prefix="/bench/merged/"):
+            raise RuntimeError("convert_docx_list_to_merged_html failed")
+    return run
+
+
+STAGE_FACTORIES = {
+    "split": _stage_split,
+    "docx_to_html": _stage_docx_to_html,
+    "html_to_docx": _stage_html_to_docx,
+    "merge": _stage_merge,
+    "merged_html": _stage_merged_html,
+}
+
+
+def _prepared_files(corpus_files, workdir):
+    """父进程预先转换好的 docx + 同名 html (html_to_docx / merged_html 的输入)"""
+    prepared_dir = os.path.join(workdir, "prepared")
+    return [os.path.join(prepared_dir, os.path.basename(p)) for p in corpus_files]
+
+
+def prepare_inputs(corpus_files, workdir):
+    from utils.zzp.docx_to_html import convert_docx_to_html
+
+    prepared_dir = os.path.join(workdir, "prepared")
+    os.makedirs(prepared_dir, exist_ok=True)
+    for path, target in zip(corpus_files, _prepared_files(corpus_files, workdir)):
+        shutil.copyfile(path, target)
+        convert_docx_to_html(target, image_output_dir=os.path.join(prepared_dir, "images"),
+                             image_url_prefix="/bench/prepared/")
+
+
+def _stage_worker(stage, corpus_files, workdir, result_queue):
+    try:
+        # 拆分器和转换器大量 print，屏蔽掉避免干扰计时输出
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            logging.disable(logging.WARNING)
+            run = STAGE_FACTORIES[stage](corpus_files, workdir)
+            _reset_peak_rss()
+            baseline_rss = _current_rss_mb()
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            run()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+        peak_rss = _peak_rss_mb()
+        result_queue.put({"ok": True, "wall_s": wall, "cpu_s": cpu,
+                          "peak_rss_mb": peak_rss, "rss_delta_mb": peak_rss - baseline_rss})
+    except Exception as e:
+        result_queue.put({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+# ==========================================
+# 2. 调度
+# ==========================================
+
+def run_stage(stage, corpus_files, workdir, repeat, timeout):
+    ctx = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        result_queue = ctx.Queue()
+        proc = ctx.Process(target=_stage_worker, args=(stage, corpus_files, workdir, result_queue))
+        proc.start()
+        try:
+            result = result_queue.get(timeout=timeout)
+        except Exception:
+            proc.kill()
+            result = {"ok": False, "error": f"timeout after {timeout}s"}
+        proc.join()
+        if not result["ok"]:
+            return result
+        runs.append(result)
+
+    # 取中位数，降低单次抖动影响
+    return {
+        "ok": True,
+        "repeat": repeat,
+        "wall_s": round(statistics.median(r["wall_s"] for r in runs), 4),
+        "cpu_s": round(statistics.median(r["cpu_s"] for r in runs), 4),
+        "peak_rss_mb": round(statistics.median(r["peak_rss_mb"] for r in runs), 1),
+        "rss_delta_mb": round(statistics.median(r["rss_delta_mb"] for r in runs), 1),
+    }
+
+
+def db_reachable(args):
+    try:
+        import pymysql
+        pymysql.connect(host=args.db_host, port=args.db_port, user=args.db_user,
+                        password=args.db_password, database="generating_reports_bench",
+                        connect_timeout=3).close()
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ 替身数据库不可用，跳过 split 阶段: {e}")
+        return False
+
+# ==========================================
+# 3. 基线对比
+# ==========================================
+
+def compare_with_baseline(results, baseline, args):
+    """返回 (回归列表, 对比明细)"""
+    regressions = []
+    rows = []
+    for stage, cur in results.items():
+        base = baseline.get("stages", {}).get(stage)
+        if not cur.get("ok") or not base:
+            continue
+        checks = [
+            ("wall_s", args.time_threshold, args.min_time_delta),
+            ("peak_rss_mb", args.rss_threshold, args.min_rss_delta),
+        ]
+        for metric, threshold, min_delta in checks:
+            before, after = base[metric], cur[metric]
+            ratio = (after / before - 1) if before else 0.0
+            regressed = ratio > threshold and (after - before) > min_delta
+            rows.append((stage, metric, before, after, ratio, regressed))
+            if regressed:
+                regressions.append(f"{stage}.{metric}: {before} -> {after} (+{ratio:.1%}, threshold {threshold:.0%})")
+    return regressions, rows
+
+
+def print_results(results, rows):
+    print(f"\n{'stage':<14}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}{'delta MB':>10}")
+    print("-" * 54)
+    for stage, r in results.items():
+        if r.get("skipped"):
+            print(f"{stage:<14}{'skipped':>10}")
+        elif not r["ok"]:
+            print(f"{stage:<14}{'FAILED':>10}  {r['error']}")
+        else:
+            print(f"{stage:<14}{r['wall_s']:>10}{r['cpu_s']:>10}{r['peak_rss_mb']:>10}{r['rss_delta_mb']:>10}")
+    if rows:
+        print(f"\n{'stage':<14}{'metric':<13}{'baseline':>10}{'current':>10}{'change':>9}")
+        print("-" * 56)
+        for stage, metric, before, after, ratio, regressed in rows:
+            flag = "  ❌" if regressed else ""
+            print(f"{stage:<14}{metric:<13}{before:>10}{after:>10}{ratio:>+9.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the DOCX import/convert/merge pipeline and check for regressions.')
+    parser.add_argument('--stages', default=",".join(STAGES), help=f'Comma separated subset of {STAGES}')
+    parser.add_argument('--corpus', help='Existing corpus directory (with manifest.json); generated when omitted')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage, the median is reported')
+    parser.add_argument('--timeout', type=float, default=1800, help='Seconds per stage run')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON to compare against')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--report-only', action='store_true', help='Print the results without the regression check')
+    parser.add_argument('--output', help='Write the JSON results to this file')
+    parser.add_argument('--time-threshold', type=float, default=0.20, help='Allowed relative wall time growth')
+    parser.add_argument('--rss-threshold', type=float, default=0.10, help='Allowed relative peak RSS growth')
+    parser.add_argument('--min-time-delta', type=float, default=0.05, help='Ignore wall time growth below this many seconds')
+    parser.add_argument('--min-rss-delta', type=float, default=5.0, help='Ignore peak RSS growth below this many MB')
+    parser.add_argument('--keep-workdir', action='store_true')
+    # split 阶段写入数据库，使用 docker-compose.bench.yml 中的替身 MySQL
+    parser.add_argument('--db-host', default='127.0.0.1')
+    parser.add_argument('--db-port', type=int, default=13306)
+    parser.add_argument('--db-user', default='root')
+    parser.add_argument('--db-password', default='bench')
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGE_FACTORIES]
+    if unknown:
+        parser.error(f"unknown stages: {unknown}")
+
+    # 子进程通过环境变量继承数据库配置 (sql_config 在导入时读取)
+    os.environ.update({
+        "REPORT_DB_HOST": args.db_host,
+        "REPORT_DB_PORT": str(args.db_port),
+        "REPORT_DB_USER": args.db_user,
+        "REPORT_DB_PASSWORD": args.db_password,
+        "REPORT_DB_NAME": "generating_reports_bench",
+    })
+
+    workdir = tempfile.mkdtemp(prefix="pipeline_bench_")
+    try:
+        if args.corpus:
+            with open(os.path.join(args.corpus, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            corpus_dir = args.corpus
+        else:
+            corpus_dir = os.path.join(workdir, "corpus")
+            manifest = generate_corpus(corpus_dir, spec_from_args(args))
+        corpus_files = [os.path.abspath(os.path.join(corpus_dir, name)) for name in manifest["files"]]
+
+        if {"html_to_docx", "merged_html"} & set(stages):
+            prepare_inputs(corpus_files, workdir)
+
+        results = {}
+        for stage in stages:
+            if stage == "split" and not db_reachable(args):
+                results[stage] = {"ok": True, "skipped": True}
+                continue
+            logger.info(f"▶️ {stage} x{args.repeat}")
+            results[stage] = run_stage(stage, corpus_files, workdir, args.repeat, args.timeout)
+
+        report = {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.node(),
+            "corpus": {k: manifest[k] for k in ("spec", "sections", "images", "bytes")},
+            "stages": {k: v for k, v in results.items() if not v.get("skipped")},
+        }
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+        failed = [s for s, r in results.items() if not r["ok"]]
+        regressions, rows = [], []
+        if args.update_baseline:
+            if failed:
+                logger.error(f"❌ 存在失败阶段，不更新基线: {failed}")
+            else:
+                with open(args.baseline, "w", encoding="utf-8") as f:
+                    json.dump(report, f, ensure_ascii=False, indent=2)
+                logger.info(f"✅ 基线已更新: {args.baseline}")
+        elif args.report_only:
+            pass
+        elif os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            if baseline.get("corpus", {}).get("spec") != report["corpus"]["spec"]:
+                logger.error("❌ 语料参数与基线不一致，结果不可比较 (使用相同参数或 --update-baseline)")
+                print_results(results, [])
+                return 2
+            regressions, rows = compare_with_baseline(results, baseline, args)
+        else:
+            logger.error(f"❌ 基线文件不存在，无法进行回归检查: {args.baseline} "
+                         f"(先在基准机器上 --update-baseline，或使用 --report-only 只输出结果)")
+            print_results(results, [])
+            return 2
+
+        print_results(results, rows)
+        if failed:
+            logger.error(f"❌ 阶段执行失败: {failed}")
+            return 1
+        if regressions:
+            for item in regressions:
+                logger.error(f"❌ 性能回退 {item}")
+            return 1
+        return 0
+    finally:
+        if args.keep_workdir:
+            logger.info(f"工作目录保留: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
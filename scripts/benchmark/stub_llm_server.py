@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import logging
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+
+# ==========================================
+# 本地 OpenAI / Ollama 兼容的流式 LLM 桩服务
+# ==========================================
+# 用于离线压测，替代 192.168.3.10 上的 vLLM 与本地 Ollama：
+#   OpenAI:  GET /v1/models, POST /v1/chat/completions (stream / 非 stream / tool_calls)
+#   Ollama:  GET /api/tags,  POST /api/chat (NDJSON 流)
+# 输出节奏由 首 token 延迟 + 每 token 间隔 (+ 抖动) 控制，token 内容是固定的中文片段。
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class StubConfig:
+    ttft = float(os.getenv("STUB_TTFT", 0.2))                   # 首 token 延迟 (秒)
+    token_latency = float(os.getenv("STUB_TOKEN_LATENCY", 0.05))  # 每个 token 间隔 (秒)，大于 SSE 合并窗口 (30ms)
+    jitter = float(os.getenv("STUB_JITTER", 0.0))               # 间隔随机抖动比例 (0.2 = ±20%)
+    tokens = int(os.getenv("STUB_TOKENS", 200))                 # 每次回答的 token 数
+    # none: 从不调用工具；builtin: 返回 Kimi 内置 $web_search；web_search: 返回自定义 web_search (会触发真实联网搜索)
+    tool_mode = os.getenv("STUB_TOOL_MODE", "none")
+
+
+CONFIG = StubConfig()
+
+_VOCAB = ["根据", "材料", "分析", "，", "本次", "工作", "重点", "在于", "推进", "节能", "降碳", "。",
+          "一是", "加强", "统筹", "协调", "；", "二是", "完善", "制度", "建设", "\n"]
+
+app = FastAPI(title="Stub LLM Server")
+
+
+def _token(i):
+    return _VOCAB[i % len(_VOCAB)]
+
+
+async def _pace(first):
+    delay = CONFIG.ttft if first else CONFIG.token_latency
+    if CONFIG.jitter:
+        delay *= 1 + random.uniform(-CONFIG.jitter, CONFIG.jitter)
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+def _wants_tool_call(body):
+    """请求带了 tools 且对话中还没有工具结果时，按 tool_mode 返回一次工具调用"""
+    if CONFIG.tool_mode == "none" or not body.get("tools"):
+        return False
+    return not any(m.get("role") == "tool" for m in body.get("messages", []))
+
+
+def _tool_call():
+    name = "$web_search" if CONFIG.tool_mode == "builtin" else "web_search"
+    return {
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps({"query": "节能降碳 最新政策"}, ensure_ascii=False)},
+    }
+
+
+def _usage(prompt_messages):
+    prompt_tokens = sum(len(str(m.get("content") or "")) for m in prompt_messages) // 2
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": CONFIG.tokens,
+            "total_tokens": prompt_tokens + CONFIG.tokens}
+
+# ==========================================
+# 1. OpenAI 兼容接口
+# ==========================================
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "stub-model", "object": "model", "owned_by": "stub"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub-model")
+    messages = body.get("messages", [])
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    def chunk(delta, finish_reason=None):
+        return {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+    if _wants_tool_call(body):
+        call = _tool_call()
+        if body.get("stream"):
+            async def tool_stream():
+                await _pace(True)
+                delta = {"role": "assistant", "content": None, "tool_calls": [dict(call, index=0)]}
+                yield f"data: {json.dumps(chunk(delta), ensure_ascii=False)}\n\n"
+                yield f"data: {json.dumps(chunk({}, 'tool_calls'))}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(tool_stream(), media_type="text/event-stream")
+        await _pace(True)
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "finish_reason": "tool_calls",
+                         "message": {"role": "assistant", "content": None, "tool_calls": [call]}}],
+            "usage": _usage(messages),
+        })
+
+    if body.get("stream"):
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def content_stream():
+            yield f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}))}\n\n"
+            for i in range(CONFIG.tokens):
+                await _pace(i == 0)
+                yield f"data: {json.dumps(chunk({'content': _token(i)}), ensure_ascii=False)}\n\n"
+            yield f"data: {json.dumps(chunk({}, 'stop'))}\n\n"
+            if include_usage:
+                usage_chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                               "model": model, "choices": [], "usage": _usage(messages)}
+                yield f"data: {json.dumps(usage_chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(content_stream(), media_type="text/event-stream")
+
+    # 非流式 (标题生成、上下文摘要等)：一次性等待完整生成时间
+    await asyncio.sleep(CONFIG.ttft + CONFIG.token_latency * max(CONFIG.tokens - 1, 0))
+    return JSONResponse({
+        "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": "".join(_token(i) for i in range(CONFIG.tokens))}}],
+        "usage": _usage(messages),
+    })
+
+# ==========================================
+# 2. Ollama 兼容接口
+# ==========================================
+
+@app.get("/api/tags")
+async def ollama_tags():
+    return {"models": [{"name": "stub-model", "model": "stub-model", "size": 0}]}
+
+
+@app.post("/api/chat")
+async def ollama_chat(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub-model")
+    start = time.perf_counter_ns()
+
+    def message(content, done):
+        item = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "message": {"role": "assistant", "content": content}, "done": done}
+        if done:
+            item.update({"done_reason": "stop", "total_duration": time.perf_counter_ns() - start,
+                         "eval_count": CONFIG.tokens, "prompt_eval_count": 0})
+        return item
+
+    if body.get("stream", True):
+        async def ndjson_stream():
+            for i in range(CONFIG.tokens):
+                await _pace(i == 0)
+                yield json.dumps(message(_token(i), False), ensure_ascii=False) + "\n"
+            yield json.dumps(message("", True)) + "\n"
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+    await asyncio.sleep(CONFIG.ttft + CONFIG.token_latency * max(CONFIG.tokens - 1, 0))
+    return JSONResponse(message("".join(_token(i) for i in range(CONFIG.tokens)), True))
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='OpenAI/Ollama compatible stub LLM server for offline benchmarks.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18005)
+    parser.add_argument('--ttft', type=float, default=CONFIG.ttft, help='Seconds before the first token')
+    parser.add_argument('--token-latency', type=float, default=CONFIG.token_latency, help='Seconds between tokens')
+    parser.add_argument('--jitter', type=float, default=CONFIG.jitter, help='Relative random jitter, e.g. 0.2')
+    parser.add_argument('--tokens', type=int, default=CONFIG.tokens, help='Tokens per completion')
+    parser.add_argument('--tool-mode', choices=['none', 'builtin', 'web_search'], default=CONFIG.tool_mode)
+    args = parser.parse_args()
+
+    CONFIG.ttft = args.ttft
+    CONFIG.token_latency = args.token_latency
+    CONFIG.jitter = args.jitter
+    CONFIG.tokens = args.tokens
+    CONFIG.tool_mode = args.tool_mode
+    logger.info(f"Stub LLM on {args.host}:{args.port} | ttft={args.ttft}s token={args.token_latency}s "
+                f"tokens={args.tokens} tool_mode={args.tool_mode}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,72 @@
+import os
+import sys
+import logging
+import argparse
+from sqlalchemy import text
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Add paths to sys.path to import project modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir) # generate_report_test
+sys.path.append(project_root)
+
+try:
+    from utils.zzp.catalogue_cache import get_db_connection
+    from utils.deletion_reaper import ensure_tombstone_table
+except ImportError as e:
+    logger.error(f"Import failed: {e}")
+    logger.error(f"sys.path: {sys.path}")
+    sys.exit(1)
+
+
+def create(dry_run=True):
+    """
+    Create the deletion_tombstone table used by the background deletion reaper. Safe to re-run.
+    Nothing needs backfilling: deletions made before the table existed went through the
+    .trash/ directory sweep instead.
+    """
+    logger.info(f"Starting deletion_tombstone migration. Mode: {'DRY RUN' if dry_run else 'EXECUTE'}")
+
+    try:
+        engine = get_db_connection()
+        conn = engine.connect()
+    except Exception as e:
+        logger.error(f"Failed to connect to database: {e}")
+        return
+
+    try:
+        exists = conn.execute(text("SHOW TABLES LIKE 'deletion_tombstone'")).fetchone() is not None
+        logger.info(f"deletion_tombstone exists: {exists}")
+
+        if dry_run:
+            logger.info("Dry run completed. No DB changes committed.")
+            return
+
+        ensure_tombstone_table(conn)
+        conn.commit()
+        pending = conn.execute(text(
+            "SELECT COUNT(*) FROM deletion_tombstone WHERE status IN ('pending', 'running')"
+        )).scalar()
+        logger.info(f"Migration completed. {pending} tombstones waiting for the reaper.")
+
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error occurred during migration: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create the deletion_tombstone table.')
+    parser.add_argument('--execute', action='store_true', help='Write to the database (default is dry-run)')
+    args = parser.parse_args()
+
+    # Default is dry_run=True unless --execute is passed
+    create(dry_run=not args.execute)
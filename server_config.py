@@ -30,6 +30,13 @@ INFERRENCE_DIR = os.path.join(PROJECT_ROOT, "inferrence")
 MERGE_DIR = os.path.join(PROJECT_ROOT, "report_merge")
 EDITOR_IMAGE_DIR = os.path.join(PROJECT_ROOT, "editor_image")
 
+# 内容寻址存储 (章节副本、上传文件去重)
+# 放在各数据目录内部而不是单独目录：生产环境 report / inferrence 是独立挂载点，硬链接不能跨挂载点
+BLOB_STORE_DIRNAME = ".blobs"
+BLOB_STORE_ENABLED = os.getenv("BLOB_STORE_ENABLED", "1") == "1"
+# 待删除目录 (utils.deletion_reaper)：删除时先把报告/上传文件 rename 到所在数据目录的回收目录，后台再物理删除
+TRASH_DIRNAME = ".trash"
+
 # 确保关键目录存在
 def ensure_directories():
     for path in [REPORT_DIR, INFERRENCE_DIR, MERGE_DIR, EDITOR_IMAGE_DIR]:
@@ -0,0 +1,310 @@
+import os
+import sys
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+import server_config
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# 内容寻址存储 (Content-Addressed Blob Store)
+# ==========================================
+# 布局: <数据目录>/.blobs/<sha256 前两位>/<sha256>
+# 业务文件 (报告章节 docx、inferrence 上传文件) 是指向 blob 的硬链接，
+# 引用计数直接使用文件系统的链接数: st_nlink - 1 = 引用该内容的业务文件数。
+# 不维护额外的计数表，崩溃或手工删除文件后也不会出现计数漂移。
+#
+# 约束: 硬链接共享同一个 inode，原地写入会同时修改所有引用方。
+# 所有写业务文件的代码统一通过 atomic_write() / save_document()：先写同目录临时文件，再 os.replace 到目标路径，
+# 只替换目录项，从不修改已有的 inode。不要对报告目录、上传目录中的文件直接 open(path, "w"/"wb")。
+
+# 只对这些数据目录启用去重
+MANAGED_ROOTS = [server_config.REPORT_DIR, server_config.INFERRENCE_DIR]
+
+_HASH_CHUNK = 1024 * 1024
+# Linux FICLONE ioctl (btrfs / xfs reflink)
+_FICLONE = 0x40049409
+
+_digest_lock = threading.Lock()
+# (st_dev, st_ino, st_size, st_mtime_ns) -> sha256，避免反复复制同一模板时重复计算哈希
+_digest_cache = {}
+_DIGEST_CACHE_MAX = 10000
+
+
+def _store_root_for(path):
+    """返回 path 所在数据目录对应的 blob 目录，不受管理的路径返回 None"""
+    if not server_config.BLOB_STORE_ENABLED:
+        return None
+    return _managed_store_root(path)
+
+
+def _managed_store_root(path):
+    """同 _store_root_for，但不看开关 (关闭去重之前建立的硬链接仍需回收)"""
+    abs_path = os.path.abspath(path)
+    for root in MANAGED_ROOTS:
+        root = os.path.abspath(root)
+        if abs_path == root or abs_path.startswith(root + os.sep):
+            return os.path.join(root, server_config.BLOB_STORE_DIRNAME)
+    return None
+
+
+def _blob_path(store_root, digest):
+    return os.path.join(store_root, digest[:2], digest)
+
+
+def _file_digest(path):
+    st = os.stat(path)
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        digest = _digest_cache.get(key)
+    if digest:
+        return digest
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _digest_lock:
+        if len(_digest_cache) >= _DIGEST_CACHE_MAX:
+            _digest_cache.clear()
+        _digest_cache[key] = digest
+    return digest
+
+
+def _tmp_name(path):
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _reflink(src, dst):
+    """尝试 reflink (文件系统级写时复制)，不支持时返回 False"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def _link_replace(blob, target):
+    """把 target 原子地替换为 blob 的硬链接"""
+    tmp = _tmp_name(target)
+    os.link(blob, tmp)
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+
+def _ensure_blob(store_root, digest, source):
+    """blob 不存在时从 source 复制一份 (只在该内容第一次出现时发生)"""
+    blob = _blob_path(store_root, digest)
+    if os.path.exists(blob):
+        return blob
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    tmp = _tmp_name(blob)
+    shutil.copy2(source, tmp)
+    # 并发写入同一内容时后者覆盖前者，内容相同，无副作用
+    os.replace(tmp, blob)
+    return blob
+
+# ==========================================
+# 1. 写入: 复制 / 上传
+# ==========================================
+
+def link_file(source, target):
+    """
+    代替 shutil.copy2(source, target)。
+    target 位于受管理的数据目录时，链接到内容相同的 blob；
+    跨挂载点时尝试 reflink，都不可用时退回普通复制。
+    """
+    store_root = _store_root_for(target)
+    if store_root is None:
+        shutil.copy2(source, target)
+        return
+
+    try:
+        digest = _file_digest(source)
+        for _ in range(2):
+            blob = _ensure_blob(store_root, digest, source)
+            try:
+                _link_replace(blob, target)
+                return
+            except FileNotFoundError:
+                # blob 恰好被其他进程 GC，重新创建一次
+                continue
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.ENOTSUP):
+            raise
+        logger.debug(f"硬链接不可用，退回复制: {target} ({e})")
+
+    if not _reflink(source, target):
+        shutil.copy2(source, target)
+
+
+def adopt_file(path):
+    """
+    将已写入磁盘的文件 (如上传文件) 纳入 blob 存储。
+    内容已存在时，path 被替换为已有 blob 的硬链接，重复内容只占一份空间。
+    失败不影响调用方，文件保持为普通文件。
+    """
+    store_root = _store_root_for(path)
+    if store_root is None:
+        return
+    try:
+        digest = _file_digest(path)
+        blob = _blob_path(store_root, digest)
+        if os.path.exists(blob):
+            _link_replace(blob, path)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.link(path, blob)
+    except FileExistsError:
+        # 其他请求同时上传了相同内容，保持为普通文件即可
+        pass
+    except OSError as e:
+        logger.warning(f"文件纳入 blob 存储失败 (不影响使用): {path} ({e})")
+
+# ==========================================
+# 2. 覆盖写入
+# ==========================================
+
+@contextmanager
+def atomic_write(path):
+    """
+    写入 / 覆盖业务文件：在同目录临时文件上写，成功后 os.replace 到 path；失败时删除临时文件，原文件不变。
+    path 与 blob 或其他报告共享 inode 时，replace 只替换目录项，共享的 inode 不会被修改。
+    用法:
+        with atomic_write(path) as tmp:
+            doc.save(tmp)
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = _tmp_name(path)
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def save_document(doc, path):
+    """python-docx Document / docxcompose Composer 等带 save(path) 的对象写入业务文件"""
+    with atomic_write(path) as tmp:
+        doc.save(tmp)
+
+
+def write_text(path, content, encoding="utf-8"):
+    with atomic_write(path) as tmp:
+        with open(tmp, "w", encoding=encoding) as f:
+            f.write(content)
+
+# ==========================================
+# 3. 垃圾回收 (由删除回收线程调用)
+# ==========================================
+
+def released_blob(path, st):
+    """
+    删除业务文件之前调用 (st 为该文件的 lstat 结果)：
+    该文件是某个 blob 的最后一个业务引用 (st_nlink == 2，另一个链接就是 blob 本身) 时返回 blob 路径，否则返回 None。
+    只对这种文件计算哈希；还有其他引用的 blob 删除后仍被引用，不需要检查。
+    """
+    if st.st_nlink != 2:
+        return None
+    store_root = _managed_store_root(path)
+    if store_root is None:
+        return None
+    try:
+        blob = _blob_path(store_root, _file_digest(path))
+        blob_st = os.stat(blob)
+    except OSError:
+        return None
+    if (blob_st.st_dev, blob_st.st_ino) != (st.st_dev, st.st_ino):
+        return None
+    return blob
+
+
+def remove_file(path):
+    """删除业务文件；文件是某个 blob 的最后一个引用时顺带回收该 blob"""
+    st = os.lstat(path)
+    blob = released_blob(path, st)
+    os.remove(path)
+    if blob:
+        collect_blobs([blob])
+
+
+def collect_blobs(blobs):
+    """
+    删除已没有业务文件引用 (st_nlink == 1) 的 blob，只检查删除操作释放的 blob (released_blob 的返回值)。
+    :return: 回收的 blob 数量
+    """
+    # 与 link_file 并发时的两种情况都是安全的:
+    # GC 先删除 -> link_file 收到 FileNotFoundError 后重建 blob；
+    # link_file 先链接 -> 业务文件持有 inode，只是失去去重，不会丢数据
+    removed = 0
+    for blob in blobs:
+        try:
+            if os.stat(blob).st_nlink == 1:
+                os.remove(blob)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info(f"🧹 blob 存储回收 {removed} 个未引用文件")
+    return removed
+
+
+def collect_garbage(path=None):
+    """
+    全量扫描，删除没有任何业务文件引用 (st_nlink == 1) 的 blob。
+    删除流程只用 collect_blobs；这里供运维脚本兜底 (如多个线程同时删除同一 blob 的最后几个引用时漏掉的 blob)。
+    :param path: 只回收 path 所在数据目录的 blob 存储；为 None 时回收全部
+    :return: 回收的 blob 数量
+    """
+    if path is not None:
+        store_root = _managed_store_root(path)
+        store_roots = [store_root] if store_root else []
+    else:
+        store_roots = [os.path.join(root, server_config.BLOB_STORE_DIRNAME) for root in MANAGED_ROOTS]
+
+    removed = 0
+    for store_root in store_roots:
+        if not os.path.isdir(store_root):
+            continue
+        for shard in os.scandir(store_root):
+            if not shard.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(shard.path):
+                # 跳过正在写入的临时文件
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    if st.st_nlink == 1:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+    if removed:
+        logger.info(f"🧹 blob 存储回收 {removed} 个未引用文件")
+    return removed
@@ -2,21 +2,23 @@ import os
 import json
 import logging
 from langchain_core.messages import messages_to_dict, messages_from_dict
-from utils.redis_client import get_redis_client
+from utils.redis_client import get_redis_client, get_async_redis_client
+from utils.shared_state import redis_state_enabled
 
 logger = logging.getLogger(__name__)
 
 class ChatSessionManager:
     """
     Manages chat session persistence, switching between Redis and Memory.
+    同步方法供线程池中的同步生成器使用；async 生成器请使用 aget_session / aupdate_session，避免阻塞事件循环。
     """
     def __init__(self, session_type="chat_session"):
         self.memory_store = {}
         self.session_type = session_type
         self.redis_prefix = os.getenv("REDIS_PREFIX", "langextract")
         # Check specific feature flag first, then general enabled flag
-        self.redis_enabled = (os.getenv("REDIS_CHAT_SESSION_ENABLED", "0") == "1") and \
-                             (os.getenv("REDIS_ENABLED", "0") == "1")
+        # 多 worker 模式 (MULTI_WORKER=1) 下强制使用 Redis，同一会话的后续请求可能落到其他 worker
+        self.redis_enabled = redis_state_enabled("REDIS_CHAT_SESSION_ENABLED")
         self.ttl = 24 * 60 * 60 * 7 # 7 days
         self.env = os.getenv("ENV", "dev")
         
@@ -67,3 +69,29 @@ class ChatSessionManager:
                     logger.error(f"Redis set session failed: {e}")
         
         self.memory_store[task_id] = messages
+
+    async def aget_session(self, task_id):
+        if self.redis_enabled:
+            client = get_async_redis_client()
+            if client:
+                try:
+                    data = await client.get(self._get_key(task_id))
+                    if data:
+                        return messages_from_dict(json.loads(data))
+                except Exception as e:
+                    logger.error(f"Redis get session failed: {e}")
+
+        return self.memory_store.get(task_id, [])
+
+    async def aupdate_session(self, task_id, messages):
+        if self.redis_enabled:
+            client = get_async_redis_client()
+            if client:
+                try:
+                    payload = json.dumps(messages_to_dict(messages), ensure_ascii=False)
+                    await client.setex(self._get_key(task_id), self.ttl, payload)
+                    return
+                except Exception as e:
+                    logger.error(f"Redis set session failed: {e}")
+
+        self.memory_store[task_id] = messages
@@ -0,0 +1,533 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+import server_config
+from utils.blob_store import released_blob, collect_blobs
+from utils.zzp.catalogue_cache import get_db_connection
+from utils.metrics import (
+    DELETION_TOMBSTONES_PENDING, DELETION_ENTRIES_REMOVED, DELETION_REAP_SECONDS, DELETION_REAP_FAILURES
+)
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# 墓碑式异步删除 (报告 / 合并报告 / 上传文件)
+# ==========================================
+# 原来删除报告时在 MySQL 事务内 shutil.rmtree 报告目录和图片目录：大报告有上万个文件，
+# 整个 rmtree 期间一直持有 report_name 行锁，HTTP 请求也要等整棵目录树删完才返回。
+#
+# 现在删除分两段:
+#   1. 请求内: 删除事务中删除数据库行、登记一条墓碑 (tombstone)；事务提交之后再把待删路径 rename 到
+#      所在数据目录的 .trash/ (move_to_trash，同一挂载点内 rename 是 O(1))。事务回滚时磁盘上没有任何改动，
+#      不会把未删除报告的目录留在回收目录里。rename 之后原路径立即空出，同名报告可以马上重新创建。
+#   2. 后台回收线程: 认领墓碑，用有界线程池并行删除 .trash 下的目录树，按进度更新墓碑行，最后回收 blob。
+#
+# 崩溃恢复: 认领时写入 claim_token / claimed_at，删除过程中持续刷新 claimed_at (心跳)。
+# 进程退出后心跳停止，超过 DELETION_REAPER_LEASE_SECONDS 的 running 墓碑会被任一 worker 重新认领；
+# 删除是幂等的，已经删掉的部分直接跳过。多 worker 各自运行回收线程，靠 UPDATE ... LIMIT 认领，互不重复。
+#
+# 提交与 rename 之间的窗口: 墓碑同时记录原路径和回收目录路径。认领时回收目录路径还不存在、原路径仍在，
+# 说明还没移走 (rename 马上就会发生)，墓碑退回 pending 稍后再处理，不计入重试次数、也不会被标记为完成。
+# 登记超过 DELETION_REAPER_LEASE_SECONDS 仍未移走，说明提交后进程退出了，直接删除原路径；
+# 原路径在登记之后被修改过 (同名报告已重新创建并复用了该目录) 时不删除，只记录警告。
+#
+# 墓碑表不可用 (未迁移) 时仍然先 rename 到 .trash/，由回收线程扫描回收目录删除，只是没有进度记录。
+# 在回收目录里停留超过 DELETION_TRASH_GRACE_SECONDS 的条目 (墓碑多次失败等) 也由扫描兜底删除。
+# 回收目录里只会出现事务已提交的删除对象。
+TOMBSTONE_DDL = """
+CREATE TABLE IF NOT EXISTS `deletion_tombstone` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `kind` VARCHAR(32) NOT NULL COMMENT 'report / merged_report / upload',
+  `user_id` INT NULL COMMENT '被删除对象的所有者',
+  `label` VARCHAR(512) NULL COMMENT '被删除对象的名称 (日志、进度展示)',
+  `paths` TEXT NOT NULL COMMENT '待删路径 (JSON 数组，每项为 [原路径, 回收目录路径])',
+  `status` VARCHAR(16) NOT NULL DEFAULT 'pending' COMMENT 'pending / running / done / failed',
+  `paths_total` INT NOT NULL DEFAULT 0,
+  `paths_done` INT NOT NULL DEFAULT 0,
+  `removed_entries` INT NOT NULL DEFAULT 0 COMMENT '已删除的文件/目录数',
+  `attempts` INT NOT NULL DEFAULT 0,
+  `last_error` TEXT NULL,
+  `claim_token` VARCHAR(64) NULL,
+  `claimed_at` DATETIME NULL COMMENT '认领时间，删除过程中持续刷新 (心跳)',
+  `create_time` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `finish_time` DATETIME NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_status_claimed` (`status`, `claimed_at`),
+  KEY `idx_user` (`user_id`, `id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='待物理删除的报告/上传文件';
+"""
+
+KIND_REPORT = "report"
+KIND_MERGED_REPORT = "merged_report"
+KIND_UPLOAD = "upload"
+
+# 并行删除的线程数 (同时删除的目录树数量)
+DELETION_REAPER_WORKERS = int(os.getenv("DELETION_REAPER_WORKERS", 4))
+# 每次认领的墓碑数
+DELETION_REAPER_BATCH = int(os.getenv("DELETION_REAPER_BATCH", 16))
+# 轮询间隔 (秒)。本进程的删除请求会立即唤醒，轮询只负责其他 worker 登记的墓碑和崩溃恢复
+DELETION_REAPER_INTERVAL = int(os.getenv("DELETION_REAPER_INTERVAL", 30))
+# 认领租约 (秒)：心跳停止超过该时长的 running 墓碑会被重新认领
+DELETION_REAPER_LEASE_SECONDS = int(os.getenv("DELETION_REAPER_LEASE_SECONDS", 300))
+DELETION_REAPER_MAX_ATTEMPTS = int(os.getenv("DELETION_REAPER_MAX_ATTEMPTS", 5))
+DELETION_TRASH_GRACE_SECONDS = int(os.getenv("DELETION_TRASH_GRACE_SECONDS", 3600))
+# 每删除多少个条目刷新一次进度和心跳
+_PROGRESS_EVERY = 2000
+# 墓碑表不可用 (未迁移) 时，暂停使用的时间 (秒)
+_DISABLE_SECONDS = 60
+
+# 回收目录放在各数据目录内部：生产环境各数据目录是独立挂载点，rename 不能跨挂载点
+_DATA_ROOTS = [server_config.REPORT_DIR, server_config.INFERRENCE_DIR,
+               server_config.MERGE_DIR, server_config.EDITOR_IMAGE_DIR]
+
+# 回收目录条目名前缀：t = 已登记墓碑 (由墓碑驱动删除)，x = 墓碑表不可用时的条目 (由扫描删除)
+_PREFIX_TOMBSTONED = "t"
+_PREFIX_UNTRACKED = "x"
+
+_table_disabled_until = 0.0
+_wake = threading.Event()
+_start_lock = threading.Lock()
+_started = False
+
+
+def _table_usable():
+    return time.monotonic() >= _table_disabled_until
+
+
+def _disable_table(e):
+    global _table_disabled_until
+    _table_disabled_until = time.monotonic() + _DISABLE_SECONDS
+    logger.warning(f"⚠️ deletion_tombstone 不可用，{_DISABLE_SECONDS}s 内只按回收目录扫描删除: {e}")
+
+
+def ensure_tombstone_table(connection):
+    """创建墓碑表 (幂等)，供迁移脚本调用"""
+    connection.execute(text(TOMBSTONE_DDL))
+
+
+def _data_root_of(path):
+    abs_path = os.path.abspath(path)
+    for root in _DATA_ROOTS:
+        root = os.path.abspath(root)
+        if abs_path.startswith(root + os.sep):
+            return root
+    return None
+
+
+def _trash_dir(root):
+    return os.path.join(root, server_config.TRASH_DIRNAME)
+
+# ==========================================
+# 1. 登记 (删除请求内调用)
+# ==========================================
+
+def tombstone(connection, kind, paths, user_id=None, label=None):
+    """
+    在调用方的删除事务内、删除数据库行之后调用：登记墓碑，返回待执行的移动计划 [(原路径, 回收目录路径)]。
+    这里不改动磁盘。事务提交之后调用 move_to_trash(计划)；事务回滚时丢弃计划即可。
+    同一事务删除多个对象时，把每次返回的计划合并，提交后统一执行。
+    不存在的路径直接忽略；不在数据目录内的路径无法 rename，回收目录路径为 None，提交后当场删除。
+    """
+    existing = [p for p in dict.fromkeys(p for p in paths if p) if os.path.lexists(p)]
+    outside = [(path, None) for path in existing if _data_root_of(path) is None]
+    movable = [path for path in existing if _data_root_of(path) is not None]
+    if not movable:
+        return outside
+
+    token = uuid.uuid4().hex
+
+    def plan(prefix):
+        return [
+            (path, os.path.join(_trash_dir(_data_root_of(path)), f"{prefix}{token}-{i}"))
+            for i, path in enumerate(movable)
+        ]
+
+    tombstone_id = None
+    moves = plan(_PREFIX_TOMBSTONED)
+    if _table_usable():
+        try:
+            # 保存点：墓碑表不存在时只回滚这一句，不影响调用方的删除事务
+            with connection.begin_nested():
+                result = connection.execute(text("""
+                    INSERT INTO deletion_tombstone (kind, user_id, label, paths, paths_total)
+                    VALUES (:kind, :uid, :label, :paths, :total)
+                """), {
+                    "kind": kind,
+                    "uid": user_id,
+                    "label": (label or "")[:512],
+                    "paths": json.dumps([[path, target] for path, target in moves], ensure_ascii=False),
+                    "total": len(moves)
+                })
+            tombstone_id = result.lastrowid
+        except Exception as e:
+            _disable_table(e)
+    if tombstone_id is None:
+        moves = plan(_PREFIX_UNTRACKED)
+
+    logger.info(f"🪦 [删除] 已登记 {len(moves)} 个待删路径: {kind} {label or ''} (墓碑 {tombstone_id})")
+    return outside + moves
+
+
+def move_to_trash(moves):
+    """
+    删除事务提交后调用：按 tombstone() 返回的计划把路径移入回收目录，然后唤醒回收线程。
+    数据库记录已经删除，路径移不走 (或不在数据目录内) 时当场删除，不留下无主目录。
+    """
+    moved = 0
+    for path, target in moves:
+        try:
+            if target is not None:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.rename(path, target)
+                moved += 1
+                continue
+            logger.warning(f"⚠️ [删除] 路径不在数据目录内，直接删除: {path}")
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.error(f"❌ [删除] 移入回收目录失败，直接删除: {path} ({e})")
+        try:
+            _remove_path(path)
+        except OSError as e:
+            logger.error(f"❌ [删除] 删除失败，请手动处理: {path} ({e})")
+    if moved:
+        logger.info(f"🪦 [删除] 已移入回收目录 {moved} 个路径")
+    wake()
+
+
+def wake():
+    """唤醒回收线程立即开始处理 (否则等下一个轮询周期)"""
+    _wake.set()
+
+# ==========================================
+# 2. 物理删除
+# ==========================================
+
+def _unlink(path, blobs):
+    """删除单个文件/链接；文件是某个 blob 的最后一个引用时把 blob 路径加入 blobs (稍后回收)"""
+    try:
+        st = os.lstat(path)
+        blob = released_blob(path, st)
+        os.remove(path)
+    except FileNotFoundError:
+        return
+    if blob:
+        blobs.add(blob)
+
+
+def _remove_path(path, on_progress=None):
+    """
+    删除文件或目录树 (幂等，已删除的部分跳过)。
+    每删除 _PROGRESS_EVERY 个条目回调一次 on_progress(本批条目数)。
+    :return: (删除的条目数, 删除后不再被引用的 blob 路径集合)
+    """
+    blobs = set()
+    if not os.path.lexists(path):
+        return 0, blobs
+    if os.path.islink(path) or not os.path.isdir(path):
+        _unlink(path, blobs)
+        return 1, blobs
+
+    removed = unreported = 0
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames:
+            _unlink(os.path.join(dirpath, name), blobs)
+        for name in dirnames:
+            sub = os.path.join(dirpath, name)
+            try:
+                if os.path.islink(sub):
+                    os.remove(sub)
+                else:
+                    os.rmdir(sub)
+            except FileNotFoundError:
+                pass
+        count = len(filenames) + len(dirnames)
+        removed += count
+        unreported += count
+        if on_progress and unreported >= _PROGRESS_EVERY:
+            on_progress(unreported)
+            unreported = 0
+    try:
+        os.rmdir(path)
+        removed += 1
+        unreported += 1
+    except FileNotFoundError:
+        pass
+    if on_progress and unreported:
+        on_progress(unreported)
+    return removed, blobs
+
+# ==========================================
+# 3. 回收线程
+# ==========================================
+
+# 原路径尚未移入回收目录，墓碑稍后再处理
+_NOT_MOVED = object()
+
+
+def _target_of(item, created):
+    """
+    墓碑中一项待删路径实际要删除的路径。
+    item 为 [原路径, 回收目录路径] (旧格式只有回收目录路径字符串)，created 为墓碑登记时间 (unix 时间戳)。
+    :return: 要删除的路径；None 表示无需删除；_NOT_MOVED 表示还没移入回收目录
+    """
+    source, target = (None, item) if isinstance(item, str) else item
+    if os.path.lexists(target) or source is None:
+        return target
+    try:
+        st = os.lstat(source)
+    except FileNotFoundError:
+        # 两处都不存在：已经删除
+        return None
+    if time.time() - created < DELETION_REAPER_LEASE_SECONDS:
+        return _NOT_MOVED
+    # create_time 只精确到秒
+    if st.st_mtime > created + 1:
+        logger.warning(f"⚠️ [删除] 原路径在删除登记后被修改过 (可能已被新报告复用)，不删除: {source}")
+        return None
+    logger.warning(f"⚠️ [删除] 删除登记后未移入回收目录 (进程可能已退出)，直接删除原路径: {source}")
+    return source
+
+
+_CLAIM_SQL = """
+    UPDATE deletion_tombstone
+    SET status = 'running', claim_token = :token, claimed_at = NOW(),
+        attempts = attempts + 1, paths_done = 0
+    WHERE status = 'pending'
+       OR (status = 'running' AND claimed_at < NOW() - INTERVAL :lease SECOND)
+    ORDER BY id
+    LIMIT :limit
+"""
+
+
+def _heartbeat(tombstone_id, token, removed=0, path_done=False):
+    """刷新进度和心跳；被其他 worker 重新认领后 (claim_token 变化) 不再写入"""
+    try:
+        with get_db_connection().begin() as conn:
+            conn.execute(text("""
+                UPDATE deletion_tombstone
+                SET removed_entries = removed_entries + :removed,
+                    paths_done = paths_done + :done,
+                    claimed_at = NOW()
+                WHERE id = :id AND claim_token = :token
+            """), {"removed": removed, "done": 1 if path_done else 0, "id": tombstone_id, "token": token})
+    except Exception as e:
+        logger.warning(f"⚠️ [删除] 更新墓碑进度失败 (墓碑 {tombstone_id}): {e}")
+
+
+def _reap_tombstones(pool, released):
+    """认领一批墓碑并删除，返回实际处理的数量 (不含尚未移入回收目录、退回 pending 的墓碑)"""
+    token = uuid.uuid4().hex
+    with get_db_connection().begin() as conn:
+        conn.execute(text(_CLAIM_SQL), {
+            "token": token, "lease": DELETION_REAPER_LEASE_SECONDS, "limit": DELETION_REAPER_BATCH
+        })
+        rows = conn.execute(text("""
+            SELECT id, kind, paths, label, UNIX_TIMESTAMP(create_time)
+            FROM deletion_tombstone
+            WHERE claim_token = :token AND status = 'running'
+        """), {"token": token}).fetchall()
+    if not rows:
+        return 0
+
+    def remove(tombstone_id, path):
+        removed, blobs = (0, set()) if path is None else _remove_path(
+            path, on_progress=lambda n: _heartbeat(tombstone_id, token, removed=n)
+        )
+        _heartbeat(tombstone_id, token, path_done=True)
+        return removed, blobs
+
+    futures = []
+    deferred = []
+    for row in rows:
+        created = float(row[4]) if row[4] is not None else 0.0
+        targets = [_target_of(item, created) for item in json.loads(row[2] or "[]")]
+        if any(target is _NOT_MOVED for target in targets):
+            deferred.append(row[0])
+            continue
+        futures.append((row, [pool.submit(remove, row[0], target) for target in targets]))
+
+    if deferred:
+        # 删除事务已提交、rename 还没完成：退回 pending，不计入重试次数 (move_to_trash 完成后会唤醒回收线程)
+        with get_db_connection().begin() as conn:
+            for tombstone_id in deferred:
+                conn.execute(text("""
+                    UPDATE deletion_tombstone
+                    SET status = 'pending', attempts = attempts - 1, claim_token = NULL
+                    WHERE id = :id AND claim_token = :token
+                """), {"id": tombstone_id, "token": token})
+
+    for row, jobs in futures:
+        tombstone_id, kind, label = row[0], row[1], row[3]
+        removed_total = 0
+        errors = []
+        for job in jobs:
+            try:
+                removed, blobs = job.result()
+                removed_total += removed
+                released |= blobs
+            except Exception as e:
+                errors.append(str(e))
+
+        DELETION_ENTRIES_REMOVED.inc(removed_total, kind=kind)
+        with get_db_connection().begin() as conn:
+            if errors:
+                DELETION_REAP_FAILURES.inc(kind=kind)
+                logger.warning(f"⚠️ [删除] 墓碑 {tombstone_id} ({kind} {label}) 删除失败，稍后重试: {errors[0]}")
+                conn.execute(text("""
+                    UPDATE deletion_tombstone
+                    SET status = IF(attempts >= :max_attempts, 'failed', 'pending'),
+                        last_error = :error, claim_token = NULL
+                    WHERE id = :id AND claim_token = :token
+                """), {
+                    "max_attempts": DELETION_REAPER_MAX_ATTEMPTS, "error": "; ".join(errors)[:4000],
+                    "id": tombstone_id, "token": token
+                })
+            else:
+                conn.execute(text("""
+                    UPDATE deletion_tombstone
+                    SET status = 'done', finish_time = NOW(), last_error = NULL, claim_token = NULL
+                    WHERE id = :id AND claim_token = :token
+                """), {"id": tombstone_id, "token": token})
+                if row[4] is not None:
+                    DELETION_REAP_SECONDS.observe(max(0.0, time.time() - float(row[4])), kind=kind)
+                logger.info(f"🧹 [删除] 墓碑 {tombstone_id} 完成: {kind} {label} (删除 {removed_total} 个条目)")
+    # 退回的墓碑不计入：否则未移走的墓碑凑满一批时回收线程会空转
+    return len(futures)
+
+
+def _sweep_trash(pool, released):
+    """删除回收目录中无人负责的条目：未登记墓碑的、超过宽限期的、墓碑表不可用时的全部条目"""
+    now = time.time()
+    table_usable = _table_usable()
+    targets = []
+    for root in _DATA_ROOTS:
+        try:
+            entries = list(os.scandir(_trash_dir(root)))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                # rename 会更新 ctime，可以作为移入回收目录的时间
+                age = now - entry.stat(follow_symlinks=False).st_ctime
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith(_PREFIX_UNTRACKED) or age > DELETION_TRASH_GRACE_SECONDS or not table_usable:
+                targets.append((root, entry.path))
+
+    swept = 0
+    for (root, path), job in [(t, pool.submit(_remove_path, t[1])) for t in targets]:
+        try:
+            removed, blobs = job.result()
+        except Exception as e:
+            logger.warning(f"⚠️ [删除] 清理回收目录失败: {path} ({e})")
+            continue
+        swept += 1
+        released |= blobs
+        DELETION_ENTRIES_REMOVED.inc(removed, kind="trash")
+    if swept:
+        logger.info(f"🧹 [删除] 回收目录扫描清理 {swept} 个条目")
+    return swept
+
+
+def _refresh_pending_gauge():
+    with get_db_connection().connect() as conn:
+        pending = conn.execute(text(
+            "SELECT COUNT(*) FROM deletion_tombstone WHERE status IN ('pending', 'running')"
+        )).scalar()
+    DELETION_TOMBSTONES_PENDING.set(pending or 0)
+
+
+def reap_once():
+    """
+    处理一批墓碑，然后扫描回收目录兜底，最后回收不再被引用的 blob。
+    :return: 本次认领的墓碑数 (等于批大小时说明可能还有积压)
+    """
+    released = set()
+    claimed = 0
+    with ThreadPoolExecutor(max_workers=DELETION_REAPER_WORKERS, thread_name_prefix="deletion-reaper") as pool:
+        if _table_usable():
+            try:
+                claimed = _reap_tombstones(pool, released)
+                _refresh_pending_gauge()
+            except Exception as e:
+                _disable_table(e)
+        _sweep_trash(pool, released)
+
+    # 只检查本次删除释放的 blob，不扫描整个 blob 存储
+    if released:
+        try:
+            collect_blobs(released)
+        except Exception as e:
+            logger.warning(f"⚠️ [blob 回收异常] {e}")
+    return claimed
+
+
+def _run():
+    while True:
+        try:
+            while reap_once() >= DELETION_REAPER_BATCH:
+                pass
+        except Exception as e:
+            logger.error(f"❌ [删除] 回收线程异常: {e}", exc_info=True)
+        _wake.wait(DELETION_REAPER_INTERVAL)
+        _wake.clear()
+
+
+def start_reaper():
+    """启动回收线程 (应用 lifespan 启动阶段调用，重复调用无副作用)。启动后立即处理一次，恢复上次退出时未完成的墓碑"""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_run, name="deletion-reaper", daemon=True).start()
+    logger.info(f"🧹 后台删除线程已启动 (并行 {DELETION_REAPER_WORKERS})")
+
+# ==========================================
+# 4. 进度查询
+# ==========================================
+
+def get_tombstones(user_id, limit=50):
+    """用户最近的删除任务及进度 (墓碑表不可用时返回空列表)"""
+    if not _table_usable():
+        return []
+    try:
+        with get_db_connection().connect() as conn:
+            rows = conn.execute(text("""
+                SELECT id, kind, label, status, paths_total, paths_done, removed_entries,
+                       attempts, last_error, create_time, finish_time
+                FROM deletion_tombstone
+                WHERE user_id = :uid
+                ORDER BY id DESC
+                LIMIT :limit
+            """), {"uid": user_id, "limit": limit}).fetchall()
+    except Exception as e:
+        _disable_table(e)
+        return []
+    return [
+        {
+            "id": row[0],
+            "kind": row[1],
+            "label": row[2],
+            "status": row[3],
+            "paths_total": row[4],
+            "paths_done": row[5],
+            "removed_entries": row[6],
+            "attempts": row[7],
+            "last_error": row[8],
+            "create_time": row[9].strftime("%Y-%m-%d %H:%M:%S") if row[9] else None,
+            "finish_time": row[10].strftime("%Y-%m-%d %H:%M:%S") if row[10] else None,
+        }
+        for row in rows
+    ]
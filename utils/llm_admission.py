@@ -0,0 +1,331 @@
+import os
+import time
+import asyncio
+import itertools
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from urllib.parse import urlparse
+
+from utils.metrics import LLM_ADMISSION_WAITING, LLM_ADMISSION_ACTIVE, LLM_ADMISSION_WAIT, LLM_ADMISSION_REJECTED
+from utils.shared_state import redis_state_enabled, get_semaphore, get_async_semaphore
+from utils.sse import event, park, client_disconnected, ClientDisconnected
+from utils.llm_router import url_of
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# LLM 准入控制 (所有模型调用的统一入口)
+# ==========================================
+# 每个模型后端 (按 base_url 的 host:port 区分) 一个并发上限，超出的请求排队，出队顺序:
+#   1. 优先级: 交互对话/联网搜索 > 章节生成/文本润色 > 摘要/标题/上下文压缩等后台调用
+#      排队每满 LLM_PRIORITY_AGING_SECONDS 秒提升一级，低优先级请求不会被无限饿死。
+#   2. 同一优先级内按用户做加权公平排队 (start-time fair queuing)：
+#      每个请求的虚拟完成时间 = max(后端虚拟时间, 该用户上一个请求的虚拟完成时间) + 1/weight，
+#      某个用户一次提交 50 个摘要，只会排在自己的请求后面，其他用户的请求照常轮转。
+# 排队期间调用方可以拿到实时排队位置，流式接口以 SSE 事件 "event: queue" 推送给前端。
+#
+# 多 worker 模式 (MULTI_WORKER=1): 公平排队在每个 worker 内进行；出队后再获取同名 Redis 信号量，
+# 保证后端并发上限对整个服务生效。
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+# "192.168.3.10:8000=16,localhost:11434=2"
+LLM_BACKEND_LIMITS = os.getenv("LLM_BACKEND_LIMITS", "")
+LLM_PRIORITY_AGING_SECONDS = float(os.getenv("LLM_PRIORITY_AGING_SECONDS", 30))
+# 最长排队时间 (秒)，超时抛出 AdmissionTimeout
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 300))
+# 排队位置刷新间隔 (秒)
+LLM_QUEUE_POLL_SECONDS = float(os.getenv("LLM_QUEUE_POLL_SECONDS", 1.0))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DRAFTING = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_DRAFTING: "drafting", PRIORITY_BACKGROUND: "background"}
+
+
+class AdmissionTimeout(TimeoutError):
+    pass
+
+
+def _parse_limits(value):
+    limits = {}
+    for item in value.split(","):
+        name, _, raw = item.partition("=")
+        if name.strip() and raw.strip().isdigit():
+            limits[name.strip()] = int(raw.strip())
+    return limits
+
+
+_limits = _parse_limits(LLM_BACKEND_LIMITS)
+
+
+def backend_of(target):
+    """
+    后端标识 (host:port)。
+    target 可以是 base_url 字符串，或 AsyncOpenAI / OpenAI / ChatOpenAI / ChatOllama 实例。
+    配置了多副本 (utils.llm_router) 时为逻辑后端，整个副本池共用一个上限。
+    """
+    url = url_of(target)
+    if not url:
+        return "default"
+    parsed = urlparse(str(url))
+    return parsed.netloc or str(url)
+
+
+class QueueUpdate:
+    """排队位置通知，由流式生成器透传给接口层转成 SSE 事件"""
+
+    def __init__(self, position, priority):
+        self.position = position
+        self.priority = priority
+
+    def sse(self):
+        payload = {"queue_position": self.position, "priority": PRIORITY_NAMES.get(self.priority, self.priority)}
+        return event(payload, "queue")
+
+
+class _Backend:
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.waiting = []
+        self.virtual_time = 0.0
+        # 用户 -> 最近一个请求的虚拟完成时间
+        self.user_finish = {}
+
+
+class Ticket:
+    """一次准入申请；release() 可重复调用，排队中调用即取消"""
+
+    def __init__(self, controller, backend, priority, user, weight):
+        self.controller = controller
+        self.backend = backend
+        self.priority = priority
+        self.user = user
+        self.weight = max(weight, 0.01)
+        self.seq = 0
+        self.tag = 0.0
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.released = False
+        self._event = threading.Event()
+        # asyncio 等待方: 出队时通过 call_soon_threadsafe 唤醒
+        self._loop = None
+        self._aevent = None
+        # 多 worker 模式下获得的 Redis 信号量名额: (信号量, lease token)
+        self._global = None
+
+    # ---------- 同步 (线程) ----------
+
+    def wait(self):
+        """
+        阻塞等待出队，期间每当排队位置变化 yield 一次位置 (>=1)；立即获得名额时不 yield。
+        用法: for position in ticket.wait(): yield QueueUpdate(...)
+        在 sse_response 驱动的同步生成器中，第一次 yield 之后由事件循环代为等待 (apark)，
+        排队期间不占用线程池线程；恢复执行时通常已经出队。
+        """
+        deadline = self.enqueued_at + LLM_QUEUE_TIMEOUT
+        last = None
+        while not self._event.wait(LLM_QUEUE_POLL_SECONDS if last is not None else 0):
+            if time.monotonic() >= deadline:
+                self._timeout()
+            if client_disconnected():
+                self._abandon()
+            position = self.controller.position(self)
+            if position and position != last:
+                if last is None:
+                    park(self)
+                last = position
+                yield position
+        self._acquire_global(deadline)
+
+    def updates(self):
+        """wait() 的便捷形式，直接产生 QueueUpdate"""
+        for position in self.wait():
+            yield QueueUpdate(position, self.priority)
+
+    # ---------- asyncio ----------
+
+    async def await_turn(self):
+        """wait() 的 asyncio 版本 (async for position in ticket.await_turn())"""
+        deadline = self.enqueued_at + LLM_QUEUE_TIMEOUT
+        last = None
+        while not self._event.is_set():
+            if time.monotonic() >= deadline:
+                self._timeout()
+            position = self.controller.position(self)
+            if position and position != last:
+                last = position
+                yield position
+            await self.controller._async_wait(self, LLM_QUEUE_POLL_SECONDS)
+        await self._aacquire_global(deadline)
+
+    async def aupdates(self):
+        async for position in self.await_turn():
+            yield QueueUpdate(position, self.priority)
+
+    async def apark(self):
+        """
+        sse_response 代替同步 wait() 在事件循环上等待出队 (见 utils.sse.park)。
+        产生排队位置变化的 SSE 帧，没有变化时产生 None；出队、取消或超时后结束 (超时由 wait() 恢复后抛出)。
+        """
+        deadline = self.enqueued_at + LLM_QUEUE_TIMEOUT
+        last = self.controller.position(self)
+        while not self._event.is_set() and not self.released:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await self.controller._async_wait(self, min(LLM_QUEUE_POLL_SECONDS, remaining))
+            position = self.controller.position(self)
+            if position and position != last:
+                last = position
+                yield QueueUpdate(position, self.priority).sse()
+            else:
+                yield None
+
+    # ---------- 内部 ----------
+
+    def _timeout(self):
+        self.release()
+        LLM_ADMISSION_REJECTED.inc(backend=self.backend.name, priority=PRIORITY_NAMES[self.priority])
+        raise AdmissionTimeout(f"LLM 请求排队超过 {LLM_QUEUE_TIMEOUT:.0f}s ({self.backend.name})")
+
+    def _abandon(self):
+        # 流式请求的客户端在排队期间断开：退出排队，不再调用模型
+        self.release()
+        raise ClientDisconnected(f"客户端已断开，取消排队 ({self.backend.name})")
+
+    # 出队后获取 Redis 信号量，与排队共用同一个截止时间
+
+    def _acquire_global(self, deadline):
+        if self.controller.distributed:
+            semaphore = get_semaphore(f"llm:{self.backend.name}", self.backend.limit)
+            lease = semaphore.acquire(timeout=max(deadline - time.monotonic(), 0))
+            if not lease:
+                self._timeout()
+            self._global = (semaphore, lease)
+
+    async def _aacquire_global(self, deadline):
+        if self.controller.distributed:
+            semaphore = get_async_semaphore(f"llm:{self.backend.name}", self.backend.limit)
+            lease = await semaphore.acquire(timeout=max(deadline - time.monotonic(), 0))
+            if not lease:
+                self._timeout()
+            self._global = (semaphore, lease)
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        if self._global is not None:
+            semaphore, lease = self._global
+            self._global = None
+            semaphore.release(lease)
+        self.controller._release(self)
+
+
+class AdmissionController:
+    def __init__(self, default_limit=LLM_MAX_CONCURRENCY, limits=None):
+        self.default_limit = default_limit
+        self.limits = limits if limits is not None else _limits
+        self.distributed = redis_state_enabled("REDIS_SEMAPHORE_ENABLED")
+        self._lock = threading.Lock()
+        self._backends = {}
+        self._seq = itertools.count()
+
+    def _backend(self, name):
+        backend = self._backends.get(name)
+        if backend is None:
+            backend = self._backends[name] = _Backend(name, self.limits.get(name, self.default_limit))
+            LLM_ADMISSION_WAITING.set_function(lambda b=backend: len(b.waiting), backend=name)
+            LLM_ADMISSION_ACTIVE.set_function(lambda b=backend: b.active, backend=name)
+        return backend
+
+    def request(self, target, priority=PRIORITY_INTERACTIVE, user=None, weight=1.0):
+        """申请一个名额 (立即返回 Ticket)；调用方必须在 finally 中 ticket.release()"""
+        with self._lock:
+            backend = self._backend(backend_of(target))
+            ticket = Ticket(self, backend, priority, user if user is not None else "anonymous", weight)
+            ticket.seq = next(self._seq)
+            start = max(backend.virtual_time, backend.user_finish.get(ticket.user, 0.0))
+            ticket.tag = start + 1.0 / ticket.weight
+            backend.user_finish[ticket.user] = ticket.tag
+            backend.waiting.append(ticket)
+            self._dispatch(backend)
+        return ticket
+
+    def _rank(self, ticket, now):
+        aged = int((now - ticket.enqueued_at) / LLM_PRIORITY_AGING_SECONDS) if LLM_PRIORITY_AGING_SECONDS > 0 else 0
+        return (max(ticket.priority - aged, 0), ticket.tag, ticket.seq)
+
+    def _dispatch(self, backend):
+        # 调用方持有 self._lock
+        now = time.monotonic()
+        while backend.active < backend.limit and backend.waiting:
+            ticket = min(backend.waiting, key=lambda t: self._rank(t, now))
+            backend.waiting.remove(ticket)
+            backend.active += 1
+            backend.virtual_time = max(backend.virtual_time, ticket.tag - 1.0 / ticket.weight)
+            ticket.granted = True
+            ticket._event.set()
+            if ticket._loop is not None:
+                ticket._loop.call_soon_threadsafe(ticket._aevent.set)
+            LLM_ADMISSION_WAIT.observe(now - ticket.enqueued_at, priority=PRIORITY_NAMES[ticket.priority])
+        if len(backend.user_finish) > 1000:
+            backend.user_finish = {u: f for u, f in backend.user_finish.items() if f > backend.virtual_time}
+
+    def _release(self, ticket):
+        with self._lock:
+            backend = ticket.backend
+            if ticket.granted:
+                backend.active -= 1
+            elif ticket in backend.waiting:
+                backend.waiting.remove(ticket)
+            self._dispatch(backend)
+
+    def position(self, ticket):
+        """排队位置 (1 表示下一个出队)；已获得名额返回 0"""
+        with self._lock:
+            if ticket.granted:
+                return 0
+            now = time.monotonic()
+            rank = self._rank(ticket, now)
+            return 1 + sum(1 for t in ticket.backend.waiting if t is not ticket and self._rank(t, now) < rank)
+
+    async def _async_wait(self, ticket, timeout):
+        if ticket._aevent is None:
+            with self._lock:
+                ticket._loop = asyncio.get_running_loop()
+                ticket._aevent = asyncio.Event()
+                if ticket.granted:
+                    ticket._aevent.set()
+        try:
+            await asyncio.wait_for(ticket._aevent.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    # ---------- 非流式调用 ----------
+
+    @contextmanager
+    def slot(self, target, priority=PRIORITY_INTERACTIVE, user=None, weight=1.0):
+        ticket = self.request(target, priority, user, weight)
+        try:
+            for _ in ticket.wait():
+                pass
+            yield ticket
+        finally:
+            ticket.release()
+
+    @asynccontextmanager
+    async def aslot(self, target, priority=PRIORITY_INTERACTIVE, user=None, weight=1.0):
+        ticket = self.request(target, priority, user, weight)
+        try:
+            async for _ in ticket.await_turn():
+                pass
+            yield ticket
+        finally:
+            ticket.release()
+
+
+llm_admission = AdmissionController()
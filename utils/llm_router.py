@@ -0,0 +1,480 @@
+import os
+import time
+import random
+import inspect
+import asyncio
+import logging
+import threading
+from urllib.parse import urlparse
+
+import httpx
+
+from utils.metrics import (
+    LLM_ENDPOINT_UP, LLM_ENDPOINT_OUTSTANDING, LLM_ENDPOINT_LATENCY, LLM_ROUTER_FAILOVERS, LLM_CIRCUIT_OPENS,
+)
+
+try:
+    import openai
+except ImportError:
+    openai = None
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# LLM 多副本路由
+# ==========================================
+# llm_config 每行只有一个 base_url，而同一个模型实际部署了多个 vLLM / Ollama 副本。
+# 现在把 base_url 的 host:port 视为逻辑后端 (与 llm_admission 的后端标识一致)，由 LLM_ROUTER_POOLS
+# 映射到一组副本，每次调用时再选定副本并改写 base_url 的 host:port:
+#   1. 选择: 评分 = (进行中请求数 + 1) × 首个分片延迟的 EWMA，取最小；没有延迟样本的副本优先 (先探索)。
+#   2. 健康检查: 后台线程每 LLM_ROUTER_PROBE_SECONDS 秒依次请求各副本的 LLM_ROUTER_PROBE_PATH，
+#      任一路径返回 2xx 即在线；连接失败或都不是 2xx 的副本不参与选择。
+#   3. 熔断: 连续 LLM_ROUTER_FAILURE_THRESHOLD 次可重试错误后熔断 LLM_ROUTER_OPEN_SECONDS 秒；
+#      到期后放行一个试探请求 (半开)，成功即恢复，失败继续熔断。
+#      429 说明副本在线但已满载：按 Retry-After (缺省 LLM_ROUTER_THROTTLE_SECONDS) 暂停分配，不计入熔断。
+#   4. 故障转移: 首个分片返回之前遇到可重试错误 (连接失败、超时、408/429/5xx) 时换一个副本重试，
+#      调用方无感知；已经输出分片后不再重试 (否则前端会收到重复内容)。
+# 未配置副本的后端 (在线 API 等) 原样直连，不经过任何选择逻辑。
+# 状态在每个 worker 进程内维护，多 worker 模式下各自探测、各自计数。
+#
+# 准入控制 (llm_admission) 仍按逻辑后端排队：一个副本池共用一个并发上限，应在 LLM_BACKEND_LIMITS 中
+# 配置为各副本承载能力之和；出队后再由本模块选副本，用的是出队时刻的负载。
+
+# "192.168.3.10:8000=192.168.3.10:8000,192.168.3.11:8000;localhost:11434=localhost:11434,192.168.3.20:11434"
+LLM_ROUTER_POOLS = os.getenv("LLM_ROUTER_POOLS", "")
+# 健康检查间隔 (秒)，0 表示关闭
+LLM_ROUTER_PROBE_SECONDS = float(os.getenv("LLM_ROUTER_PROBE_SECONDS", 10))
+LLM_ROUTER_PROBE_TIMEOUT = float(os.getenv("LLM_ROUTER_PROBE_TIMEOUT", 2))
+# 健康检查路径，逗号分隔依次尝试，任一返回 2xx 即在线：vLLM 提供 /health，Ollama 提供 /api/version
+LLM_ROUTER_PROBE_PATH = os.getenv("LLM_ROUTER_PROBE_PATH", "/health,/api/version")
+LLM_ROUTER_FAILURE_THRESHOLD = int(os.getenv("LLM_ROUTER_FAILURE_THRESHOLD", 3))
+LLM_ROUTER_OPEN_SECONDS = float(os.getenv("LLM_ROUTER_OPEN_SECONDS", 30))
+# 副本返回 429 且没有 Retry-After 时暂停分配的时长 (秒)
+LLM_ROUTER_THROTTLE_SECONDS = float(os.getenv("LLM_ROUTER_THROTTLE_SECONDS", 5))
+# 一次调用最多尝试的副本数
+LLM_ROUTER_MAX_ATTEMPTS = int(os.getenv("LLM_ROUTER_MAX_ATTEMPTS", 3))
+
+# 本地 Ollama 默认地址 (llm_config 未配置 base_url、或找不到模型配置时使用)
+LOCAL_OLLAMA_URL = os.getenv("LOCAL_OLLAMA_URL", "http://localhost:11434")
+
+_EWMA_ALPHA = 0.3
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def _parse_pools(value):
+    pools = {}
+    for item in value.split(";"):
+        name, _, raw = item.partition("=")
+        endpoints = [e.strip() for e in raw.split(",") if e.strip()]
+        if name.strip() and endpoints:
+            pools[name.strip()] = endpoints
+    return pools
+
+
+def url_of(target):
+    """
+    base_url 字符串。
+    target 可以是 base_url 字符串，或 AsyncOpenAI / OpenAI / ChatOpenAI / ChatOllama 实例。
+    """
+    if target is None or isinstance(target, str):
+        return target
+    url = getattr(target, "base_url", None) or getattr(target, "openai_api_base", None)
+    return str(url) if url else None
+
+
+def client_at(client, url):
+    """OpenAI / AsyncOpenAI 客户端改指向另一个副本 (with_options 复制出的客户端共用同一个连接池)"""
+    if url == url_of(client):
+        return client
+    return client.with_options(base_url=url)
+
+
+def _status_of(e):
+    status = getattr(e, "status_code", None)
+    if status is None:
+        status = getattr(getattr(e, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(e):
+    """429 响应的 Retry-After (秒)，缺失或不是数字时返回 LLM_ROUTER_THROTTLE_SECONDS"""
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return max(float(headers.get("retry-after")), 0.0)
+    except (TypeError, ValueError):
+        return LLM_ROUTER_THROTTLE_SECONDS
+
+
+def is_retryable(e):
+    """连接失败、超时、服务过载 (408/429/5xx) 可以换副本重试；参数错误、鉴权失败等换副本也不会成功"""
+    if isinstance(e, (ConnectionError, TimeoutError, httpx.TransportError)):
+        return True
+    if openai is not None and isinstance(e, openai.APIConnectionError):
+        return True
+    return _status_of(e) in _RETRYABLE_STATUS
+
+
+def _close(source):
+    close = getattr(source, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception as e:
+        logger.debug(f"关闭 LLM 流失败: {e}")
+
+
+async def _aclose(source):
+    close = getattr(source, "aclose", None) or getattr(source, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        logger.debug(f"关闭 LLM 流失败: {e}")
+
+
+class _Endpoint:
+    def __init__(self, pool, address):
+        parsed = urlparse(address if "://" in address else f"//{address}")
+        self.pool = pool
+        self.scheme = parsed.scheme or None
+        self.netloc = parsed.netloc
+        self.healthy = True
+        self.outstanding = 0
+        # 首个分片延迟的 EWMA (秒)，None 表示还没有样本
+        self.latency = None
+        self.failures = 0
+        # 熔断截止时间：0 为闭合；未到期为断开；已到期为半开
+        self.open_until = 0.0
+        # 半开状态下是否已放行试探请求
+        self.trial = False
+        # 429 限流截止时间：未到期前不分配请求，但不算故障
+        self.throttled_until = 0.0
+        # 上次探测成功的路径，下次优先尝试
+        self.probe_path = None
+
+    def url(self, base_url):
+        parsed = urlparse(base_url)
+        return parsed._replace(scheme=self.scheme or parsed.scheme, netloc=self.netloc).geturl()
+
+    def state(self, now):
+        if not self.open_until:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+    def available(self, now):
+        state = self.state(now)
+        return (self.healthy and now >= self.throttled_until
+                and (state == "closed" or (state == "half_open" and not self.trial)))
+
+    def up(self):
+        return 1 if self.healthy and self.state(time.monotonic()) != "open" else 0
+
+    def score(self):
+        return (self.outstanding + 1) * (self.latency or 0.0)
+
+
+class LLMRouter:
+    def __init__(self, pools=None):
+        self._lock = threading.Lock()
+        self._started = False
+        self.pools = {}
+        for name, addresses in (pools if pools is not None else _parse_pools(LLM_ROUTER_POOLS)).items():
+            endpoints = self.pools[name] = [_Endpoint(name, address) for address in addresses]
+            for ep in endpoints:
+                LLM_ENDPOINT_UP.set_function(ep.up, pool=name, endpoint=ep.netloc)
+                LLM_ENDPOINT_OUTSTANDING.set_function(lambda e=ep: e.outstanding, endpoint=ep.netloc)
+                LLM_ENDPOINT_LATENCY.set_function(lambda e=ep: e.latency or 0.0, endpoint=ep.netloc)
+
+    def _route(self, target):
+        base_url = url_of(target)
+        if not base_url or not self.pools:
+            return base_url, None
+        return base_url, self.pools.get(urlparse(base_url).netloc)
+
+    # ---------- 副本状态 ----------
+
+    def _acquire(self, endpoints, tried):
+        """
+        选一个副本并计入进行中请求，返回 (副本, 是否持有半开试探名额)；没有可尝试的副本时返回 (None, False)
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [ep for ep in endpoints if ep not in tried]
+            ready = [ep for ep in candidates if ep.available(now)]
+            # 首次尝试时全部副本都不可用 (探测线程误判、同时熔断)，仍按评分选一个，不直接拒绝请求；
+            # 故障转移时只换到可用副本
+            pool = ready or (candidates if not tried else [])
+            if not pool:
+                return None, False
+            chosen = min(pool, key=lambda ep: (ep.score(), ep.outstanding, random.random()))
+            trial = chosen.state(now) == "half_open" and not chosen.trial
+            if trial:
+                chosen.trial = True
+            chosen.outstanding += 1
+            return chosen, trial
+
+    def _done(self, ep, trial):
+        """请求结束；只有持有试探名额的请求才归还名额，其他请求结束不影响半开状态"""
+        with self._lock:
+            ep.outstanding -= 1
+            if trial:
+                ep.trial = False
+
+    def _success(self, ep, latency=None):
+        with self._lock:
+            if ep.open_until:
+                logger.info(f"✅ [LLM 路由] 副本 {ep.netloc} 恢复")
+            ep.failures = 0
+            ep.open_until = 0.0
+            if latency is not None:
+                ep.latency = latency if ep.latency is None else ep.latency + _EWMA_ALPHA * (latency - ep.latency)
+
+    def _failure(self, ep, error):
+        with self._lock:
+            now = time.monotonic()
+            if _status_of(error) == 429:
+                # 副本在线但已满载：短暂暂停分配，不计入连续失败、不熔断
+                ep.throttled_until = now + _retry_after(error)
+                logger.info(f"⏳ [LLM 路由] 副本 {ep.netloc} 返回 429，暂停分配 {ep.throttled_until - now:.1f}s")
+                return
+            ep.failures += 1
+            if ep.state(now) == "half_open" or ep.failures >= LLM_ROUTER_FAILURE_THRESHOLD:
+                ep.open_until = now + LLM_ROUTER_OPEN_SECONDS
+                LLM_CIRCUIT_OPENS.inc(endpoint=ep.netloc)
+                logger.warning(
+                    f"⚠️ [LLM 路由] 副本 {ep.netloc} 连续失败 {ep.failures} 次，熔断 {LLM_ROUTER_OPEN_SECONDS:.0f}s: {error}"
+                )
+
+    def _failover(self, ep, error, tried, endpoints):
+        """首个分片前出错：记录失败，返回是否换副本重试"""
+        if not is_retryable(error):
+            return False
+        self._failure(ep, error)
+        if len(tried) >= min(LLM_ROUTER_MAX_ATTEMPTS, len(endpoints)):
+            return False
+        LLM_ROUTER_FAILOVERS.inc(pool=ep.pool)
+        logger.warning(f"⚠️ [LLM 路由] 副本 {ep.netloc} 调用失败，切换副本重试: {error}")
+        return True
+
+    # ---------- 调用入口 ----------
+
+    def stream(self, target, open_stream):
+        """
+        同步流式调用。open_stream(url) 以选定副本的 base_url 发起请求并返回分片迭代器，
+        首个分片之前失败会以另一个副本的 url 再次调用。
+        用法: for chunk in observe_stream(llm_router.stream(llm, lambda url: llm_at(url).stream(messages)), llm): ...
+        """
+        base_url, endpoints = self._route(target)
+        if not endpoints:
+            source = open_stream(base_url)
+            try:
+                yield from source
+            except GeneratorExit:
+                _close(source)
+                raise
+            return
+        tried = []
+        error = None
+        while True:
+            ep, trial = self._acquire(endpoints, tried)
+            if ep is None:
+                raise error
+            tried.append(ep)
+            start = time.perf_counter()
+            raw = None
+            try:
+                try:
+                    raw = open_stream(ep.url(base_url))
+                    source = iter(raw)
+                    first = next(source)
+                except StopIteration:
+                    self._success(ep, time.perf_counter() - start)
+                    return
+                except Exception as e:
+                    _close(raw)
+                    if not self._failover(ep, e, tried, endpoints):
+                        raise
+                    error = e
+                    continue
+                self._success(ep, time.perf_counter() - start)
+                try:
+                    yield first
+                    yield from source
+                except GeneratorExit:
+                    # 调用方提前关闭 (客户端断开)：关闭上游流，模型服务随即中止生成
+                    _close(raw)
+                    raise
+                except Exception as e:
+                    if is_retryable(e):
+                        self._failure(ep, e)
+                    raise
+                return
+            finally:
+                self._done(ep, trial)
+
+    async def astream(self, target, open_stream):
+        """stream 的异步版本；open_stream(url) 可以返回异步迭代器，或返回异步迭代器的协程 (AsyncOpenAI create)"""
+        base_url, endpoints = self._route(target)
+        if not endpoints:
+            source = open_stream(base_url)
+            if inspect.isawaitable(source):
+                source = await source
+            try:
+                async for chunk in source:
+                    yield chunk
+            except (GeneratorExit, asyncio.CancelledError):
+                await _aclose(source)
+                raise
+            return
+        tried = []
+        error = None
+        while True:
+            ep, trial = self._acquire(endpoints, tried)
+            if ep is None:
+                raise error
+            tried.append(ep)
+            start = time.perf_counter()
+            raw = None
+            try:
+                try:
+                    raw = open_stream(ep.url(base_url))
+                    if inspect.isawaitable(raw):
+                        raw = await raw
+                    source = raw.__aiter__()
+                    first = await source.__anext__()
+                except StopAsyncIteration:
+                    self._success(ep, time.perf_counter() - start)
+                    return
+                except Exception as e:
+                    await _aclose(raw)
+                    if not self._failover(ep, e, tried, endpoints):
+                        raise
+                    error = e
+                    continue
+                except BaseException:
+                    await _aclose(raw)
+                    raise
+                self._success(ep, time.perf_counter() - start)
+                try:
+                    yield first
+                    async for chunk in source:
+                        yield chunk
+                except (GeneratorExit, asyncio.CancelledError):
+                    await _aclose(raw)
+                    raise
+                except Exception as e:
+                    if is_retryable(e):
+                        self._failure(ep, e)
+                    raise
+                return
+            finally:
+                self._done(ep, trial)
+
+    def call(self, target, fn):
+        """非流式调用：fn(url) 以选定副本的 base_url 发起请求，可重试错误时换副本"""
+        base_url, endpoints = self._route(target)
+        if not endpoints:
+            return fn(base_url)
+        tried = []
+        error = None
+        while True:
+            ep, trial = self._acquire(endpoints, tried)
+            if ep is None:
+                raise error
+            tried.append(ep)
+            try:
+                result = fn(ep.url(base_url))
+            except Exception as e:
+                if not self._failover(ep, e, tried, endpoints):
+                    raise
+                error = e
+                continue
+            finally:
+                self._done(ep, trial)
+            # 整体耗时与首个分片延迟不可比，只更新熔断状态
+            self._success(ep)
+            return result
+
+    async def acall(self, target, fn):
+        """call 的异步版本：fn(url) 返回协程"""
+        base_url, endpoints = self._route(target)
+        if not endpoints:
+            return await fn(base_url)
+        tried = []
+        error = None
+        while True:
+            ep, trial = self._acquire(endpoints, tried)
+            if ep is None:
+                raise error
+            tried.append(ep)
+            try:
+                result = await fn(ep.url(base_url))
+            except Exception as e:
+                if not self._failover(ep, e, tried, endpoints):
+                    raise
+                error = e
+                continue
+            finally:
+                self._done(ep, trial)
+            self._success(ep)
+            return result
+
+    # ---------- 健康检查 ----------
+
+    def _probe(self, client, ep):
+        """依次请求探测路径 (上次成功的优先)，任一返回 2xx 即在线"""
+        paths = [p.strip() for p in LLM_ROUTER_PROBE_PATH.split(",") if p.strip()]
+        if ep.probe_path in paths:
+            paths.remove(ep.probe_path)
+            paths.insert(0, ep.probe_path)
+        for path in paths:
+            try:
+                resp = client.get(f"{ep.scheme or 'http'}://{ep.netloc}{path}")
+            except httpx.HTTPError:
+                return False
+            if resp.is_success:
+                ep.probe_path = path
+                return True
+        return False
+
+    def probe_once(self):
+        """探测所有副本一次：能连上且返回 2xx 才视为在线"""
+        with httpx.Client(timeout=LLM_ROUTER_PROBE_TIMEOUT) as client:
+            for endpoints in self.pools.values():
+                for ep in endpoints:
+                    healthy = self._probe(client, ep)
+                    with self._lock:
+                        changed = ep.healthy != healthy
+                        ep.healthy = healthy
+                    if changed:
+                        if healthy:
+                            logger.info(f"🩺 [LLM 路由] 副本 {ep.netloc} 健康检查恢复")
+                        else:
+                            logger.warning(f"🩺 [LLM 路由] 副本 {ep.netloc} 健康检查失败，暂停分配请求")
+
+    def _run(self):
+        while True:
+            try:
+                self.probe_once()
+            except Exception as e:
+                logger.error(f"❌ [LLM 路由] 健康检查线程异常: {e}", exc_info=True)
+            time.sleep(LLM_ROUTER_PROBE_SECONDS)
+
+    def start_health_checks(self):
+        """启动健康检查线程 (应用 lifespan 启动阶段调用，重复调用无副作用)。未配置副本池时不启动"""
+        if not self.pools or LLM_ROUTER_PROBE_SECONDS <= 0:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="llm-router-probe", daemon=True).start()
+        endpoints = sum(len(e) for e in self.pools.values())
+        logger.info(f"🩺 LLM 副本健康检查已启动 ({len(self.pools)} 个副本池，{endpoints} 个副本)")
+
+
+llm_router = LLMRouter()
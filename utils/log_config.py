@@ -1,34 +1,209 @@
+import atexit
+import builtins
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
 import sys
+import threading
+import time
+
+# ==========================================
+# 日志配置
+# ==========================================
+# LOG_ASYNC=1 (默认): 业务线程只把日志记录放入内存队列 (QueueHandler)，
+#   由后台 QueueListener 线程写 stdout / 文件，事件循环和工作线程不再做阻塞磁盘 I/O。
+#   队列满时直接丢弃并计数，绝不阻塞调用方。
+# LOG_FORMAT=text|json: json 输出单行 JSON，便于日志平台采集。
+# LOG_RATE_LIMITS / LOG_SAMPLING: 高频日志限流与采样 (默认关闭；只作用于 INFO 及以下，WARNING 及以上总是输出)。
+#   LOG_RATE_LIMITS="utils.zzp.import_doc_to_db=20,routers.ai_search_api=50"  每个 logger 每秒最多 N 条
+#   LOG_SAMPLING="utils.lyf.prompt_chat=0.1"                                   只保留 10%
+#   规则按 logger 名前缀匹配，子 logger 继承父 logger 的规则。
+# LOG_CAPTURE_PRINT=1: 拆分器等模块中的 print 改走 logging (见 route_print)。
+
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "")
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+LOG_CAPTURE_PRINT = os.getenv("LOG_CAPTURE_PRINT", "0") == "1"
+
+_listener = None
+
+# route_print 转发的 print 含这些标记时按 WARNING 记录，失败信息不会被限流 / 采样丢弃
+_PRINT_WARNING_MARKERS = ("❌", "失败", "错误", "[警告]")
+
+# LogRecord 自带属性，JSON 输出时只把额外字段 (extra=...) 作为附加键
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "suppressed"}
+
+
+def _parse_rules(value, cast):
+    rules = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, _, raw = item.partition("=")
+        try:
+            rules[name.strip()] = cast(raw.strip())
+        except ValueError:
+            continue
+    return rules
+
+
+class JsonFormatter(logging.Formatter):
+    """单行 JSON 日志"""
+
+    def format(self, record):
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            data["suppressed"] = suppressed
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = record.stack_info
+        return json.dumps(data, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """原有文本格式，被限流时在末尾注明抑制条数"""
+
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" (已限流抑制 {suppressed} 条)"
+        return text
+
+
+class HotPathFilter(logging.Filter):
+    """按 logger 名前缀做限流 (令牌桶) 和随机采样，被限流的条数附加到下一条放行的记录上"""
+
+    def __init__(self, rate_limits=None, sampling=None):
+        super().__init__()
+        self.rate_limits = rate_limits or {}
+        self.sampling = sampling or {}
+        self._lock = threading.Lock()
+        # logger 名 -> [可用令牌, 上次补充时间, 已抑制条数]
+        self._buckets = {}
+        self._rule_cache = {}
+
+    def _match(self, rules, name):
+        while name:
+            if name in rules:
+                return rules[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    def _rules_for(self, name):
+        rules = self._rule_cache.get(name)
+        if rules is None:
+            rules = self._rule_cache[name] = (self._match(self.rate_limits, name), self._match(self.sampling, name))
+        return rules
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate, sample = self._rules_for(record.name)
+        if sample is not None and random.random() >= sample:
+            return False
+        if rate is None:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = self._buckets[record.name] = [rate, now, 0]
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录而不是阻塞或抛异常"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # 在调用方线程合并 msg % args 并格式化异常，格式化本身交给监听线程中的目标 handler
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 
 def setup_logging():
     """
     统一日志配置中心
     旨在替代散落在各处的 logging.basicConfig
     """
+    global _listener
+
     # 获取环境变量
     env = os.getenv("ENV", "development")
-    
+
     # 定义日志格式
     log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter(log_format)
+
     # 强制重新配置 (force=True 在 Python 3.8+ 可用)
     # 如果是低版本，需要先移除 handlers
     root_logger = logging.getLogger()
     if root_logger.handlers:
         for handler in root_logger.handlers[:]:
             root_logger.removeHandler(handler)
-            
+    _stop_listener()
+
     # 获取项目根目录的绝对路径 (当前文件在 utils/ 目录下)
     # /app/utils/log_config.py -> /app
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    
+
     # 配置基础日志
     handlers = [
         logging.StreamHandler(sys.stdout)
     ]
-    
+
     # 如果是开发环境，额外写入 logs/test_report.log
     if env == "development":
         log_dir = os.path.join(project_root, "logs")
@@ -42,19 +217,29 @@ def setup_logging():
         log_file = os.path.join(project_root, "report.log")
         handlers.append(logging.FileHandler(log_file))
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format=log_format,
-        handlers=handlers
-    )
-    
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    hot_path_filter = HotPathFilter(_parse_rules(LOG_RATE_LIMITS, float), _parse_rules(LOG_SAMPLING, float))
+
+    if LOG_ASYNC:
+        queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        queue_handler.addFilter(hot_path_filter)
+        _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        root_logger.addHandler(queue_handler)
+    else:
+        for handler in handlers:
+            handler.addFilter(hot_path_filter)
+            root_logger.addHandler(handler)
+    root_logger.setLevel(logging.INFO)
+
     # 降低特定模块的日志级别，减少噪音
     noisy_loggers = [
         "utils.lyf.prompt_chat_async",  # list_sessions, SQL 等频繁日志
     ]
     for logger_name in noisy_loggers:
         logging.getLogger(logger_name).setLevel(logging.WARNING)
-    
+
     # 针对 uvicorn 的日志进行劫持，确保它们也流向 root logger 的 handlers
     for logger_name in ["uvicorn", "uvicorn.error", "uvicorn.access"]:
         u_logger = logging.getLogger(logger_name)
@@ -64,4 +249,40 @@ def setup_logging():
         u_logger.propagate = True
 
     logger = logging.getLogger("log_config")
-    logger.info(f"✅ 日志系统初始化完成 | 环境: {env}")
+    logger.info(f"✅ 日志系统初始化完成 | 环境: {env} | 异步: {LOG_ASYNC} | 格式: {LOG_FORMAT}")
+
+
+def dropped_log_records():
+    """异步模式下因队列满被丢弃的日志条数"""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            return handler.dropped
+    return 0
+
+
+def route_print(logger_name):
+    """
+    返回一个可替换模块内 print 的函数。
+    LOG_CAPTURE_PRINT=1 时输出经 logging (异步队列、JSON、限流) 处理；否则原样返回内置 print。
+    用法 (模块顶部): print = route_print(__name__)
+    """
+    if not LOG_CAPTURE_PRINT:
+        return builtins.print
+    logger = logging.getLogger(logger_name)
+
+    def _print(*args, sep=" ", end="\n", file=None, flush=False):
+        if file is not None and file is not sys.stdout:
+            builtins.print(*args, sep=sep, end=end, file=file, flush=flush)
+            return
+        message = (" " if sep is None else sep).join(str(a) for a in args).strip()
+        if not message:
+            return
+        if any(marker in message for marker in _PRINT_WARNING_MARKERS):
+            logger.warning(message)
+        else:
+            logger.info(message)
+
+    return _print
+
+
+atexit.register(_stop_listener)
@@ -5,10 +5,11 @@ import time
 import logging
 # 异步库
 import asyncio
+import threading
 import httpx
 from bs4 import BeautifulSoup
-from datetime import datetime
 from typing import Dict, List, AsyncGenerator
+from collections import OrderedDict
 
 from langchain_openai import ChatOpenAI
 # 修复点 1：确保导入 ChatOllama 以配合 fallback 函数
@@ -20,6 +21,12 @@ from langchain_core.messages import (
     ToolMessage,
 )
 from utils.chat_session_manager import ChatSessionManager
+from utils.metrics import aobserve_stream, LLM_STREAM_USAGE
+from utils.shared_state import SharedHash
+from utils.llm_admission import llm_admission, PRIORITY_INTERACTIVE
+from utils.llm_router import llm_router, LOCAL_OLLAMA_URL
+from utils.prompt_layout import system_prompt, turn_content
+from utils.sse import TokenBuffer, DONE
 
 # =========================
 # 项目路径 & 日志
@@ -34,20 +41,19 @@ logger = logging.getLogger(__name__)
 # =========================
 # 全局模型实例和状态
 # =========================
-ONLINE_LLM = None
+# 模型客户端只能在进程内持有：按 (model_name, base_url, api_key) 缓存，
+# 不同用户使用不同配置时各自取自己的客户端，不再互相覆盖全局实例。
+# key 含用户填写的 API Key 和副本地址，按 LRU 限制数量，避免随用户 / 副本数无限增长
+ONLINE_LLM_CACHE_SIZE = int(os.getenv("ONLINE_LLM_CACHE_SIZE", 64))
+ONLINE_LLM_CACHE: "OrderedDict[tuple, ChatOpenAI]" = OrderedDict()
+_online_llm_lock = threading.Lock()
 LOCAL_LLM = None
 
-# 记录当前在线模型的配置，用于检测是否需要重新初始化
-CURRENT_ONLINE_CONFIG = {
-    "model_name": None,
-    "base_url": None,
-    "api_key": None
-}
-
-MODEL_STATUS = {
+# 模型就绪状态：MULTI_WORKER 模式下存 Redis，所有 worker 看到同一份
+MODEL_STATUS = SharedHash("ai_search:model_status", {
     "online": "NOT_INIT",
     "local": "NOT_INIT",
-}
+})
 
 # =========================
 # 全局会话（Redis + Memory）
@@ -58,11 +64,8 @@ session_manager = ChatSessionManager(session_type="chat:search")
 # =========================
 # 强制搜索 System Prompt
 # =========================
-def build_search_system_prompt() -> str:
-    today = datetime.now().strftime("%Y-%m-%d")
-    return f"""
-今天日期：{today}
-
+# 静态内容，所有请求逐字节相同 (可命中 vLLM 前缀缓存)；日期放在本轮用户消息里
+SEARCH_SYSTEM_PROMPT = system_prompt("""
 你是一个政务级 AI 搜索与分析引擎，必须严格遵循以下流程，不得跳过：
 
 【强制 Workflow】
@@ -79,7 +82,11 @@ def build_search_system_prompt() -> str:
   - 明确说明“根据联网搜索结果”
 
 禁止闲聊。
-"""
+""")
+
+
+def build_search_system_prompt() -> str:
+    return SEARCH_SYSTEM_PROMPT
 
 # =========================
 # 初始化模型
@@ -92,6 +99,7 @@ def init_online_llm(model_name: str, base_url: str, api_key: str) -> ChatOpenAI:
         api_key=api_key,
         temperature=0.2,
         streaming=True,
+        stream_usage=LLM_STREAM_USAGE,
         timeout=120, # 增加超时时间到 120 秒，适应慢速网络或复杂思考
         max_retries=1, # 减少重试次数，以便快速进入 fallback
     )
@@ -103,38 +111,48 @@ def init_local_llm() -> ChatOpenAI:
     # 这里默认优先使用性能更强的 qwen3-coder:30b
     return ChatOpenAI(
         model="qwen3-coder:30b",
-        base_url="http://localhost:11434/v1",
+        base_url=f"{LOCAL_OLLAMA_URL}/v1",
         api_key="ollama", 
         temperature=0.2,
         streaming=True,
+        stream_usage=LLM_STREAM_USAGE,
     )
 
-def should_fallback_to_local(e: Exception) -> bool:
-    msg = str(e).lower()
-    type_name = type(e).__name__.lower()
-    logger.warning(f"正在检查是否需要降级 | 异常类型: {type(e).__name__} | 异常消息: {msg}")
-    
-    # 只要是在线模型授权失败(401)、余额不足(402)、Key无效、或额度超限、模型未找到(404)、超时或连接失败，都触发降级
-    reasons = [
-        "401", "402", "404", "not found", "incorrect api key", 
-        "insufficient balance", "exceeded_current_quota", "authentication",
-        "timeout", "connection", "connect", "unreachable", "rate_limit"
-    ]
-    
-    if any(r in msg for r in reasons) or any(r in type_name for r in reasons):
-        return True
-        
-    return False
+def _cached_online_llm(key):
+    with _online_llm_lock:
+        llm = ONLINE_LLM_CACHE.get(key)
+        if llm is not None:
+            ONLINE_LLM_CACHE.move_to_end(key)
+        return llm
+
+
+def _cache_online_llm(key, llm):
+    with _online_llm_lock:
+        ONLINE_LLM_CACHE[key] = llm
+        ONLINE_LLM_CACHE.move_to_end(key)
+        while len(ONLINE_LLM_CACHE) > ONLINE_LLM_CACHE_SIZE:
+            ONLINE_LLM_CACHE.popitem(last=False)
+
+
+def online_llm_at(model_name: str, base_url: str, api_key: str) -> ChatOpenAI:
+    """按配置取在线模型客户端 (没有时新建并缓存)；LLM 路由切换副本时 base_url 为副本地址"""
+    key = (model_name, base_url, api_key)
+    llm = _cached_online_llm(key)
+    if llm is None:
+        llm = init_online_llm(model_name, base_url, api_key)
+        _cache_online_llm(key, llm)
+    return llm
 
 # =========================
 # 异步初始化模型
 # =========================
-async def async_init_online_llm(model_name: str, base_url: str, api_key: str):
-    global ONLINE_LLM
+async def async_init_online_llm(model_name: str, base_url: str, api_key: str) -> ChatOpenAI:
     logger.info(f"🔄 异步初始化【在线搜索模型】: {model_name}")
-    ONLINE_LLM = init_online_llm(model_name, base_url, api_key)
-    MODEL_STATUS["online"] = "READY"
+    llm = init_online_llm(model_name, base_url, api_key)
+    _cache_online_llm((model_name, base_url, api_key), llm)
+    await MODEL_STATUS.aset("online", "READY")
     logger.info(f"✅ 【在线搜索模型】初始化完成")
+    return llm
 
 async def async_init_local_llm():
     global LOCAL_LLM
@@ -146,7 +164,7 @@ async def async_init_local_llm():
         logger.info(f"✅ 【本地 Ollama 模型】预热完成")
     except Exception as e:
         logger.error(f"❌ 本地模型预热失败: {e}")
-    MODEL_STATUS["local"] = "READY"
+    await MODEL_STATUS.aset("local", "READY")
     logger.info(f"✅ 【本地 Ollama 模型】初始化完成")
 
 # 修复点 5：解决 init_search_llm_with_fallback 的逻辑重复和类定义不一致
@@ -159,7 +177,7 @@ def init_search_llm_with_fallback(
         logger.warning("⚠️ 未检测到 API Key，直接使用本地搜索模型")
         return ChatOllama(
             model="deepseek-r1:32b",
-            base_url="http://localhost:11434", # 修复：ChatOllama 基础地址不需要 /v1
+            base_url=LOCAL_OLLAMA_URL, # 修复：ChatOllama 基础地址不需要 /v1
             temperature=0.2,
         )
 
@@ -176,7 +194,7 @@ def init_search_llm_with_fallback(
         logger.error(f"初始化失败，降级本地: {e}")
         return ChatOllama(
             model="deepseek-r1:32b",
-            base_url="http://localhost:11434",
+            base_url=LOCAL_OLLAMA_URL,
             temperature=0.2,
         )
 
@@ -246,41 +264,29 @@ async def Search_Chat_Generator_Stream(
     base_url: str,
     api_key: str,
     task_id: str,
+    user_id=None,
 ) -> AsyncGenerator[str, None]:
-    global ONLINE_LLM, LOCAL_LLM, CURRENT_ONLINE_CONFIG
-    
     start_time = time.time()
     masked_key = f"{api_key[:6]}******{api_key[-4:]}" if api_key and len(api_key) > 10 else "******"
     logger.info(f"🚀 [AI Search Start] TaskID: {task_id} | Query: {user_query[:100]}... | Model: {model_name}")
     logger.info(f"🔧 [AI Search Config] BaseURL: {base_url} | API Key: {masked_key}")
 
-    # 1. 自动初始化/更新在线模型逻辑
-    config_changed = (
-        model_name != CURRENT_ONLINE_CONFIG["model_name"] or
-        base_url != CURRENT_ONLINE_CONFIG["base_url"] or
-        api_key != CURRENT_ONLINE_CONFIG["api_key"]
-    )
-    
-    if ONLINE_LLM is None or config_changed:
+    # 1. 自动初始化在线模型 (按配置缓存，本请求只使用局部变量 online_llm)
+    online_llm = _cached_online_llm((model_name, base_url, api_key))
+    if online_llm is None:
         try:
-            # 假设该函数已在外部定义
-            await async_init_online_llm(model_name, base_url, api_key)
-            CURRENT_ONLINE_CONFIG = {
-                "model_name": model_name,
-                "base_url": base_url,
-                "api_key": api_key
-            }
+            online_llm = await async_init_online_llm(model_name, base_url, api_key)
         except Exception as e:
             logger.error(f"在线模型初始化失败: {e}")
-            MODEL_STATUS["online"] = "ERROR"
+            await MODEL_STATUS.aset("online", "ERROR")
 
-    history = session_manager.get_session(task_id)
+    history = await session_manager.aget_session(task_id)
     if not history:
         history = []
 
     # 2. 在线状态预检查 (修正了 f-string 引号冲突)
-    if MODEL_STATUS.get("online") != "READY":
-         status_val = MODEL_STATUS.get("online", "UNKNOWN")
+    if online_llm is None:
+         status_val = await MODEL_STATUS.aget("online", "UNKNOWN")
          msg = f"❌ 在线模型未就绪 ({status_val})，请检查配置或网络连接。"
          err_payload = json.dumps({"content": msg}, ensure_ascii=False)
          yield f"data: {err_payload}\n\n"
@@ -318,13 +324,22 @@ async def Search_Chat_Generator_Stream(
     messages = [
         SystemMessage(content=build_search_system_prompt()),
         *history,
-        HumanMessage(content=user_query),
+        HumanMessage(content=turn_content(user_query)),
     ]
 
+    # 工具探测和最终回答共用一个并发名额；排队期间向前端推送 SSE queue 事件
+    ticket = llm_admission.request(base_url, PRIORITY_INTERACTIVE, user=user_id if user_id is not None else task_id)
+    buffer = TokenBuffer()
     try:
+        async for update in ticket.aupdates():
+            yield update.sse()
+
         # 第一阶段：使用 ainvoke 探测工具调用 (确保 Kimi 内置搜索握手稳定)
-        llm_with_tools = ONLINE_LLM.bind_tools(tools)
-        response = await llm_with_tools.ainvoke(messages)
+        # 配置了多副本时由 llm_router 选副本，连接失败 / 超时 / 5xx 自动换副本 (不再按异常字符串判断降级)
+        response = await llm_router.acall(
+            base_url,
+            lambda url: online_llm_at(model_name, url, api_key).bind_tools(tools).ainvoke(messages),
+        )
         
         # 记录是否触发了工具
         if response.tool_calls:
@@ -357,23 +372,19 @@ async def Search_Chat_Generator_Stream(
 
         # 第二阶段：生成最终流式回答 (修正了 f-string 反斜杠错误)
         logger.info(f"🌊 [AI Search Stream] Starting final response generation... | TaskID: {task_id}")
-        full_answer = ""
-        async for chunk in ONLINE_LLM.astream(messages):
-            if chunk.content:
-                full_answer += chunk.content
-                # 修复：先 dumps 变量，避免 yield f-string 中出现复杂转义
-                chunk_payload = json.dumps({"content": chunk.content}, ensure_ascii=False)
-                yield f"data: {chunk_payload}\n\n"
+        stream = llm_router.astream(base_url, lambda url: online_llm_at(model_name, url, api_key).astream(messages))
+        async for chunk in aobserve_stream(stream, online_llm):
+            frame = buffer.push(chunk.content)
+            if frame:
+                yield frame
+        frame = buffer.flush()
+        if frame:
+            yield frame
         
-        yield "data: [DONE]\n\n"
+        yield DONE
         
         duration = time.time() - start_time
-        logger.info(f"✅ [AI Search Done] TaskID: {task_id} | Total Time: {duration:.2f}s | Output Length: {len(full_answer)}")
-
-        # 更新对话历史
-        history.append(HumanMessage(content=user_query))
-        history.append(AIMessage(content=full_answer))
-        session_manager.update_session(task_id, history)
+        logger.info(f"✅ [AI Search Done] TaskID: {task_id} | Total Time: {duration:.2f}s | Output Length: {len(buffer.text())}")
 
     except Exception as e:
         logger.error(f"❌ [AI Search Error] TaskID: {task_id} | Error: {str(e)}", exc_info=True)
@@ -391,6 +402,13 @@ async def Search_Chat_Generator_Stream(
         err_payload = json.dumps({"content": err_msg}, ensure_ascii=False)
         yield f"data: {err_payload}\n\n"
         yield "data: [DONE]\n\n"
+    finally:
+        ticket.release()
+        # 更新对话历史：前端收到 [DONE] 后断开、或中途断开时同样保存已生成的内容
+        if buffer.parts:
+            history.append(HumanMessage(content=user_query))
+            history.append(AIMessage(content=buffer.text()))
+            await session_manager.aupdate_session(task_id, history)
 
 # =========================
 # 本地调试 (已适配异步)
@@ -409,7 +427,7 @@ if __name__ == "__main__":
         )
 
         # 等待模型初始化完成
-        while MODEL_STATUS["online"] != "READY" and MODEL_STATUS["local"] != "READY":
+        while await MODEL_STATUS.aget("online") != "READY" and await MODEL_STATUS.aget("local") != "READY":
             await asyncio.sleep(0.1)
 
         await run_round_async("2026年我国节能降碳工作的主要政策规划是什么？")
@@ -2,6 +2,7 @@ import re
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from .db_async_config import engine
+from .chat_session_stats import bump
 
 class ChatMessageRecord:
     @staticmethod
@@ -19,6 +20,8 @@ class ChatMessageRecord:
                 "sid": session_id, "idx": round_index, 
                 "role": role, "content": clean_content
             })
+            # 会话列表统计字段 (消息数、最后消息时间、预览) 随消息一起提交
+            await bump(session, session_id, clean_content)
             await session.commit()
 
     @staticmethod
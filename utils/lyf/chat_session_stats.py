@@ -0,0 +1,158 @@
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .db_async_config import engine
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# 会话列表反范式字段 (ai_chat_sessions)
+# ==========================================
+# 侧边栏列表原来对每个会话执行一次相关子查询 NOT EXISTS (SELECT 1 FROM ai_chat_messages ...)，
+# 用来隐藏"测试"开头的空会话；消息表越大，列表越慢。
+# 现在会话行自带 message_count / last_message_at / last_message_preview：
+#   - 写入消息时在同一事务内 +1 (bump)；
+#   - 软删除消息 (重新生成、保存收敛) 和复制会话后按 session_id 重新统计 (recount)；
+# 列表查询只读 ai_chat_sessions，走 (user_id, status, update_time) 索引。
+#
+# 字段由 scripts/backfill_chat_session_stats.py 添加并回填。字段不存在时各函数什么都不做，
+# 列表查询退回原来的子查询写法。
+
+PREVIEW_CHARS = 100
+
+STATS_COLUMNS = {
+    "message_count": "INT NOT NULL DEFAULT 0 COMMENT '未删除的消息数'",
+    "last_message_at": "DATETIME NULL COMMENT '最后一条消息时间'",
+    "last_message_preview": "VARCHAR(200) NULL COMMENT '最后一条消息预览'",
+}
+SIDEBAR_INDEX = "idx_session_sidebar"
+SIDEBAR_INDEX_DDL = f"ALTER TABLE ai_chat_sessions ADD INDEX `{SIDEBAR_INDEX}` (`user_id`, `status`, `update_time`)"
+
+# 字段不可用时，暂停使用的时间 (秒)，期间不再重复检查
+_DISABLE_SECONDS = 60
+
+_available = None
+_checked_at = 0.0
+
+_RECOUNT_SQL = f"""
+    UPDATE ai_chat_sessions s
+    SET s.message_count = (
+            SELECT COUNT(*) FROM ai_chat_messages m
+            WHERE m.session_id = s.id AND (m.is_deleted IS NULL OR m.is_deleted = 0)
+        ),
+        s.last_message_at = (
+            SELECT MAX(m.create_time) FROM ai_chat_messages m
+            WHERE m.session_id = s.id AND (m.is_deleted IS NULL OR m.is_deleted = 0)
+        ),
+        s.last_message_preview = (
+            SELECT LEFT(TRIM(m.content), {PREVIEW_CHARS}) FROM ai_chat_messages m
+            WHERE m.session_id = s.id AND (m.is_deleted IS NULL OR m.is_deleted = 0)
+            ORDER BY m.id DESC
+            LIMIT 1
+        )
+    WHERE {{where}}
+"""
+
+
+def preview(content):
+    return (content or "").strip()[:PREVIEW_CHARS]
+
+
+async def stats_available() -> bool:
+    """ai_chat_sessions 是否已添加统计字段 (存在时永久缓存，不存在时每 _DISABLE_SECONDS 秒重新检查一次)"""
+    global _available, _checked_at
+    if _available or (_available is False and time.monotonic() - _checked_at < _DISABLE_SECONDS):
+        return _available
+    try:
+        async with AsyncSession(engine) as session:
+            res = await session.execute(
+                text(
+                    """
+                    SELECT COUNT(1)
+                    FROM INFORMATION_SCHEMA.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE()
+                      AND TABLE_NAME = 'ai_chat_sessions'
+                      AND COLUMN_NAME IN :cols
+                    """
+                ),
+                {"cols": tuple(STATS_COLUMNS)},
+            )
+            _available = (res.scalar() or 0) == len(STATS_COLUMNS)
+    except Exception as e:
+        logger.warning("Session stats column check failed: %s", e)
+        _available = False
+    _checked_at = time.monotonic()
+    return _available
+
+
+def _disable(e):
+    global _available, _checked_at
+    _available = False
+    _checked_at = time.monotonic()
+    logger.warning(f"⚠️ 会话统计字段不可用，{_DISABLE_SECONDS}s 内会话列表退回子查询: {e}")
+
+
+async def bump(session: AsyncSession, session_id: int, content: str):
+    """写入一条消息后调用 (与 INSERT 同一事务)：消息数 +1，更新最后消息时间和预览"""
+    if not await stats_available():
+        return
+    try:
+        async with session.begin_nested():
+            await session.execute(
+                text(
+                    """
+                    UPDATE ai_chat_sessions
+                    SET message_count = message_count + 1,
+                        last_message_at = NOW(),
+                        last_message_preview = :preview
+                    WHERE id = :sid
+                    """
+                ),
+                {"sid": session_id, "preview": preview(content)},
+            )
+    except Exception as e:
+        _disable(e)
+
+
+async def recount(session: AsyncSession, session_id: int):
+    """软删除 / 批量复制消息后调用 (与修改同一事务)：按 session_id 重新统计一个会话"""
+    if not await stats_available():
+        return
+    try:
+        async with session.begin_nested():
+            await session.execute(text(_RECOUNT_SQL.format(where="s.id = :sid")), {"sid": session_id})
+    except Exception as e:
+        _disable(e)
+
+
+def ensure_stats_columns(connection):
+    """添加统计字段和侧边栏索引 (幂等，同步连接)，供迁移脚本调用"""
+    existing = {
+        row[0]
+        for row in connection.execute(text(
+            """
+            SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ai_chat_sessions'
+            """
+        ))
+    }
+    for column, definition in STATS_COLUMNS.items():
+        if column not in existing:
+            connection.execute(text(f"ALTER TABLE ai_chat_sessions ADD COLUMN `{column}` {definition}"))
+
+    has_index = connection.execute(text(
+        """
+        SELECT COUNT(1) FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ai_chat_sessions' AND INDEX_NAME = :name
+        """
+    ), {"name": SIDEBAR_INDEX}).scalar()
+    if not has_index:
+        connection.execute(text(SIDEBAR_INDEX_DDL))
+
+
+def rebuild_stats(connection):
+    """全量回填 (同步连接)，供迁移脚本调用"""
+    connection.execute(text(_RECOUNT_SQL.format(where="1 = 1")))
@@ -1,6 +1,8 @@
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from .db_async_config import engine, Config
+from utils.llm_admission import llm_admission, PRIORITY_BACKGROUND
+from utils.llm_router import llm_router, client_at
 from typing import Dict, Tuple
 
 class ContextManager:
@@ -131,8 +133,9 @@ class ContextManager:
 
     async def _generate_summary(self, old_sum, new_text):
         prompt = f"请整合对话摘要。旧摘要：{old_sum}\n新对话：{new_text}\n要求：保持连贯性，500字内。"
-        resp = await self.client.chat.completions.create(
-            model=Config.MAIN_MODEL,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        async with llm_admission.aslot(self.client, PRIORITY_BACKGROUND):
+            resp = await llm_router.acall(self.client, lambda url: client_at(self.client, url).chat.completions.create(
+                model=Config.MAIN_MODEL,
+                messages=[{"role": "user", "content": prompt}]
+            ))
         return resp.choices[0].message.content.strip()
@@ -10,6 +10,7 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 
 from utils.zzp import sql_config as config
+from utils.deletion_reaper import tombstone, move_to_trash, KIND_UPLOAD
 
 # =============================
 # 数据库连接
@@ -53,49 +54,35 @@ def del_file(file_id: int, user_id: int, is_admin: bool = False) -> bool:
             """)
             conn.execute(sql_delete, {"file_id": file_id})
             
-        # 3. 删除物理文件
-        base_dir = project_root 
-        # 注意：使用文件的实际所有者 ID (file_owner_id) 而不是请求者 ID (user_id)
-        # 因为管理员可能删除其他用户的文件
-        file_path = os.path.join(base_dir, "inferrence", str(file_owner_id), folder_name, file_name)
-        
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                print(f"✅ 物理文件已删除: {file_path}")
-            except OSError as e:
-                print(f"⚠️ 物理文件删除失败: {e}")
-        else:
-            print(f"⚠️ 物理文件不存在，跳过: {file_path}")
-            # 尝试查找带时间戳的同名文件 (容错处理)
-            parent_dir = os.path.dirname(file_path)
-            if os.path.exists(parent_dir):
-                name_no_ext, ext = os.path.splitext(file_name)
-                # 查找 pattern: name_no_ext + "_" + timestamp + ext
-                # 简单遍历目录查找
-                found_fuzzy = False
-                for f in os.listdir(parent_dir):
-                    if f.startswith(name_no_ext + "_") and f.endswith(ext):
-                         # 再次确认前缀匹配 (避免 'test' 匹配 'test_1' 但其实是 'test_new')
-                         # 假设格式严格为 Name_Timestamp.ext
-                         fuzzy_path = os.path.join(parent_dir, f)
-                         try:
-                             os.remove(fuzzy_path)
-                             print(f"✅ (模糊匹配) 物理文件已删除: {fuzzy_path}")
-                             found_fuzzy = True
-                             # break? 可能会有多个副本，全部删除？为了安全只删一个？
-                             # 考虑到数据不一致，全部删除可能更干净，但也更危险。
-                             # 暂时只删第一个找到的，或者不删。
-                             # 用户抱怨"奇怪"，可能是因为删不掉。
-                             # 还是稳妥点，只删精确匹配，或者提示用户手动删。
-                             # 但用户之前的日志显示 404，说明文件名确实不匹配。
-                             # 这里做一个简单的尝试删除，如果不匹配就算了。
-                         except Exception as e:
-                             print(f"⚠️ (模糊匹配) 删除失败: {e}")
-                
-                if not found_fuzzy:
-                    print(f"⚠️ 未找到模糊匹配的文件")
+            # 3. 登记墓碑 (随本事务提交)，提交后物理文件移入回收目录；
+            # 由后台回收线程删除，并顺带回收不再被引用的 blob (utils/deletion_reaper.py)
+            base_dir = project_root 
+            # 注意：使用文件的实际所有者 ID (file_owner_id) 而不是请求者 ID (user_id)
+            # 因为管理员可能删除其他用户的文件
+            file_path = os.path.join(base_dir, "inferrence", str(file_owner_id), folder_name, file_name)
+            paths_to_remove = []
+            
+            if os.path.exists(file_path):
+                paths_to_remove.append(file_path)
+            else:
+                print(f"⚠️ 物理文件不存在，跳过: {file_path}")
+                # 尝试查找带时间戳的同名文件 (容错处理)
+                # 格式假设为 Name_Timestamp.ext，历史数据不一致时可能有多个副本，全部删除
+                parent_dir = os.path.dirname(file_path)
+                if os.path.exists(parent_dir):
+                    name_no_ext, ext = os.path.splitext(file_name)
+                    for f in os.listdir(parent_dir):
+                        if f.startswith(name_no_ext + "_") and f.endswith(ext):
+                            fuzzy_path = os.path.join(parent_dir, f)
+                            paths_to_remove.append(fuzzy_path)
+                            print(f"✅ (模糊匹配) 物理文件待删除: {fuzzy_path}")
+                    
+                    if not paths_to_remove:
+                        print(f"⚠️ 未找到模糊匹配的文件")
+
+            moves = tombstone(conn, KIND_UPLOAD, paths_to_remove, user_id=file_owner_id, label=file_name)
 
+        move_to_trash(moves)
         print(f"✅ 文件 id={file_id} 数据库记录已成功删除")
         return True
 
@@ -33,6 +33,7 @@ generate_report_root = os.path.dirname(project_root)
 if generate_report_root not in sys.path:
     sys.path.append(generate_report_root)
 import server_config
+from utils.blob_store import save_document
 
 try:
     from zzp import sql_config as config
@@ -386,7 +387,8 @@ class WordProjectExtractor:
                         self.clone_table(new_doc, item['obj'])
 
                 try:
-                    new_doc.save(file_path)
+                    # 重新导入同名报告时，旧章节可能与其他报告共享 blob
+                    save_document(new_doc, file_path)
                     print(f"   生成: {file_name}")
                     
                     # [新增] 生成 HTML
@@ -1,6 +1,9 @@
 import re
 from typing import List, Generator, Dict
 from utils.lyf.base_prompt_ai import base_ai, AISettings
+from utils.metrics import observe_stream, stream_options
+from utils.llm_admission import llm_admission, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from utils.llm_router import llm_router, client_at
 
 class PromptChat:
     def __init__(self):
@@ -20,16 +23,17 @@ class PromptChat:
         
         try:
             # 摘要逻辑保持 stream=False，确保快速拿到结果
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "请简要总结以下对话的关键信息，保留核心意图和事实，不要遗漏重要参数。"},
-                    {"role": "user", "content": conversation_text}
-                ],
-                stream=False,
-                max_tokens=300, # 摘要可以稍微长一点点
-                temperature=0.3
-            )
+            with llm_admission.slot(self.client, PRIORITY_BACKGROUND):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "请简要总结以下对话的关键信息，保留核心意图和事实，不要遗漏重要参数。"},
+                        {"role": "user", "content": conversation_text}
+                    ],
+                    stream=False,
+                    max_tokens=300, # 摘要可以稍微长一点点
+                    temperature=0.3
+                )
             return response.choices[0].message.content
         except Exception as e:
             print(f"摘要生成失败: {e}")
@@ -88,8 +92,9 @@ class PromptChat:
         recent_part = history[-6:]
         summary = self._summarize_old_context(old_part)
         
-        system_message["content"] += f"\n\n[此前对话背景摘要]\n{summary}"
-        return [system_message] + recent_part + [{"role": "user", "content": processed_query}]
+        # 摘要单独作为第二条 system 消息，静态人设提示词保持逐字节不变，仍可命中前缀缓存
+        summary_message = {"role": "system", "content": f"[此前对话背景摘要]\n{summary}"}
+        return [system_message, summary_message] + recent_part + [{"role": "user", "content": processed_query}]
 
     def chat_stream(self, user_id: str, query: str) -> Generator[str, None, None]:
         """
@@ -103,16 +108,24 @@ class PromptChat:
         
         full_reply = ""
         
+        ticket = llm_admission.request(self.client, PRIORITY_INTERACTIVE, user=user_id)
         try:
-            stream = self.client.chat.completions.create(
+            # 排队期间产生 QueueUpdate，由接口层转成 SSE queue 事件
+            yield from ticket.updates()
+            # 多副本时由 llm_router 选副本；客户端断开关闭生成器时一并关闭上游流
+            stream = llm_router.stream(self.client, lambda url: client_at(self.client, url).chat.completions.create(
                 model=self.model,
                 messages=messages,
                 stream=True,
                 max_tokens=AISettings.MAX_TOKENS_LIMIT,
-                temperature=0.6 # 略微提高温度，增加优化建议的灵活性
-            )
-
-            for chunk in stream:
+                temperature=0.6, # 略微提高温度，增加优化建议的灵活性
+                **stream_options(),
+            ))
+
+            for chunk in observe_stream(stream, self.model):
+                # include_usage 时最后一个分片只有 usage，没有 choices
+                if not chunk.choices:
+                    continue
                 # 尝试获取推理内容（部分模型如 DeepSeek R1 支持）
                 reasoning = ""
                 if hasattr(chunk.choices[0].delta, 'reasoning_content') and chunk.choices[0].delta.reasoning_content:
@@ -135,6 +148,8 @@ class PromptChat:
 
         except Exception as e:
             yield f"\n[会话异常]: {str(e)}"
+        finally:
+            ticket.release()
 
 # 实例化单例供外部调用
 prompt_chat_service = PromptChat()
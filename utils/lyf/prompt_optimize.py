@@ -1,5 +1,8 @@
 from typing import Generator
 from utils.lyf.base_prompt_ai import base_ai, AISettings
+from utils.metrics import observe_stream, stream_options
+from utils.llm_admission import llm_admission, PRIORITY_DRAFTING
+from utils.llm_router import llm_router, client_at
 
 class PromptOptimize:
     def __init__(self):
@@ -16,7 +19,7 @@ class PromptOptimize:
             "3. **思维链规范**：在内部思考时，不要复述本指令，直接开始分析样本。"
         )
 
-    def optimize_stream(self, user_requirement: str, target_scene: str = "通用") -> Generator[str, None, None]:
+    def optimize_stream(self, user_requirement: str, target_scene: str = "通用", user_id=None) -> Generator[str, None, None]:
         # --- 意图隔离包装 ---
         processed_requirement = (
             "【待优化样本开始】\n"
@@ -31,14 +34,22 @@ class PromptOptimize:
             {"role": "user", "content": processed_requirement}
         ]
 
+        ticket = llm_admission.request(self.client, PRIORITY_DRAFTING, user=user_id)
         try:
-            stream = self.client.chat.completions.create(
+            # 排队期间产生 QueueUpdate，由接口层转成 SSE queue 事件
+            yield from ticket.updates()
+            # 多副本时由 llm_router 选副本，首个分片前连接失败 / 5xx 自动换副本
+            stream = llm_router.stream(self.client, lambda url: client_at(self.client, url).chat.completions.create(
                 model=self.model,
                 messages=messages,
                 stream=True,
-                temperature=0.7 # 稍微高一点的创造性
-            )
-            for chunk in stream:
+                temperature=0.7, # 稍微高一点的创造性
+                **stream_options(),
+            ))
+            for chunk in observe_stream(stream, self.model):
+                # include_usage 时最后一个分片只有 usage，没有 choices
+                if not chunk.choices:
+                    continue
                 # 尝试获取推理内容（部分模型如 DeepSeek R1 支持）
                 reasoning = ""
                 if hasattr(chunk.choices[0].delta, 'reasoning_content') and chunk.choices[0].delta.reasoning_content:
@@ -50,6 +61,8 @@ class PromptOptimize:
                     yield content
         except Exception as e:
             yield f"Error: {str(e)}"
+        finally:
+            ticket.release()
 
 prompt_optimize_service = PromptOptimize()
 
@@ -5,6 +5,8 @@ from openai import AsyncOpenAI
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from .db_async_config import engine, Config
+from utils.llm_admission import llm_admission, PRIORITY_BACKGROUND
+from utils.llm_router import llm_router, client_at
 
 class SessionTitleGenerator:
     def __init__(self):
@@ -66,13 +68,14 @@ class SessionTitleGenerator:
         try:
             # 1. 调用模型
             try:
-                resp = await self.client.chat.completions.create(
-                    model=Config.LOCAL_MODEL,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.3,
-                    top_p=0.8,
-                    max_tokens=512
-                )
+                async with llm_admission.aslot(self.client, PRIORITY_BACKGROUND, user=f"session:{session_id}"):
+                    resp = await llm_router.acall(self.client, lambda url: client_at(self.client, url).chat.completions.create(
+                        model=Config.LOCAL_MODEL,
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=0.3,
+                        top_p=0.8,
+                        max_tokens=512
+                    ))
                 
                 raw_title = (resp.choices[0].message.content or "").strip()
                 raw_lower = raw_title.lower()
@@ -2,13 +2,16 @@ import re
 import time
 from typing import Generator
 from utils.lyf.base_prompt_ai import base_ai
+from utils.metrics import observe_stream, stream_options
+from utils.llm_admission import llm_admission, PRIORITY_DRAFTING
+from utils.llm_router import llm_router, client_at
 
 class PromptTest:
     def __init__(self):
         self.client = base_ai.get_client()
         self.model = base_ai.get_model_name()
 
-    def run_test_stream(self, system_prompt_content: str, user_test_input: str = None) -> Generator[str, None, None]:
+    def run_test_stream(self, system_prompt_content: str, user_test_input: str = None, user_id=None) -> Generator[str, None, None]:
         """
         流式测试模式：实时输出所有内容（包括 <think>，由前端解析）
         如果 user_test_input 为空，则只发送 system_prompt，让 AI 直接根据提示词模板输出
@@ -19,15 +22,23 @@ class PromptTest:
         if user_test_input and user_test_input.strip():
             messages.append({"role": "user", "content": user_test_input})
 
+        ticket = llm_admission.request(self.client, PRIORITY_DRAFTING, user=user_id)
         try:
-            stream = self.client.chat.completions.create(
+            # 排队期间产生 QueueUpdate，由接口层转成 SSE queue 事件
+            yield from ticket.updates()
+            # 多副本时由 llm_router 选副本，首个分片前连接失败 / 5xx 自动换副本
+            stream = llm_router.stream(self.client, lambda url: client_at(self.client, url).chat.completions.create(
                 model=self.model,
                 messages=messages,
                 stream=True,
-                temperature=0.3
-            )
+                temperature=0.3,
+                **stream_options(),
+            ))
 
-            for chunk in stream:
+            for chunk in observe_stream(stream, self.model):
+                # include_usage 时最后一个分片只有 usage，没有 choices
+                if not chunk.choices:
+                    continue
                 # 透传推理内容（如果有）
                 # 注意：这里我们选择将推理内容也作为普通内容返回，或者你可以选择加上 <think> 标签
                 # 考虑到测试接口的通用性，我们暂且让它自然流出
@@ -41,6 +52,8 @@ class PromptTest:
 
         except Exception as e:
             yield f"Error: {str(e)}"
+        finally:
+            ticket.release()
 
 prompt_test_service = PromptTest()
 
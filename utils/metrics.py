@@ -0,0 +1,633 @@
+import os
+import time
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# Prometheus 文本格式指标 (进程内注册表)
+# ==========================================
+# 不依赖 prometheus_client：只需要 Counter / Gauge / Histogram 三种类型和 /metrics 文本输出。
+# 多 worker 部署时每个进程各自统计，由 Prometheus 按实例抓取后聚合。
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# 流式请求末尾是否请求 usage (stream_options.include_usage)，用于统计输入 token 与前缀缓存命中 token；
+# 个别不支持该参数的在线接口可设为 0
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "1") == "1"
+
+# 普通接口耗时
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 流式接口 / LLM 全程耗时 (长回答可达数分钟)
+STREAM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+# token 间隔
+TOKEN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+# 吞吐 (token/s)
+RATE_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500)
+# 进程内存 (字节)
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768))
+
+_registry_lock = threading.Lock()
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._functions = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def set_function(self, fn, **labels):
+        """抓取时调用 fn() 取值，用于信号量占用、丢弃计数等由外部对象持有的状态"""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def _current_values(self):
+        with self._lock:
+            items = dict(self._values)
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                items[key] = fn()
+            except Exception:
+                continue
+        return items
+
+    def _render_samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in self._current_values().items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _render_samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in self._current_values().items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _render_samples(self):
+        with self._lock:
+            items = [(k, list(s[0]), s[1], s[2]) for k, s in self._values.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render_metrics():
+    """输出 Prometheus 文本格式 (text/plain; version=0.0.4)"""
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(m.render() for m in metrics) + "\n"
+
+# ==========================================
+# 1. HTTP 接口指标
+# ==========================================
+
+HTTP_REQUESTS = Counter(
+    "report_http_requests_total", "HTTP 请求数", ("router", "method", "path", "status"))
+HTTP_DURATION = Histogram(
+    "report_http_request_duration_seconds", "HTTP 请求耗时 (流式接口统计到响应体发送完毕)",
+    ("router", "method", "path"), buckets=STREAM_BUCKETS)
+HTTP_IN_FLIGHT = Gauge(
+    "report_http_requests_in_flight", "正在处理的 HTTP 请求数")
+
+
+def _route_labels(scope):
+    """
+    使用路由模板而不是原始 URL 作为标签，避免路径参数导致标签数量爆炸。
+    router 取 endpoint 所在模块名 (如 ai_search_api)。
+    """
+    route = scope.get("route")
+    if route is not None:
+        endpoint = getattr(route, "endpoint", None)
+        module = getattr(endpoint, "__module__", "") or ""
+        return module.rsplit(".", 1)[-1] or "app", getattr(route, "path", "unknown")
+    endpoint = scope.get("endpoint")
+    if endpoint is not None and type(endpoint).__name__ == "StaticFiles":
+        return "static", scope.get("root_path", "") or "static"
+    return "unmatched", "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 中间件 (不使用 BaseHTTPMiddleware)：
+    StreamingResponse 的耗时统计到最后一个 body 分片发送完毕，而不是响应头发出时。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            router, path = _route_labels(scope)
+            method = scope.get("method", "")
+            HTTP_REQUESTS.inc(router=router, method=method, path=path, status=status["code"])
+            HTTP_DURATION.observe(time.perf_counter() - start, router=router, method=method, path=path)
+
+# ==========================================
+# 2. LLM 流式生成指标
+# ==========================================
+
+LLM_STREAMS = Counter(
+    "report_llm_streams_total", "LLM 流式请求数", ("model", "outcome"))
+LLM_STREAMS_IN_FLIGHT = Gauge(
+    "report_llm_streams_in_flight", "正在进行的 LLM 流式请求数", ("model",))
+LLM_TTFT = Histogram(
+    "report_llm_time_to_first_token_seconds", "首 token 延迟", ("model",), buckets=STREAM_BUCKETS)
+LLM_INTER_TOKEN = Histogram(
+    "report_llm_inter_token_seconds", "相邻两个输出分片的间隔", ("model",), buckets=TOKEN_BUCKETS)
+LLM_DURATION = Histogram(
+    "report_llm_stream_duration_seconds", "LLM 流式请求总耗时", ("model",), buckets=STREAM_BUCKETS)
+LLM_TOKENS = Counter(
+    "report_llm_output_chunks_total", "LLM 输出分片数 (近似 token 数)", ("model",))
+LLM_TOKEN_RATE = Histogram(
+    "report_llm_tokens_per_second", "单次请求的输出速率 (首 token 之后)", ("model",), buckets=RATE_BUCKETS)
+# 服务端 usage 统计 (需要 LLM_STREAM_USAGE=1；vLLM 需开启 --enable-prompt-tokens-details 才返回 cached_tokens)
+LLM_PROMPT_TOKENS = Counter(
+    "report_llm_prompt_tokens_total", "输入 token 数", ("model",))
+LLM_CACHED_PROMPT_TOKENS = Counter(
+    "report_llm_prompt_cached_tokens_total", "命中服务端前缀缓存的输入 token 数", ("model",))
+# 客户端断开后提前中止的流式请求 (utils.sse)
+SSE_CLIENT_DISCONNECTS = Counter(
+    "report_sse_client_disconnects_total", "流式响应未结束时客户端断开的次数")
+LLM_GPU_SECONDS_SAVED = Counter(
+    "report_llm_gpu_seconds_saved_total",
+    "提前中止节省的模型服务时间估算 (同模型完整请求平均耗时 - 中止时已耗时)", ("model",))
+
+
+# LLM 准入控制 (utils.llm_admission)
+LLM_ADMISSION_WAITING = Gauge(
+    "report_llm_admission_waiting", "排队等待模型并发名额的请求数", ("backend",))
+LLM_ADMISSION_ACTIVE = Gauge(
+    "report_llm_admission_active", "占用模型并发名额的请求数", ("backend",))
+LLM_ADMISSION_WAIT = Histogram(
+    "report_llm_admission_wait_seconds", "获得模型并发名额前的排队时长", ("priority",), buckets=STREAM_BUCKETS)
+LLM_ADMISSION_REJECTED = Counter(
+    "report_llm_admission_timeouts_total", "排队超时被拒绝的请求数", ("backend", "priority"))
+
+# LLM 多副本路由 (utils.llm_router)
+LLM_ENDPOINT_UP = Gauge(
+    "report_llm_endpoint_up", "模型副本是否可用 (健康检查通过且未熔断)", ("pool", "endpoint"))
+LLM_ENDPOINT_OUTSTANDING = Gauge(
+    "report_llm_endpoint_outstanding", "发往模型副本且尚未结束的请求数", ("endpoint",))
+LLM_ENDPOINT_LATENCY = Gauge(
+    "report_llm_endpoint_latency_seconds", "模型副本首个分片延迟的滑动平均", ("endpoint",))
+LLM_ROUTER_FAILOVERS = Counter(
+    "report_llm_router_failovers_total", "首个分片返回前失败、切换到其他副本的次数", ("pool",))
+LLM_CIRCUIT_OPENS = Counter(
+    "report_llm_circuit_opens_total", "模型副本熔断次数", ("endpoint",))
+
+# 响应缓存 (utils.response_cache)
+LLM_RESPONSE_CACHE = Counter(
+    "report_llm_response_cache_total", "LLM 响应缓存查询次数", ("kind", "result"))
+
+
+def model_label(model):
+    """模型名称标签：接受字符串，或 LangChain 模型对象 (ChatOpenAI.model_name / ChatOllama.model)"""
+    if isinstance(model, str):
+        return model
+    return getattr(model, "model_name", None) or getattr(model, "model", None) or "unknown"
+
+
+def _chunk_model(chunk):
+    """
+    分片中服务端实际使用的模型 ID，没有时返回 None。
+    OpenAI SDK: chunk.model；LangChain: chunk.response_metadata["model_name"] / ["model"]
+    """
+    model = getattr(chunk, "model", None)
+    if isinstance(model, str) and model:
+        return model
+    metadata = getattr(chunk, "response_metadata", None) or {}
+    model = metadata.get("model_name") or metadata.get("model")
+    return model if isinstance(model, str) and model else None
+
+
+def stream_options():
+    """OpenAI SDK 流式请求的附加参数：chat.completions.create(..., stream=True, **stream_options())"""
+    return {"stream_options": {"include_usage": True}} if LLM_STREAM_USAGE else {}
+
+
+def _chunk_usage(chunk):
+    """
+    从分片中取 (输入 token, 缓存命中 token)，没有 usage 时返回 None。
+    OpenAI SDK: chunk.usage.prompt_tokens / prompt_tokens_details.cached_tokens
+    LangChain:  chunk.usage_metadata["input_tokens"] / ["input_token_details"]["cache_read"]
+    """
+    usage = getattr(chunk, "usage", None)
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        return usage.prompt_tokens, getattr(details, "cached_tokens", None) or 0
+    metadata = getattr(chunk, "usage_metadata", None)
+    if metadata and metadata.get("input_tokens"):
+        details = metadata.get("input_token_details") or {}
+        return metadata["input_tokens"], details.get("cache_read") or 0
+    return None
+
+
+def _chunk_has_text(chunk):
+    """兼容 LangChain 消息分片、OpenAI SDK ChatCompletionChunk 和纯字符串"""
+    if isinstance(chunk, str):
+        return bool(chunk)
+    content = getattr(chunk, "content", None)
+    if content is not None:
+        return bool(content)
+    choices = getattr(chunk, "choices", None)
+    if choices:
+        delta = getattr(choices[0], "delta", None)
+        return bool(getattr(delta, "content", None) or getattr(delta, "reasoning_content", None))
+    return False
+
+
+# 模型 -> 完整流式请求耗时的指数滑动平均，用于估算中止请求节省的时间
+_DURATION_EWMA_ALPHA = 0.2
+_duration_ewma = {}
+_duration_lock = threading.Lock()
+
+
+def _record_duration(model, outcome, elapsed):
+    with _duration_lock:
+        expected = _duration_ewma.get(model)
+        if outcome == "ok":
+            _duration_ewma[model] = elapsed if expected is None else expected + _DURATION_EWMA_ALPHA * (elapsed - expected)
+            return
+    if outcome == "cancelled" and expected is not None and expected > elapsed:
+        LLM_GPU_SECONDS_SAVED.inc(expected - elapsed, model=model)
+
+
+class _StreamObserver:
+    def __init__(self, model):
+        self.model = model_label(model)
+        self.start = time.perf_counter()
+        self.first = None
+        self.last = None
+        self.chunks = 0
+        self.done = False
+        self.resolved = False
+        LLM_STREAMS_IN_FLIGHT.inc(model=self.model)
+
+    def _resolve(self, chunk):
+        """
+        请求中的模型名可能是别名或默认值，以服务端返回的模型 ID 为准。
+        只在第一个内容分片之前改标签，保证同一个流的所有指标落在同一个模型下
+        """
+        resolved = _chunk_model(chunk)
+        if resolved is None:
+            return
+        self.resolved = True
+        if resolved != self.model:
+            LLM_STREAMS_IN_FLIGHT.dec(model=self.model)
+            self.model = resolved
+            LLM_STREAMS_IN_FLIGHT.inc(model=self.model)
+
+    def chunk(self, chunk):
+        if not self.resolved and self.first is None:
+            self._resolve(chunk)
+        if not _chunk_has_text(chunk):
+            usage = _chunk_usage(chunk)
+            if usage is not None:
+                prompt_tokens, cached_tokens = usage
+                LLM_PROMPT_TOKENS.inc(prompt_tokens, model=self.model)
+                LLM_CACHED_PROMPT_TOKENS.inc(cached_tokens, model=self.model)
+            return
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+            LLM_TTFT.observe(now - self.start, model=self.model)
+        else:
+            LLM_INTER_TOKEN.observe(now - self.last, model=self.model)
+        self.last = now
+        self.chunks += 1
+
+    def finish(self, outcome):
+        if self.done:
+            return
+        self.done = True
+        LLM_STREAMS_IN_FLIGHT.dec(model=self.model)
+        LLM_STREAMS.inc(model=self.model, outcome=outcome)
+        elapsed = time.perf_counter() - self.start
+        LLM_DURATION.observe(elapsed, model=self.model)
+        _record_duration(self.model, outcome, elapsed)
+        if self.chunks:
+            LLM_TOKENS.inc(self.chunks, model=self.model)
+            generation_time = self.last - self.first
+            if self.chunks > 1 and generation_time > 0:
+                LLM_TOKEN_RATE.observe((self.chunks - 1) / generation_time, model=self.model)
+
+
+def _close_stream(stream):
+    """提前结束时关闭上游流 (LangChain 生成器 / OpenAI Stream)，断开到模型服务的 HTTP 连接，服务端随即中止生成"""
+    close = getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception as e:
+        logger.debug(f"关闭 LLM 流失败: {e}")
+
+
+async def _aclose_stream(stream):
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if asyncio.iscoroutine(result):
+            await result
+    except Exception as e:
+        logger.debug(f"关闭 LLM 流失败: {e}")
+
+
+def observe_stream(stream, model):
+    """
+    包装同步 LLM 流 (llm.stream(...) / OpenAI stream=True)，逐个透传分片并记录指标。
+    调用方提前关闭 (客户端断开) 时同时关闭上游流。
+    用法: for chunk in observe_stream(llm.stream(messages), llm): ...
+    """
+    if not METRICS_ENABLED:
+        yield from stream
+        return
+    obs = _StreamObserver(model)
+    try:
+        for chunk in stream:
+            obs.chunk(chunk)
+            yield chunk
+        obs.finish("ok")
+    except GeneratorExit:
+        obs.finish("cancelled")
+        _close_stream(stream)
+        raise
+    except Exception:
+        obs.finish("error")
+        raise
+    finally:
+        obs.finish("cancelled")
+
+
+async def aobserve_stream(stream, model):
+    """observe_stream 的异步版本 (llm.astream(...) / AsyncOpenAI stream=True)"""
+    if not METRICS_ENABLED:
+        try:
+            async for chunk in stream:
+                yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            await _aclose_stream(stream)
+            raise
+        return
+    obs = _StreamObserver(model)
+    try:
+        async for chunk in stream:
+            obs.chunk(chunk)
+            yield chunk
+        obs.finish("ok")
+    except (GeneratorExit, asyncio.CancelledError):
+        obs.finish("cancelled")
+        await _aclose_stream(stream)
+        raise
+    except Exception:
+        obs.finish("error")
+        raise
+    finally:
+        obs.finish("cancelled")
+
+# ==========================================
+# 3. 数据库连接池指标 (SQLAlchemy pool events)
+# ==========================================
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "report_db_pool_checked_out", "当前借出的数据库连接数", ("database",))
+DB_POOL_CHECKOUTS = Counter(
+    "report_db_pool_checkouts_total", "连接池借出次数", ("database",))
+DB_POOL_CONNECTS = Counter(
+    "report_db_pool_connects_total", "新建物理连接次数 (频繁新建说明连接池未复用)", ("database",))
+DB_POOL_INVALIDATIONS = Counter(
+    "report_db_pool_invalidations_total", "连接失效次数", ("database",))
+DB_POOL_HOLD = Histogram(
+    "report_db_pool_hold_seconds", "连接从借出到归还的时长 (长时间占用是连接池等待的主要原因)",
+    ("database",))
+
+_pool_instrumented = False
+
+
+def _db_label(dbapi_connection):
+    for conn in (dbapi_connection, getattr(dbapi_connection, "_connection", None)):
+        db = getattr(conn, "db", None)
+        if db:
+            return db.decode() if isinstance(db, bytes) else str(db)
+    return "unknown"
+
+
+def _on_connect(dbapi_connection, connection_record):
+    label = _db_label(dbapi_connection)
+    connection_record.info["metrics_db"] = label
+    DB_POOL_CONNECTS.inc(database=label)
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    label = connection_record.info.get("metrics_db", "unknown")
+    connection_record.info["metrics_checkout_at"] = time.perf_counter()
+    DB_POOL_CHECKED_OUT.inc(database=label)
+    DB_POOL_CHECKOUTS.inc(database=label)
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    checkout_at = connection_record.info.pop("metrics_checkout_at", None)
+    if checkout_at is None:
+        return
+    label = connection_record.info.get("metrics_db", "unknown")
+    DB_POOL_CHECKED_OUT.dec(database=label)
+    DB_POOL_HOLD.observe(time.perf_counter() - checkout_at, database=label)
+
+
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    DB_POOL_INVALIDATIONS.inc(database=connection_record.info.get("metrics_db", "unknown"))
+
+
+def instrument_sqlalchemy_pools():
+    """
+    在 Pool 类上注册事件，覆盖项目中所有 create_engine / create_async_engine 创建的连接池。
+    需要在应用启动时调用一次。
+    """
+    global _pool_instrumented
+    if _pool_instrumented or not METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.pool import Pool
+
+    event.listen(Pool, "connect", _on_connect)
+    event.listen(Pool, "checkout", _on_checkout)
+    event.listen(Pool, "checkin", _on_checkin)
+    event.listen(Pool, "invalidate", _on_invalidate)
+    _pool_instrumented = True
+    logger.info("📈 SQLAlchemy 连接池指标已启用")
+
+# ==========================================
+# 4. 后台任务指标
+# ==========================================
+
+IMPORT_TASKS_QUEUED = Gauge(
+    "report_import_tasks_queued", "等待执行槽位的导入任务数")
+IMPORT_TASKS_RUNNING = Gauge(
+    "report_import_tasks_running", "占用执行槽位的导入任务数 (task_semaphore 占用)")
+IMPORT_TASK_SLOTS = Gauge(
+    "report_import_task_slots", "导入任务并发上限")
+IMPORT_TASKS = Counter(
+    "report_import_tasks_total", "导入任务结束数", ("status",))
+IMPORT_QUEUE_WAIT = Histogram(
+    "report_import_queue_wait_seconds", "导入任务排队等待执行槽位的时长", buckets=STREAM_BUCKETS)
+
+# 导入流水线各阶段 (由 utils.stage_profiler.StageProfiler 在每次阶段结束时记录，逐章节阶段每章记录一次)
+IMPORT_STAGE_SECONDS = Histogram(
+    "report_import_stage_seconds", "导入各阶段墙钟耗时", ("stage",), buckets=STREAM_BUCKETS)
+IMPORT_STAGE_CPU_SECONDS = Histogram(
+    "report_import_stage_cpu_seconds", "导入各阶段 CPU 耗时 (执行线程)", ("stage",), buckets=STREAM_BUCKETS)
+IMPORT_STAGE_PEAK_RSS = Histogram(
+    "report_import_stage_peak_rss_bytes", "导入各阶段执行期间的进程 RSS 峰值", ("stage",), buckets=MEMORY_BUCKETS)
+
+# 异步删除 (utils.deletion_reaper)
+DELETION_TOMBSTONES_PENDING = Gauge(
+    "report_deletion_tombstones_pending", "等待物理删除的墓碑数 (含执行中)")
+DELETION_ENTRIES_REMOVED = Counter(
+    "report_deletion_entries_removed_total", "后台删除的文件/目录数", ("kind",))
+DELETION_REAP_SECONDS = Histogram(
+    "report_deletion_reap_seconds", "单个墓碑从登记到物理删除完成的时长", ("kind",), buckets=STREAM_BUCKETS)
+DELETION_REAP_FAILURES = Counter(
+    "report_deletion_reap_failures_total", "物理删除失败次数 (会自动重试)", ("kind",))
+
+# ==========================================
+# 5. 线程池指标
+# ==========================================
+# 同步接口 (def) 和同步流式生成器 (StreamingResponse 包装的普通 generator) 都在 AnyIO 默认线程池中执行，
+# 线程池占满后新请求会排队，表现为所有同步接口同时变慢。
+
+THREADPOOL_IN_USE = Gauge(
+    "report_threadpool_in_use", "AnyIO 默认线程池已占用线程数")
+THREADPOOL_LIMIT = Gauge(
+    "report_threadpool_limit", "AnyIO 默认线程池容量")
+
+
+def instrument_threadpool():
+    """需要在事件循环内调用 (应用 lifespan 启动阶段)"""
+    if not METRICS_ENABLED:
+        return
+    from anyio import to_thread
+    limiter = to_thread.current_default_thread_limiter()
+    THREADPOOL_IN_USE.set_function(lambda: limiter.borrowed_tokens)
+    THREADPOOL_LIMIT.set_function(lambda: limiter.total_tokens)
+
+# ==========================================
+# 6. 日志指标
+# ==========================================
+
+LOG_RECORDS_DROPPED = Counter(
+    "report_log_records_dropped_total", "异步日志队列满时丢弃的日志条数")
+
+
+def instrument_logging():
+    if not METRICS_ENABLED:
+        return
+    from utils.log_config import dropped_log_records
+    LOG_RECORDS_DROPPED.set_function(dropped_log_records)
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+# ==========================================
+# 提示词布局 (面向 vLLM 自动前缀缓存)
+# ==========================================
+# vLLM 的 automatic prefix caching 按 token 块匹配请求前缀：只要前面的内容逐字节相同，就能复用已算好的 KV，
+# 跳过这部分 prefill。原来的提示词把日期等每次变化的内容放在系统提示词开头，导致每个请求都从头 prefill。
+#
+# 统一的拼接顺序:
+#   1. 静态指令 (模块级常量，所有请求共享)
+#   2. 可复用材料 (参考材料、被引用的提示词卡片等，同一任务内每轮相同)
+#   3. 历史消息 (写入会话历史的始终是原始内容，不含每轮数据)
+#   4. 本轮数据 (日期等) + 本轮输入，只出现在最后一条用户消息里
+# 这样同一任务的后续轮次，前缀一直延续到上一轮的回答末尾。
+
+
+def today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def system_prompt(instructions, *materials):
+    """静态指令在前、材料在后；各段去除首尾空白后以固定分隔符拼接，保证逐字节稳定"""
+    parts = [instructions.strip()]
+    parts.extend(m.strip() for m in materials if m and m.strip())
+    return "\n\n".join(parts)
+
+
+def materials_block(materials, label="参考材料"):
+    """
+    {名称: 正文} -> 材料段落。按名称排序：数据库返回顺序变化时前缀保持不变。
+    """
+    return "\n\n".join(
+        f"【{label}：{name}】\n{text.strip()}"
+        for name, text in sorted(materials.items())
+        if text and text.strip()
+    )
+
+
+def turn_content(content, date=True):
+    """本轮用户消息：每轮变化的数据放在这里，而不是系统提示词里。写入会话历史时使用原始 content。"""
+    if not date:
+        return content
+    return f"（今天日期：{today()}）\n{content}"
@@ -1,65 +1,226 @@
 import os
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
 import redis
+import redis.asyncio as aioredis
+from redis.client import Pipeline
+from redis.asyncio.client import Pipeline as AsyncPipeline
 import logging
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# ==========================================
+# Redis 客户端 (同步 + asyncio) 与熔断器
+# ==========================================
+# 同步客户端 (get_redis_client): 后台线程、线程池中的同步生成器使用，redis.Redis 本身线程安全。
+# 异步客户端 (get_async_redis_client): async 接口 / async 生成器使用，等待 Redis 时不阻塞事件循环。
+# 两者共享一个熔断器: 连续 REDIS_BREAKER_FAILURES 次连接/超时错误后熔断 REDIS_BREAKER_RESET_SECONDS 秒，
+# 熔断期间 get_*_client 直接返回 None，调用方立即走内存降级逻辑，而不是每次都等 socket_timeout。
+# 熔断到期后放行一次探测请求 (半开)，成功则恢复，失败则继续熔断；
+# 探测请求 REDIS_BREAKER_TRIAL_SECONDS 秒内没有结果 (拿到客户端后没有发出命令) 时重新熔断，等下一轮探测。
+
+REDIS_BREAKER_FAILURES = int(os.getenv("REDIS_BREAKER_FAILURES", 3))
+REDIS_BREAKER_RESET_SECONDS = float(os.getenv("REDIS_BREAKER_RESET_SECONDS", 30))
+REDIS_BREAKER_TRIAL_SECONDS = float(os.getenv("REDIS_BREAKER_TRIAL_SECONDS", 10))
+REDIS_ASYNC_MAX_CONNECTIONS = int(os.getenv("REDIS_ASYNC_MAX_CONNECTIONS", 50))
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout, trial_timeout=REDIS_BREAKER_TRIAL_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trial_timeout = trial_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否允许访问 Redis；熔断到期后只放行一个探测请求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN and now - self._trial_at >= self.trial_timeout:
+                # 探测请求迟迟没有结果：重新熔断，reset_timeout 后再放行下一个探测请求
+                self.state = self.OPEN
+                self._opened_at = now
+                return False
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_at = now
+                return True
+            return False
+
+    @contextmanager
+    def track(self):
+        """
+        包住一条命令 / 一次 pipeline 执行，任何退出路径都反馈结果:
+        连接/超时错误计为失败；其他异常 (ResponseError、CancelledError 等) 说明 Redis 可达，计为成功。
+        """
+        failed = False
+        try:
+            yield
+        except _BREAKER_ERRORS:
+            failed = True
+            self.record_failure()
+            raise
+        finally:
+            if not failed:
+                self.record_success()
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("✅ Redis 恢复，熔断关闭")
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.error(f"❌ Redis 连续失败 {self._failures} 次，熔断 {self.reset_timeout}s (期间使用内存降级)")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(REDIS_BREAKER_FAILURES, REDIS_BREAKER_RESET_SECONDS)
+
+# 只有连接类错误计入熔断；WRONGTYPE、脚本错误等属于调用方问题
+_BREAKER_ERRORS = (redis.ConnectionError, redis.TimeoutError, OSError, asyncio.TimeoutError)
+
+
+class _BreakerPipeline(Pipeline):
+    def execute(self, raise_on_error=True):
+        with breaker.track():
+            return super().execute(raise_on_error)
+
+
+class _BreakerRedis(redis.Redis):
+    """每条命令 / 每次 pipeline 执行的结果反馈给熔断器"""
+
+    def execute_command(self, *args, **options):
+        with breaker.track():
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _BreakerPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _AsyncBreakerPipeline(AsyncPipeline):
+    async def execute(self, raise_on_error=True):
+        with breaker.track():
+            return await super().execute(raise_on_error)
+
+
+class _AsyncBreakerRedis(aioredis.Redis):
+    async def execute_command(self, *args, **options):
+        with breaker.track():
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _AsyncBreakerPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def _connection_kwargs():
+    return dict(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        password=os.getenv("REDIS_PASSWORD", ""),
+        db=int(os.getenv("REDIS_DB", 0)),
+        decode_responses=True,  # Return strings
+        socket_timeout=2,
+        socket_connect_timeout=2,
+    )
+
+
 class RedisClient:
     _instance = None
     _pool = None
-    
+    _lock = threading.Lock()
+    # asyncio 连接绑定创建它的事件循环，按循环缓存
+    _async_instance = None
+    _async_loop = None
+
     @classmethod
     def get_client(cls):
         """
         Get a Redis client instance.
-        Returns None if REDIS_ENABLED is not '1' or if connection fails.
+        Returns None if REDIS_ENABLED is not '1', if connection fails, or while the breaker is open.
         """
         if os.getenv("REDIS_ENABLED", "0") != "1":
             return None
+        if not breaker.allow():
+            return None
 
         if cls._instance is None:
-            try:
-                cls._instance = cls._create_client()
-            except Exception as e:
-                logger.error(f"Failed to initialize Redis client: {e}")
-                return None
+            with cls._lock:
+                if cls._instance is None:
+                    try:
+                        cls._instance = cls._create_client()
+                    except Exception as e:
+                        logger.error(f"Failed to initialize Redis client: {e}")
+                        breaker.record_failure()
+                        return None
         return cls._instance
 
     @classmethod
     def _create_client(cls):
-        host = os.getenv("REDIS_HOST", "localhost")
-        port = int(os.getenv("REDIS_PORT", 6379))
-        password = os.getenv("REDIS_PASSWORD", "")
-        db = int(os.getenv("REDIS_DB", 0))
-        
+        kwargs = _connection_kwargs()
+
         # Use ConnectionPool for better performance
         if cls._pool is None:
-            cls._pool = redis.ConnectionPool(
-                host=host,
-                port=port,
-                password=password,
-                db=db,
-                decode_responses=True, # Return strings
-                socket_timeout=2,
-                socket_connect_timeout=2,
-                retry_on_timeout=True
-            )
-        
-        client = redis.Redis(connection_pool=cls._pool)
-        
+            cls._pool = redis.ConnectionPool(retry_on_timeout=True, **kwargs)
+
+        client = _BreakerRedis(connection_pool=cls._pool)
+
         # Quick health check
         try:
             client.ping()
-            logger.info(f"Redis connected successfully to {host}:{port}/{db}")
+            logger.info(f"Redis connected successfully to {kwargs['host']}:{kwargs['port']}/{kwargs['db']}")
         except redis.ConnectionError as e:
             logger.error(f"Redis connection ping failed: {e}")
-            # We return the client anyway, as it might recover, 
-            # but usually we might want to return None if strictly unavailable.
-            # For now, let's return None to trigger fallback logic immediately if down.
+            # Return None to trigger fallback logic immediately if down;
+            # the breaker keeps us from retrying the connect on every call.
             return None
-            
+
         return client
 
+    @classmethod
+    def get_async_client(cls):
+        """
+        asyncio 客户端 (自带连接池，默认最多 REDIS_ASYNC_MAX_CONNECTIONS 个连接)。
+        不做同步 ping：连接错误由熔断器记录，调用方按异常降级。
+        """
+        if os.getenv("REDIS_ENABLED", "0") != "1":
+            return None
+        if not breaker.allow():
+            return None
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if cls._async_instance is None or cls._async_loop is not loop:
+            pool = aioredis.ConnectionPool(max_connections=REDIS_ASYNC_MAX_CONNECTIONS, **_connection_kwargs())
+            cls._async_instance = _AsyncBreakerRedis(connection_pool=pool)
+            cls._async_loop = loop
+        return cls._async_instance
+
+
 def get_redis_client():
     return RedisClient.get_client()
+
+
+def get_async_redis_client():
+    return RedisClient.get_async_client()
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+from utils.metrics import LLM_RESPONSE_CACHE
+from utils.redis_client import get_redis_client
+from utils.shared_state import state_key
+from utils.sse import event, DONE
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# LLM 响应精确匹配缓存 (Redis)
+# ==========================================
+# 摘要 (ai_summary_stream) 与文本润色 (optimize_text_stream) 经常收到完全相同的请求：
+# 前端网络抖动后重试、确定性 (temperature=0) 的相同请求等。每次重复都要完整生成一遍。
+# 开启后按 sha256(功能, 模型 ID, 采样温度, 重新生成标识, 解析后的提示词, 输入文本) 缓存完整输出，
+# 命中时直接按 SSE 回放，不排队、不访问模型。
+# 采样温度大于 0 的调用只在前端带了重新生成标识 (nonce) 时缓存，见 cache_key。
+#
+# 默认关闭 (LLM_RESPONSE_CACHE_ENABLED=1 且 REDIS_ENABLED=1 时生效)，Redis 不可用时视为未命中。
+# 容量控制:
+#   - 单条超过 LLM_RESPONSE_CACHE_MAX_BYTES 不缓存；
+#   - 每种功能一个有序集合索引 (成员为 key，分值为写入时间)，超过 LLM_RESPONSE_CACHE_MAX_ENTRIES 时淘汰最早写入的条目；
+#   - 每条带 TTL (LLM_RESPONSE_CACHE_TTL 秒)。
+
+LLM_RESPONSE_CACHE_ENABLED = os.getenv("LLM_RESPONSE_CACHE_ENABLED", "0") == "1"
+LLM_RESPONSE_CACHE_TTL = int(os.getenv("LLM_RESPONSE_CACHE_TTL", 86400))
+LLM_RESPONSE_CACHE_MAX_BYTES = int(os.getenv("LLM_RESPONSE_CACHE_MAX_BYTES", 256 * 1024))
+LLM_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", 5000))
+# 回放时每个 SSE 分片的字符数
+REPLAY_CHUNK_CHARS = 256
+
+
+def _client():
+    if not LLM_RESPONSE_CACHE_ENABLED:
+        return None
+    return get_redis_client()
+
+
+def _index_key(kind):
+    return state_key("llm_cache", kind, "index")
+
+
+def cache_key(kind, model_id, *parts, temperature=0, nonce=None):
+    """
+    缓存 key：功能 + 模型 ID + 采样温度 + 重新生成标识 + 各组成部分 (提示词、输入文本等) 的 sha256
+
+    temperature > 0 时输出不确定，同一输入缓存下来会让用户在 TTL 内永远拿到同一个版本、无法重新生成。
+    此时只有前端带了 nonce (同一次生成的重试带相同 nonce，点"重新生成"换新 nonce) 才缓存，否则返回 None (不缓存)。
+    """
+    if temperature and not nonce:
+        return None
+    digest = hashlib.sha256(
+        json.dumps([kind, str(model_id), temperature, nonce, *parts], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return state_key("llm_cache", kind, digest)
+
+
+def lookup(kind, key):
+    """命中返回缓存的完整输出，否则返回 None (未开启或 key 为 None 时同样返回 None，且不计指标)"""
+    if key is None:
+        return None
+    client = _client()
+    if client is None:
+        return None
+    try:
+        content = client.get(key)
+    except Exception as e:
+        logger.warning(f"⚠️ 读取响应缓存失败: {e}")
+        content = None
+    LLM_RESPONSE_CACHE.inc(kind=kind, result="hit" if content is not None else "miss")
+    return content
+
+
+def store(kind, key, content):
+    """写入一条完整输出 (仅在生成成功结束后调用)"""
+    client = _client()
+    if client is None or key is None or not content:
+        return
+    if len(content.encode("utf-8")) > LLM_RESPONSE_CACHE_MAX_BYTES:
+        LLM_RESPONSE_CACHE.inc(kind=kind, result="oversize")
+        return
+
+    index = _index_key(kind)
+    now = time.time()
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.set(key, content, ex=LLM_RESPONSE_CACHE_TTL)
+        pipe.zadd(index, {key: now})
+        # 已过期的条目从索引移除
+        pipe.zremrangebyscore(index, 0, now - LLM_RESPONSE_CACHE_TTL)
+        pipe.zcard(index)
+        size = pipe.execute()[-1]
+
+        overflow = size - LLM_RESPONSE_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            evicted = [member for member, _ in client.zpopmin(index, overflow)]
+            if evicted:
+                client.delete(*evicted)
+    except Exception as e:
+        logger.warning(f"⚠️ 写入响应缓存失败: {e}")
+
+
+def replay(content):
+    """按 SSE 格式回放缓存内容 (不限速)，每个分片带 cached 标记"""
+    for start in range(0, len(content), REPLAY_CHUNK_CHARS):
+        chunk = content[start:start + REPLAY_CHUNK_CHARS]
+        yield event({"content": chunk, "cached": True})
+    yield DONE
@@ -0,0 +1,525 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from contextvars import ContextVar
+
+from utils.redis_client import get_redis_client, get_async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# 多进程共享状态 (Redis) 与本地内存替身
+# ==========================================
+# MULTI_WORKER=1 时 (gunicorn 多 worker 部署)，任务状态、会话、模型状态、并发信号量全部放在 Redis，
+# 任一 worker 都能查询其他 worker 创建的任务，并发上限对整个服务生效而不是每个进程各算一份。
+# MULTI_WORKER=0 (默认，单进程 uvicorn / 测试) 时使用进程内存实现，行为与原来一致。
+#
+# 信号量实现: Redis 有序集合，成员为持有者 token，分值为租约到期时间 (Redis 服务器时间)。
+# 持有者进程崩溃后租约到期自动释放，不会永久占用名额；进程存活期间由后台线程定期续约。
+# acquire 返回本次获得的名额 (lease token)，release 必须传回同一个 token：
+# 同一进程内的多个持有者并发释放时各自释放自己的名额，不会互相释放对方的租约。
+
+MULTI_WORKER = os.getenv("MULTI_WORKER", "0") == "1"
+SEMAPHORE_LEASE_SECONDS = int(os.getenv("SEMAPHORE_LEASE_SECONDS", 60))
+
+_prefix = os.getenv("REDIS_PREFIX", "langextract")
+_env = os.getenv("ENV", "dev")
+
+
+def state_key(*parts):
+    return ":".join([_prefix, _env, *[str(p) for p in parts]])
+
+
+def redis_state_enabled(feature_env=None):
+    """
+    多 worker 模式下共享状态必须使用 Redis；
+    单进程模式下沿用各功能原有的开关 (REDIS_ENABLED + 具体功能开关)。
+    """
+    if MULTI_WORKER:
+        return True
+    if feature_env is None:
+        return False
+    return os.getenv(feature_env, "0") == "1" and os.getenv("REDIS_ENABLED", "0") == "1"
+
+
+def check_shared_state():
+    """应用启动时调用：多 worker 模式下 Redis 不可用直接启动失败，避免各 worker 状态悄悄分裂"""
+    if not MULTI_WORKER:
+        return
+    if os.getenv("REDIS_ENABLED", "0") != "1" or get_redis_client() is None:
+        raise RuntimeError("MULTI_WORKER=1 需要可用的 Redis (REDIS_ENABLED=1 且能够连接)")
+    logger.info(f"🚀 多 worker 模式: 共享状态使用 Redis (pid={os.getpid()})")
+
+# ==========================================
+# 1. 信号量
+# ==========================================
+
+# KEYS[1] 集合 key；ARGV: token, limit, lease_ms
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+    redis.call('PEXPIRE', KEYS[1], tonumber(ARGV[3]) * 2)
+    return 1
+end
+return 0
+"""
+
+# ARGV: token, lease_ms；返回 0 表示租约已丢失
+_RENEW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+    redis.call('PEXPIRE', KEYS[1], tonumber(ARGV[2]) * 2)
+    return 1
+end
+return 0
+"""
+
+
+class _LeaseKeeper:
+    """进程内唯一的续约线程，覆盖本进程持有的所有 Redis 信号量名额"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._leases = {}
+        self._thread = None
+
+    def add(self, key, token):
+        with self._lock:
+            self._leases[token] = key
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="semaphore-lease", daemon=True)
+                self._thread.start()
+
+    def remove(self, token):
+        with self._lock:
+            self._leases.pop(token, None)
+
+    def _run(self):
+        lease_ms = SEMAPHORE_LEASE_SECONDS * 1000
+        while True:
+            time.sleep(max(SEMAPHORE_LEASE_SECONDS / 3, 1))
+            with self._lock:
+                leases = list(self._leases.items())
+            if not leases:
+                continue
+            client = get_redis_client()
+            if client is None:
+                continue
+            for token, key in leases:
+                try:
+                    if not client.eval(_RENEW_SCRIPT, 1, key, token, lease_ms):
+                        logger.warning(f"⚠️ 信号量租约已过期: {key} ({token})")
+                        self.remove(token)
+                except Exception as e:
+                    logger.error(f"信号量续约失败 {key}: {e}")
+
+
+_lease_keeper = _LeaseKeeper()
+
+
+# 退回本地信号量时获得的名额 token 前缀
+_LOCAL = "local:"
+_ASYNC_LOCAL = "async-local:"
+
+
+class _LeaseStack:
+    """with / async with 用法下记录本上下文 (线程 / 协程) 获得的名额，__exit__ 时释放自己的那个"""
+
+    def __init__(self, name):
+        self._tokens = ContextVar(f"semaphore_leases:{name}", default=())
+
+    def push(self, token):
+        self._tokens.set(self._tokens.get() + (token,))
+
+    def pop(self):
+        tokens = self._tokens.get()
+        self._tokens.set(tokens[:-1])
+        return tokens[-1]
+
+
+class LocalSemaphore:
+    """进程内信号量 (单进程模式 / 测试替身)，接口与 RedisSemaphore 一致"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self._semaphore = threading.Semaphore(limit)
+
+    def acquire(self, blocking=True, timeout=None):
+        """获得名额时返回 True (本地信号量的名额无需区分)，超时返回 False"""
+        return self._semaphore.acquire(blocking, timeout)
+
+    def release(self, token=None):
+        self._semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class RedisSemaphore:
+    """
+    跨进程计数信号量。acquire 轮询等待 (非 FIFO)，release 可在任意线程调用。
+    Redis 不可用时退回进程内信号量并记录错误，保证业务不中断 (此时并发上限只在本进程内生效)。
+    """
+
+    POLL_MIN = 0.05
+    POLL_MAX = 1.0
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.key = state_key("semaphore", name)
+        self._fallback = LocalSemaphore(name, limit)
+        self._lock = threading.Lock()
+        # 本进程持有的名额 token；以 _LOCAL / _ASYNC_LOCAL 开头的是退回本地信号量时获得的名额
+        self._held = set()
+        self._context = _LeaseStack(name)
+
+    def _try_acquire(self, token):
+        client = get_redis_client()
+        if client is None:
+            raise ConnectionError("Redis unavailable")
+        return bool(client.eval(_ACQUIRE_SCRIPT, 1, self.key, token, self.limit, SEMAPHORE_LEASE_SECONDS * 1000))
+
+    def _on_acquired(self, token):
+        with self._lock:
+            self._held.add(token)
+        if not token.startswith((_LOCAL, _ASYNC_LOCAL)):
+            _lease_keeper.add(self.key, token)
+        return token
+
+    def _take(self, token):
+        with self._lock:
+            if token not in self._held:
+                raise ValueError(f"Semaphore {self.name} released a lease it does not hold: {token}")
+            self._held.discard(token)
+
+    def acquire(self, blocking=True, timeout=None):
+        """获得名额时返回 lease token (传给 release)，超时 / 非阻塞获取失败返回 None"""
+        token = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = self.POLL_MIN
+        while True:
+            try:
+                if self._try_acquire(token):
+                    return self._on_acquired(token)
+            except Exception as e:
+                logger.error(f"❌ Redis 信号量 {self.name} 不可用，退回进程内信号量: {e}")
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                if self._fallback.acquire(blocking, remaining):
+                    return self._on_acquired(_LOCAL + token)
+                return None
+            if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                return None
+            time.sleep(delay if deadline is None else min(delay, max(deadline - time.monotonic(), 0)))
+            delay = min(delay * 2, self.POLL_MAX)
+
+    def release(self, token):
+        """释放 acquire 返回的名额"""
+        self._take(token)
+        if token.startswith(_LOCAL):
+            self._fallback.release()
+            return
+        _lease_keeper.remove(token)
+        try:
+            client = get_redis_client()
+            if client is not None:
+                client.zrem(self.key, token)
+        except Exception as e:
+            # 释放失败时名额在租约到期后自动回收
+            logger.error(f"Redis 信号量 {self.name} 释放失败 (租约到期后自动回收): {e}")
+
+    def __enter__(self):
+        self._context.push(self.acquire())
+        return self
+
+    def __exit__(self, *exc):
+        self.release(self._context.pop())
+
+
+class AsyncLocalSemaphore:
+    """asyncio 版进程内信号量；延迟创建，避免在导入时绑定事件循环"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self._semaphore = None
+
+    def _get(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._semaphore
+
+    async def acquire(self, timeout=None):
+        """获得名额时返回 True，timeout 秒内未获得返回 False"""
+        try:
+            await asyncio.wait_for(self._get().acquire(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def release(self, token=None):
+        self._get().release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class AsyncRedisSemaphore(RedisSemaphore):
+    """
+    asyncio 版跨进程信号量：获取、释放名额都使用 asyncio Redis 客户端，不阻塞事件循环。
+    release 保持同步接口：__aexit__ 可能发生在任务被取消时，不能再 await，因此 ZREM 放到后台任务中执行。
+    """
+
+    def __init__(self, name, limit):
+        super().__init__(name, limit)
+        self._async_fallback = AsyncLocalSemaphore(name, limit)
+        # 进行中的释放任务 (保持引用，避免被回收)
+        self._releasing = set()
+
+    async def acquire(self, timeout=None):
+        """获得名额时返回 lease token (传给 release)，timeout 秒内未获得返回 None"""
+        token = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = self.POLL_MIN
+        while True:
+            try:
+                if await self._atry_acquire(token):
+                    return self._on_acquired(token)
+            except Exception as e:
+                logger.error(f"❌ Redis 信号量 {self.name} 不可用，退回进程内信号量: {e}")
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                if await self._async_fallback.acquire(remaining):
+                    return self._on_acquired(_ASYNC_LOCAL + token)
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(delay if deadline is None else min(delay, max(deadline - time.monotonic(), 0)))
+            delay = min(delay * 2, self.POLL_MAX)
+
+    async def _atry_acquire(self, token):
+        client = get_async_redis_client()
+        if client is None:
+            raise ConnectionError("Redis unavailable")
+        return bool(await client.eval(_ACQUIRE_SCRIPT, 1, self.key, token, self.limit,
+                                      SEMAPHORE_LEASE_SECONDS * 1000))
+
+    def release(self, token):
+        """释放 acquire 返回的名额 (可在事件循环内外调用)"""
+        if token.startswith(_ASYNC_LOCAL):
+            self._take(token)
+            self._async_fallback.release()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中 (同步代码、线程池) 时直接同步释放
+            super().release(token)
+            return
+        self._take(token)
+        _lease_keeper.remove(token)
+        task = loop.create_task(self._arelease(token))
+        self._releasing.add(task)
+        task.add_done_callback(self._releasing.discard)
+
+    async def _arelease(self, token):
+        try:
+            client = get_async_redis_client()
+            if client is not None:
+                await client.zrem(self.key, token)
+        except Exception as e:
+            logger.error(f"Redis 信号量 {self.name} 释放失败 (租约到期后自动回收): {e}")
+
+    async def __aenter__(self):
+        self._context.push(await self.acquire())
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release(self._context.pop())
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def _named_semaphore(kind, name, limit, factory):
+    # 同名信号量在进程内只创建一个实例，多次实例化的服务类 (如 PromptChat) 也共享同一个上限
+    with _semaphores_lock:
+        semaphore = _semaphores.get((kind, name))
+        if semaphore is None:
+            semaphore = _semaphores[(kind, name)] = factory(name, limit)
+        return semaphore
+
+
+def get_semaphore(name, limit):
+    """线程间 / 进程间共享的并发上限 (用于后台线程任务)"""
+    if redis_state_enabled("REDIS_SEMAPHORE_ENABLED"):
+        return _named_semaphore("sync", name, limit, RedisSemaphore)
+    return _named_semaphore("sync", name, limit, LocalSemaphore)
+
+
+def get_async_semaphore(name, limit):
+    """协程间 / 进程间共享的并发上限 (用于 async 接口)"""
+    if redis_state_enabled("REDIS_SEMAPHORE_ENABLED"):
+        return _named_semaphore("async", name, limit, AsyncRedisSemaphore)
+    return _named_semaphore("async", name, limit, AsyncLocalSemaphore)
+
+# ==========================================
+# 2. 共享字典 (Redis Hash / 进程内 dict)
+# ==========================================
+
+class SharedHash:
+    """
+    少量全局状态 (如模型就绪状态)，多 worker 模式下所有进程看到同一份。
+    async 代码中使用 aget / aset，同步的 get / set / [] 会在事件循环上发起阻塞的 Redis 调用。
+    """
+
+    def __init__(self, name, defaults=None, feature_env=None):
+        self.key = state_key("state", name)
+        self.redis_enabled = redis_state_enabled(feature_env)
+        self.memory_store = dict(defaults or {})
+        if self.redis_enabled and defaults:
+            try:
+                client = get_redis_client()
+                if client:
+                    for field, value in defaults.items():
+                        client.hsetnx(self.key, field, value)
+            except Exception as e:
+                logger.error(f"Redis 初始化共享状态失败 {self.key}: {e}")
+
+    def get(self, field, default=None):
+        if self.redis_enabled:
+            try:
+                client = get_redis_client()
+                if client:
+                    value = client.hget(self.key, field)
+                    return default if value is None else value
+            except Exception as e:
+                logger.error(f"Redis 读取共享状态失败 {self.key}: {e}")
+        return self.memory_store.get(field, default)
+
+    def set(self, field, value):
+        self.memory_store[field] = value
+        if self.redis_enabled:
+            try:
+                client = get_redis_client()
+                if client:
+                    client.hset(self.key, field, value)
+            except Exception as e:
+                logger.error(f"Redis 写入共享状态失败 {self.key}: {e}")
+
+    async def aget(self, field, default=None):
+        """async 代码中读取：使用 asyncio Redis 客户端，不阻塞事件循环"""
+        if self.redis_enabled:
+            try:
+                client = get_async_redis_client()
+                if client:
+                    value = await client.hget(self.key, field)
+                    return default if value is None else value
+            except Exception as e:
+                logger.error(f"Redis 读取共享状态失败 {self.key}: {e}")
+        return self.memory_store.get(field, default)
+
+    async def aset(self, field, value):
+        self.memory_store[field] = value
+        if self.redis_enabled:
+            try:
+                client = get_async_redis_client()
+                if client:
+                    await client.hset(self.key, field, value)
+            except Exception as e:
+                logger.error(f"Redis 写入共享状态失败 {self.key}: {e}")
+
+    def __getitem__(self, field):
+        return self.get(field)
+
+    def __setitem__(self, field, value):
+        self.set(field, value)
+
+# ==========================================
+# 3. 进程内缓存失效广播 (Redis Pub/Sub)
+# ==========================================
+# 目录树缓存、路径索引缓存等仍然是进程内缓存 (读多写少，放 Redis 反而多一次网络往返)。
+# 多 worker 模式下写操作除了清理本进程缓存，还要广播给其他 worker；收不到广播时由 TTL 兜底。
+
+_ORIGIN = uuid.uuid4().hex
+_handlers = {}
+_subscriber = None
+_subscriber_lock = threading.Lock()
+
+
+def _channel():
+    return state_key("invalidate")
+
+
+def broadcast(topic, *args):
+    """通知其他 worker 执行 topic 对应的本地失效逻辑 (本进程的失效由调用方自己完成)"""
+    if not MULTI_WORKER:
+        return
+    try:
+        client = get_redis_client()
+        if client:
+            client.publish(_channel(), json.dumps({"origin": _ORIGIN, "topic": topic, "args": list(args)},
+                                                  ensure_ascii=False))
+    except Exception as e:
+        logger.error(f"缓存失效广播失败 {topic}: {e}")
+
+
+def subscribe(topic, handler):
+    """注册失效处理函数 (模块导入时调用)；多 worker 模式下首次注册时启动订阅线程"""
+    global _subscriber
+    _handlers[topic] = handler
+    if not MULTI_WORKER:
+        return
+    with _subscriber_lock:
+        if _subscriber is None:
+            _subscriber = threading.Thread(target=_listen, name="cache-invalidation", daemon=True)
+            _subscriber.start()
+
+
+def _listen():
+    while True:
+        pubsub = None
+        try:
+            client = get_redis_client()
+            if client is None:
+                time.sleep(5)
+                continue
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_channel())
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if not message:
+                    continue
+                data = json.loads(message["data"])
+                if data.get("origin") == _ORIGIN:
+                    continue
+                handler = _handlers.get(data.get("topic"))
+                if handler:
+                    handler(*data.get("args", []))
+        except Exception as e:
+            logger.error(f"缓存失效订阅中断，1s 后重连: {e}")
+            time.sleep(1)
+        finally:
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
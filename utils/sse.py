@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from contextvars import ContextVar
+
+import anyio
+from fastapi.responses import StreamingResponse
+
+from utils.metrics import SSE_CLIENT_DISCONNECTS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# SSE 编码 (所有流式接口共用)
+# ==========================================
+# 原来每个模型 token 单独 json.dumps 成一帧 "data: ..."，每帧都是一次 send / 系统调用，
+# 经过反向代理时还要再转发一次。现在:
+#   1. TokenBuffer 把时间窗口 (SSE_COALESCE_MS) 内到达的 token 合并成一帧，
+#      单帧超过 SSE_COALESCE_BYTES 时立即发送；距上一帧已超过窗口的 token 立即发送，不增加首字延迟。
+#      窗口到期后下一个 token 迟迟不来 (工具调用、模型思考) 时，由 sse_response 定时把缓存发出，不等下一个 token。
+#   2. JSON 编码优先使用 orjson (未安装时退回标准库)。
+#   3. sse_response 在链路空闲 SSE_HEARTBEAT_SECONDS 秒后发送注释帧 ": ping"，避免代理因空闲断开连接
+#      (排队、联网搜索、长时间思考期间)。
+#   4. 客户端中途断开时立即关闭生成器 (见下方 "客户端断开")，不再把回答生成完。
+# 帧格式不变：{"content": "..."}，前端按帧拼接即可，一帧包含多个 token 不影响显示。
+
+# 合并窗口 (毫秒)，0 表示不合并
+SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", 30))
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", 2048))
+# 空闲心跳间隔 (秒)，0 表示关闭
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Content-Type": "text/event-stream",
+    "X-Accel-Buffering": "no"
+}
+
+DONE = "data: [DONE]\n\n"
+HEARTBEAT = ": ping\n\n"
+
+
+def dumps(payload):
+    """JSON 编码 (非 ASCII 字符原样输出)"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode()
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+# 当前流式响应中创建的 TokenBuffer (由 with_heartbeat 设置，用于到期发送)
+_stream_buffers = ContextVar("sse_stream_buffers", default=None)
+# 唤醒 with_heartbeat 的回调 (线程安全)：缓冲从空变为有缓存时调用，让它按新的到期时间等待
+_stream_wakeup = ContextVar("sse_stream_wakeup", default=None)
+
+
+def event(payload, name=None):
+    """一帧 SSE；name 为事件类型 (如 queue)，不传时为默认 message 事件"""
+    data = f"data: {dumps(payload)}\n\n"
+    return f"event: {name}\n{data}" if name else data
+
+
+class TokenBuffer:
+    """
+    合并 token 并累积完整回答 (列表缓冲，结束时 join 一次，避免反复字符串拼接)。
+    用法:
+        buffer = TokenBuffer()
+        for token in ...:
+            frame = buffer.push(token)
+            if frame: yield frame
+        frame = buffer.flush()
+        if frame: yield frame
+        full_text = buffer.text()
+    在发送其他事件 (排队、错误) 之前先 flush，保证顺序。
+    在 sse_response 驱动的生成器中创建时，缓存的 token 超过窗口仍未发出会由 sse_response 定时发送 (flush_due)。
+    """
+
+    def __init__(self, key="content", window_ms=None, max_bytes=None):
+        self.key = key
+        self.window = (SSE_COALESCE_MS if window_ms is None else window_ms) / 1000
+        self.max_bytes = SSE_COALESCE_BYTES if max_bytes is None else max_bytes
+        self.parts = []
+        self._pending = []
+        self._pending_bytes = 0
+        self._last_emit = 0.0
+        # 同步生成器在线程池中 push，到期发送在事件循环中执行
+        self._lock = threading.Lock()
+        self._wakeup = _stream_wakeup.get()
+        buffers = _stream_buffers.get()
+        if buffers is not None:
+            buffers.append(self)
+
+    def push(self, token):
+        """加入一个 token；需要发送时返回合并后的帧，否则返回 None"""
+        if not token:
+            return None
+        self.parts.append(token)
+        with self._lock:
+            was_empty = not self._pending
+            self._pending.append(token)
+            self._pending_bytes += len(token.encode("utf-8"))
+            now = time.monotonic()
+            if now - self._last_emit >= self.window or self._pending_bytes >= self.max_bytes:
+                return self._emit(now)
+        # 留在缓存里：通知 with_heartbeat 按到期时间等待 (之前没有缓存时它只等心跳)
+        if was_empty and self._wakeup is not None:
+            self._wakeup()
+        return None
+
+    def flush(self):
+        """发送尚未发出的 token (没有时返回 None)"""
+        with self._lock:
+            if not self._pending:
+                return None
+            return self._emit(time.monotonic())
+
+    def deadline(self):
+        """
+        with_heartbeat 最晚应在何时 (time.monotonic) 检查本缓冲：有缓存时为其到期时间，
+        没有缓存或不合并时返回 None (之后有 token 留在缓存里时由 push 唤醒)。
+        """
+        if self.window <= 0:
+            return None
+        with self._lock:
+            return self._last_emit + self.window if self._pending else None
+
+    def flush_due(self, now):
+        """缓存已到期时发送 (由 with_heartbeat 在等待下一帧期间调用)"""
+        with self._lock:
+            if not self._pending or now < self._last_emit + self.window:
+                return None
+            return self._emit(now)
+
+    def _emit(self, now):
+        content = "".join(self._pending)
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._last_emit = now
+        return event({self.key: content})
+
+    def text(self):
+        return "".join(self.parts)
+
+
+# ==========================================
+# 客户端断开
+# ==========================================
+# 原来浏览器关闭页面后，同步生成器仍在线程里把 llm.stream() 读到结束，一直占着 vLLM 的并发名额和线程；
+# 异步生成器要等下一次 send 报错才停止。现在由 sse_response 驱动生成器:
+#   - 断开时关闭生成器：同步生成器在 yield 处收到 GeneratorExit (线程中正在执行的 next() 无法打断，
+#     等它拿到下一个 token 返回后立即关闭)；异步生成器直接取消正在 await 的模型请求。
+#     生成器的 finally 照常执行：关闭到模型服务的 HTTP 请求 (vLLM 随即中止该请求)、释放准入名额、保存已生成的内容。
+#   - 排队中的请求通过 client_disconnected() 感知断开，直接退出排队，不再占用后续名额。
+# 同步生成器排队时调用 park(ticket) 后 yield 排队位置：sse_response 在事件循环上代为等待出队 (ticket.apark)，
+# 期间不再调用 next()，排队中的请求不占用线程池线程。
+
+_client_gone = ContextVar("sse_client_gone", default=None)
+_parked = ContextVar("sse_parked", default=None)
+# 断开后在后台关闭生成器的任务 (保持引用，避免被回收)
+_closing = set()
+_END = object()
+
+
+class ClientDisconnected(BaseException):
+    """
+    客户端已断开，放弃尚未开始的模型调用。
+    与 GeneratorExit 一样继承 BaseException：这是中止信号而不是模型错误，不会被生成器中的 except Exception 记成错误。
+    """
+
+
+def client_disconnected():
+    """当前流式请求的客户端是否已断开 (在 sse_response 驱动的生成器内调用；其他场景恒为 False)"""
+    gone = _client_gone.get()
+    return gone is not None and gone.is_set()
+
+
+def park(waiter):
+    """
+    同步生成器即将 yield 排队位置时调用：请 sse_response 在这一帧之后先 async for waiter.apark()，再继续迭代生成器。
+    waiter.apark() 产生要发送的帧 (None 表示没有新内容)。不在 sse_response 中时返回 False，调用方自行阻塞等待。
+    """
+    parked = _parked.get()
+    if parked is None:
+        return False
+    parked.append(waiter)
+    return True
+
+
+def _next(iterator):
+    try:
+        return next(iterator)
+    except StopIteration:
+        return _END
+
+
+async def _close_source(body, is_sync, pending):
+    """客户端断开后关闭生成器，触发其 finally (释放名额、中止模型请求、保存已生成内容)"""
+    if pending is not None:
+        if not is_sync:
+            # 打断 await 中的模型请求，CancelledError 沿生成器向上传播
+            pending.cancel()
+        await asyncio.wait((pending,))
+        if not pending.cancelled() and pending.exception() is not None:
+            # 生成器已经自行结束 (如排队中收到 ClientDisconnected)，取走异常即可
+            return
+    try:
+        if is_sync:
+            close = getattr(body, "close", None)
+            if close is not None:
+                await anyio.to_thread.run_sync(close)
+        else:
+            await body.aclose()
+    except Exception as e:
+        logger.warning(f"⚠️ 关闭流式生成器失败: {e}")
+
+
+async def with_heartbeat(body, interval=None):
+    """
+    驱动同步或异步帧迭代器：超过 interval 秒没有输出时插入心跳注释帧；未读完就退出 (客户端断开) 时关闭迭代器。
+    等待下一帧期间，迭代器中创建的 TokenBuffer 缓存到期时直接发送 (生成器此时停在取下一个 token 上，
+    已经交出的帧都已输出，不会乱序)。
+    同步迭代器在线程池中取帧，与 StreamingResponse 的默认行为一致。
+    """
+    interval = SSE_HEARTBEAT_SECONDS if interval is None else interval
+    gone = threading.Event()
+    buffers = []
+    parked = []
+    loop = asyncio.get_running_loop()
+    kick = asyncio.Event()
+    # 生成器在本任务派生的任务 / 线程中执行，共享同一个断开标记、TokenBuffer 列表、唤醒回调和排队登记
+    _client_gone.set(gone)
+    _stream_buffers.set(buffers)
+    _stream_wakeup.set(lambda: loop.call_soon_threadsafe(kick.set))
+    _parked.set(parked)
+    is_sync = not hasattr(body, "__aiter__")
+    if is_sync:
+        iterator = iter(body)
+        step = lambda: anyio.to_thread.run_sync(_next, iterator)
+    else:
+        step = body.__aiter__().__anext__
+
+    pending = None
+    kicked = None
+    finished = False
+    last_sent = time.monotonic()
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(step())
+            if kicked is None:
+                kicked = asyncio.ensure_future(kick.wait())
+            # 只在缓存到期或心跳时醒来；没有缓存时 push 留下缓存会通过 kick 唤醒，重新计算到期时间
+            now = time.monotonic()
+            wake_at = [d for d in (buffer.deadline() for buffer in buffers) if d is not None]
+            if interval > 0:
+                wake_at.append(last_sent + interval)
+            timeout = max(0.0, min(wake_at) - now) if wake_at else None
+            done, _ = await asyncio.wait((pending, kicked), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if kicked in done:
+                kick.clear()
+                kicked = None
+            if pending not in done:
+                now = time.monotonic()
+                flushed = False
+                for buffer in buffers:
+                    frame = buffer.flush_due(now)
+                    if frame:
+                        flushed = True
+                        yield frame
+                if flushed:
+                    last_sent = now
+                elif interval > 0 and now - last_sent >= interval:
+                    yield HEARTBEAT
+                    last_sent = now
+                continue
+            task, pending = pending, None
+            try:
+                frame = task.result()
+            except StopAsyncIteration:
+                finished = True
+                return
+            except BaseException:
+                finished = True
+                raise
+            if frame is _END:
+                finished = True
+                return
+            yield frame
+            last_sent = time.monotonic()
+            # 生成器停在排队位置的 yield 上：在事件循环上等待出队，不占用线程
+            while parked:
+                async for frame in parked.pop(0).apark():
+                    now = time.monotonic()
+                    if frame:
+                        yield frame
+                        last_sent = now
+                    elif interval > 0 and now - last_sent >= interval:
+                        yield HEARTBEAT
+                        last_sent = now
+    finally:
+        if kicked is not None:
+            kicked.cancel()
+        if not finished:
+            gone.set()
+            SSE_CLIENT_DISCONNECTS.inc()
+            closer = asyncio.ensure_future(_close_source(body, is_sync, pending))
+            _closing.add(closer)
+            closer.add_done_callback(_closing.discard)
+
+
+class SSEResponse(StreamingResponse):
+    """响应结束 (包括 send 失败) 时关闭帧迭代器，不依赖垃圾回收"""
+
+    async def stream_response(self, send):
+        try:
+            await super().stream_response(send)
+        finally:
+            await self.body_iterator.aclose()
+
+
+def sse_response(body, headers=None):
+    """流式接口统一出口：空闲心跳 + 客户端断开时关闭生成器"""
+    return SSEResponse(
+        with_heartbeat(body),
+        media_type="text/event-stream",
+        headers=STREAM_HEADERS if headers is None else headers,
+    )
@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+import logging
+import resource
+import threading
+from contextlib import contextmanager
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+from utils.metrics import IMPORT_STAGE_SECONDS, IMPORT_STAGE_CPU_SECONDS, IMPORT_STAGE_PEAK_RSS
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# 分阶段耗时 / 资源统计 (导入流水线)
+# ==========================================
+# wall: time.perf_counter；cpu: time.thread_time (只统计执行线程，不受并发任务影响)；
+# 内存: 阶段执行期间的进程 RSS 峰值。RSS 是进程级的，多个导入任务并发时会互相叠加，
+# 因此它反映的是"该阶段执行时进程有多大"，用于定位 OOM 风险，而不是单个任务的精确占用。
+# 同名阶段可多次进入 (例如逐章节保存 docx)，耗时累加、峰值取最大。
+# 每次阶段结束立即记入 /metrics 直方图 (一次进入记一次)，并通过 on_update 回调推送累计值，
+# 进行中的任务和中途失败的任务同样能看到已完成阶段的数据。
+
+# RSS 采样间隔 (秒)，仅在有阶段执行时采样
+SAMPLE_INTERVAL = float(os.getenv("IMPORT_PROFILE_SAMPLE_INTERVAL", 0.05))
+# on_update 回调最小间隔 (秒)，逐章节阶段不会每章都写一次任务状态
+UPDATE_INTERVAL = float(os.getenv("IMPORT_PROFILE_UPDATE_INTERVAL", 1))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _current_rss():
+    """当前进程 RSS (字节)；没有 /proc 时退回进程历史峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class _RssSampler:
+    """进程内共享的 RSS 采样线程：有活动阶段时每 SAMPLE_INTERVAL 秒刷新一次各阶段的峰值"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._active = {}
+        self._thread = None
+
+    def register(self, token, rss):
+        with self._cond:
+            self._active[token] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def unregister(self, token):
+        with self._cond:
+            return self._active.pop(token, 0)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+            rss = _current_rss()
+            with self._cond:
+                for token, peak in self._active.items():
+                    if rss > peak:
+                        self._active[token] = rss
+            time.sleep(SAMPLE_INTERVAL)
+
+
+_sampler = _RssSampler()
+
+
+class StageProfiler:
+    """
+    用法:
+        profiler = StageProfiler(on_update=lambda stages: ...)  # 阶段结束时推送累计值 (可选，按 UPDATE_INTERVAL 限频)
+        with profiler.stage("split"):
+            ...                                                  # 结束时记入 /metrics 直方图
+        profiler.snapshot()                                      # 任务结束时写入最终的任务状态
+    """
+
+    def __init__(self, on_update=None):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._on_update = on_update
+        self._last_update = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        token = object()
+        start_rss = _current_rss()
+        _sampler.register(token, start_rss)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            peak = max(_sampler.unregister(token), start_rss, _current_rss())
+            now = time.monotonic()
+            with self._lock:
+                item = self._stages.setdefault(name, {"wall": 0.0, "cpu": 0.0, "peak_rss": 0, "count": 0})
+                item["wall"] += wall
+                item["cpu"] += cpu
+                item["peak_rss"] = max(item["peak_rss"], peak)
+                item["count"] += 1
+                notify = self._on_update is not None and now - self._last_update >= UPDATE_INTERVAL
+                if notify:
+                    self._last_update = now
+            IMPORT_STAGE_SECONDS.observe(wall, stage=name)
+            IMPORT_STAGE_CPU_SECONDS.observe(cpu, stage=name)
+            IMPORT_STAGE_PEAK_RSS.observe(peak, stage=name)
+            if notify:
+                try:
+                    self._on_update(self.snapshot())
+                except Exception as e:
+                    logger.warning(f"⚠️ 推送阶段耗时失败: {e}")
+
+    def snapshot(self):
+        """返回可 JSON 序列化的阶段统计 (按首次进入顺序)"""
+        with self._lock:
+            return {
+                name: {
+                    "wall_s": round(item["wall"], 3),
+                    "cpu_s": round(item["cpu"], 3),
+                    "peak_rss_mb": round(item["peak_rss"] / 1024 / 1024, 1),
+                    "count": item["count"],
+                }
+                for name, item in self._stages.items()
+            }
+
+    def summary(self):
+        """日志用的单行摘要"""
+        return ", ".join(f"{name} {v['wall_s']}s/{v['peak_rss_mb']}MB" for name, v in self.snapshot().items())
@@ -36,6 +36,11 @@ from zzp import sql_config as config
 # [表情] 新增：引入旧版数据库连接工具
 from utils.lyf.db_session import get_engine
 from utils.chat_session_manager import ChatSessionManager
+from utils.metrics import observe_stream, LLM_STREAM_USAGE
+from utils.llm_admission import llm_admission, PRIORITY_DRAFTING
+from utils.llm_router import llm_router, url_of, LOCAL_OLLAMA_URL
+from utils import response_cache
+from utils.sse import TokenBuffer, DONE
 
 ENCRYPTION_KEY = b'8P_Gk9wz9qKj-4t8z9qKj-4t8z9qKj-4t8z9qKj-4t8=' 
 cipher_suite = Fernet(ENCRYPTION_KEY)
@@ -179,30 +184,33 @@ def build_optimization_prompt(text: str, requirement_contents: List[str]) -> str
     )
     return prompt
 
-def init_llm_instance(model_id: int):
-    """根据 model_id 初始化 LangChain LLM 实例"""
+# 润色采样温度 (输出不确定，响应缓存据此决定是否缓存)
+OPTIMIZE_TEMPERATURE = 0.9
+
+def init_llm_instance(model_id: int, base_url: Optional[str] = None):
+    """根据 model_id 初始化 LangChain LLM 实例；base_url 用于 LLM 路由切换到同一模型的其他副本"""
     config_data = get_llm_config_by_id(model_id)
     if not config_data:
         # 兜底方案：如果找不到配置，默认使用本地 Ollama
         logger.warning(f"[表情] 未找到 model_id={model_id} 的配置，使用默认本地模型")
         return ChatOllama(
             model="llama3.2:3b",
-            base_url="http://localhost:11434",
-            temperature=0.9,
+            base_url=base_url or LOCAL_OLLAMA_URL,
+            temperature=OPTIMIZE_TEMPERATURE,
         )
 
     llm_type = config_data["llm_type"]
     model_name = config_data["model_name"]
     api_key = config_data["api_key"]
-    base_url = config_data["base_url"]
+    base_url = base_url or config_data["base_url"]
 
     logger.info(f"[表情] 初始化模型: [{llm_type}] - {model_name}")
     
     if llm_type == "local":
         return ChatOllama(
             model=model_name,
-            base_url=base_url if base_url else "http://localhost:11434",
-            temperature=0.9,
+            base_url=base_url if base_url else LOCAL_OLLAMA_URL,
+            temperature=OPTIMIZE_TEMPERATURE,
             timeout=60, # 增加超时设置
         )
     elif llm_type == "custom":
@@ -210,8 +218,9 @@ def init_llm_instance(model_id: int):
             api_key=api_key,
             base_url=base_url,
             model=model_name,
-            temperature=0.9,
+            temperature=OPTIMIZE_TEMPERATURE,
             streaming=True,
+            stream_usage=LLM_STREAM_USAGE,
             timeout=60, # 增加超时设置
         )
     else:
@@ -220,8 +229,9 @@ def init_llm_instance(model_id: int):
             api_key=api_key,
             base_url=base_url,
             model=model_name,
-            temperature=0.9,
+            temperature=OPTIMIZE_TEMPERATURE,
             streaming=True,
+            stream_usage=LLM_STREAM_USAGE,
             timeout=60, # 增加超时设置
         )
 
@@ -229,7 +239,8 @@ def init_llm_instance(model_id: int):
 # 4. 核心流式生成逻辑
 # ==============================
 
-def optimize_text_stream(text: str, prompt_ids: List[int], model_id: int, task_id: str, user_id: int):
+def optimize_text_stream(text: str, prompt_ids: List[int], model_id: int, task_id: str, user_id: int,
+                         regenerate_nonce: Optional[str] = None):
     """
     流式润色生成器
     :param text: 原文
@@ -237,6 +248,7 @@ def optimize_text_stream(text: str, prompt_ids: List[int], model_id: int, task_i
     :param model_id: 模型ID
     :param task_id: 会话ID，用于隔离上下文
     :param user_id: 用户ID，用于权限校验
+    :param regenerate_nonce: (可选) 前端生成标识，重试带相同值、重新生成换新值；不传时不走响应缓存
     """
     global session_manager
 
@@ -265,34 +277,67 @@ def optimize_text_stream(text: str, prompt_ids: List[int], model_id: int, task_i
     user_prompt_content = build_optimization_prompt(text, requirements)
     messages.append(HumanMessage(content=user_prompt_content))
 
+    # 首轮请求 (无历史) 的输出只取决于模型、润色要求和原文，可以走响应缓存；
+    # 多轮时输出依赖历史，不缓存。润色采样温度大于 0，只有带 regenerate_nonce 时才缓存 (同一次生成的重试回放)。
+    # 命中时同样写入历史，保证后续轮次上下文完整。
+    cache_key = None
+    if not current_history:
+        cache_key = response_cache.cache_key(
+            "optimize", model_id, user_prompt_content,
+            temperature=OPTIMIZE_TEMPERATURE, nonce=regenerate_nonce,
+        )
+        cached = response_cache.lookup("optimize", cache_key)
+        if cached is not None:
+            logger.info(f"Task {task_id} 命中响应缓存")
+            yield from response_cache.replay(cached)
+            current_history.append(HumanMessage(content=user_prompt_content))
+            current_history.append(AIMessage(content=cached))
+            session_manager.update_session(task_id, current_history)
+            return
+
     # 6. 执行流式生成
+    ticket = None
+    buffer = TokenBuffer()
     try:
         llm = init_llm_instance(model_id)
-        
-        full_response_content = ""
+        # 按优先级 / 用户公平排队，排队期间向前端推送 SSE queue 事件
+        ticket = llm_admission.request(llm, PRIORITY_DRAFTING, user=user_id)
+        for update in ticket.updates():
+            yield update.sse()
         
         print(f"[表情] (Task: {task_id}) 正在生成... 使用了 {len(requirements)} 条自定义Prompt")
 
-        # LangChain 的 stream 方法
-        for chunk in llm.stream(messages):
-            text_chunk = chunk.content
-            if text_chunk:
-                full_response_content += text_chunk
-                # 构造 SSE 格式数据
-                yield f"data: {json.dumps({'content': text_chunk}, ensure_ascii=False)}\n\n"
+        # LangChain 的 stream 方法 (按时间窗口合并 token 后构造 SSE 帧)；多副本时由 llm_router 选副本并故障转移
+        def open_stream(url):
+            target = llm if url == url_of(llm) else init_llm_instance(model_id, base_url=url)
+            return target.stream(messages)
+
+        for chunk in observe_stream(llm_router.stream(llm, open_stream), llm):
+            frame = buffer.push(chunk.content)
+            if frame:
+                yield frame
+        frame = buffer.flush()
+        if frame:
+            yield frame
+        full_response_content = buffer.text()
         
+        if cache_key is not None:
+            response_cache.store("optimize", cache_key, full_response_content)
         # 发送结束标记
-        yield "data: [DONE]\n\n"
-
-        # 7. 更新历史记录 (存入 Redis/Memory，支持多轮)
-        current_history.append(HumanMessage(content=user_prompt_content))
-        current_history.append(AIMessage(content=full_response_content))
-        session_manager.update_session(task_id, current_history)
-        logger.info(f"Task {task_id} 历史记录已更新，当前轮数: {len(current_history)//2}")
+        yield DONE
 
     except Exception as e:
         logger.error(f"Stream error: {e}")
         yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+    finally:
+        if ticket is not None:
+            ticket.release()
+        # 7. 更新历史记录 (存入 Redis/Memory，支持多轮)：中途断开时保存已生成的部分
+        if buffer.parts:
+            current_history.append(HumanMessage(content=user_prompt_content))
+            current_history.append(AIMessage(content=buffer.text()))
+            session_manager.update_session(task_id, current_history)
+            logger.info(f"Task {task_id} 历史记录已更新，当前轮数: {len(current_history)//2}")
 
 # ==============================
 # 5. 主函数测试（模拟真实前端行为）
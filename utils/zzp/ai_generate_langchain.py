@@ -4,7 +4,6 @@ import json
 import re
 import logging
 import time
-from datetime import datetime
 from typing import List
 
 # 数据库与加密相关
@@ -21,6 +20,11 @@ from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, messages_to_dict, messages_from_dict
 from utils.redis_client import get_redis_client
 from utils.chat_session_manager import ChatSessionManager
+from utils.metrics import observe_stream, LLM_STREAM_USAGE
+from utils.prompt_layout import system_prompt, materials_block, turn_content
+from utils.llm_admission import llm_admission, PRIORITY_DRAFTING
+from utils.llm_router import llm_router, url_of
+from utils.sse import TokenBuffer, DONE
 
 # ==========================================
 # 0. 基础配置 & 密钥管理
@@ -203,6 +207,7 @@ def init_llm_instance(config_data):
             model=model_name, 
             temperature=0.2, 
             streaming=True,
+            stream_usage=LLM_STREAM_USAGE,
             timeout=60
         )
     else:
@@ -211,6 +216,30 @@ def init_llm_instance(config_data):
 # ==========================================
 # 3. 核心导出函数 (Chat_generator_stream)
 # ==========================================
+# 静态指令放在系统提示词最前面，所有任务共享同一前缀 (见 utils/prompt_layout.py)
+WRITER_INSTRUCTIONS_WITH_MATERIALS = """
+你是一个政务材料撰写辅助AI。
+
+【任务指令】
+请基于下方【参考材料】，完成用户的任务：
+1. 严格基于材料内容，不编造。
+2. 语言正式、严谨。
+3. 如果用户要求生成表格、列表等特定格式，请务必满足。
+4. 输出内容使用 Markdown 格式渲染（支持表格、粗体等）。
+5. 直接输出正文内容，不需要JSON格式。
+"""
+
+WRITER_INSTRUCTIONS = """
+你是一个政务材料撰写辅助AI。
+
+【任务指令】
+请根据下方【目录名称】和用户指令进行逻辑创作。
+1. 语言正式、结构清晰。
+2. 如果用户要求生成表格、列表等特定格式，请务必满足。
+3. 输出内容使用 Markdown 格式渲染（支持表格、粗体等）。
+4. 直接输出正文内容，不需要JSON格式。
+"""
+
 def Chat_generator_stream(folder_name, material_name_list, instruction, model_id, task_id, user_id=None):
     """
     流式生成器核心逻辑
@@ -230,82 +259,65 @@ def Chat_generator_stream(folder_name, material_name_list, instruction, model_id
     if not current_history:
         current_history = []
 
-    # 3. 准备材料上下文
+    # 3. 准备材料上下文 (按材料名排序，保证同一任务每轮拼出的系统提示词逐字节相同)
     full_materials_text = ""
-    has_materials = False
     if material_name_list and len(material_name_list) > 0:
         file_map = get_files_by_material_names(material_name_list, user_id=user_id)
         if file_map:
-            content_parts = []
-            for name, path in file_map.items():
-                text_content = read_file_content(path)
-                if text_content:
-                    content_parts.append(f"【参考材料：{name}】\n{text_content}\n")
-            full_materials_text = "\n".join(content_parts)
-            if full_materials_text:
-                has_materials = True
-
-    # 4. 构建 System Prompt
-    current_date = datetime.now().strftime('%Y-%m-%d')
-    if has_materials:
-        system_content = f"""
-今天日期：{current_date}
-你是一个政务材料撰写辅助AI。
+            full_materials_text = materials_block(
+                {name: read_file_content(path) for name, path in file_map.items()}
+            )
 
-【参考材料】
-{full_materials_text}
-
-【任务指令】
-请基于上述材料，完成以下任务：
-1. 严格基于材料内容，不编造。
-2. 语言正式、严谨。
-3. 如果用户要求生成表格、列表等特定格式，请务必满足。
-4. 输出内容使用 Markdown 格式渲染（支持表格、粗体等）。
-5. 直接输出正文内容，不需要JSON格式。
-"""
+    # 4. 构建 System Prompt: 静态指令 -> 材料；日期放在本轮用户消息里，不破坏前缀缓存
+    if full_materials_text:
+        system_content = system_prompt(WRITER_INSTRUCTIONS_WITH_MATERIALS, full_materials_text)
     else:
-        system_content = f"""
-今天日期：{current_date}
-你是一个政务材料撰写辅助AI。
-
-【任务指令】
-请根据目录名称“{folder_name}”和用户指令进行逻辑创作。
-1. 语言正式、结构清晰。
-2. 如果用户要求生成表格、列表等特定格式，请务必满足。
-3. 输出内容使用 Markdown 格式渲染（支持表格、粗体等）。
-4. 直接输出正文内容，不需要JSON格式。
-"""
+        system_content = system_prompt(WRITER_INSTRUCTIONS, f"【目录名称】\n{folder_name}")
 
     # 5. 执行流式生成
+    ticket = None
+    buffer = TokenBuffer()
     try:
         llm = init_llm_instance(llm_config)
+        # 按优先级 / 用户公平排队，排队期间向前端推送 SSE queue 事件
+        ticket = llm_admission.request(llm, PRIORITY_DRAFTING, user=user_id)
+        for update in ticket.updates():
+            yield update.sse()
         
         # 组装消息链：System -> History -> Current Human
         messages = [SystemMessage(content=system_content)]
         messages.extend(current_history)
-        messages.append(HumanMessage(content=instruction))
-        
-        full_response_content = ""
+        messages.append(HumanMessage(content=turn_content(instruction)))
 
-        # 流式返回
-        for chunk in llm.stream(messages):
+        # 流式返回 (按时间窗口合并 token)；配置了多副本时由 llm_router 选副本，首个分片前失败自动切换
+        def open_stream(url):
+            target = llm if url == url_of(llm) else init_llm_instance({**llm_config, "base_url": url})
+            return target.stream(messages)
+
+        for chunk in observe_stream(llm_router.stream(llm, open_stream), llm):
             text_chunk = chunk.content if hasattr(chunk, 'content') else str(chunk)
-            if text_chunk:
-                full_response_content += text_chunk
-                yield f"data: {json.dumps({'content': text_chunk}, ensure_ascii=False)}\n\n"
+            frame = buffer.push(text_chunk)
+            if frame:
+                yield frame
+        frame = buffer.flush()
+        if frame:
+            yield frame
         
         # 结束标记
-        yield "data: [DONE]\n\n"
-
-        # 6. 更新历史记录 (存入 Redis/Memory)
-        current_history.append(HumanMessage(content=instruction))
-        current_history.append(AIMessage(content=full_response_content))
-        session_manager.update_session(task_id, current_history)
-        logger.info(f"Task {task_id} 历史记录已更新")
+        yield DONE
 
     except Exception as e:
         logger.error(f"Stream error: {e}")
         yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+    finally:
+        if ticket is not None:
+            ticket.release()
+        # 6. 更新历史记录 (存入 Redis/Memory)：前端收到 [DONE] 后断开、或中途断开时同样保存已生成的内容
+        if buffer.parts:
+            current_history.append(HumanMessage(content=instruction))
+            current_history.append(AIMessage(content=buffer.text()))
+            session_manager.update_session(task_id, current_history)
+            logger.info(f"Task {task_id} 历史记录已更新")
 
 # 占位函数，如果还需要同步接口可保留
 def Chat_generator(*args, **kwargs):
@@ -18,6 +18,12 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.append(project_root)
 from zzp import sql_config as config
+from utils.metrics import observe_stream, LLM_STREAM_USAGE
+from utils.prompt_layout import system_prompt as build_system_prompt
+from utils.llm_admission import llm_admission, PRIORITY_INTERACTIVE
+from utils.llm_router import llm_router, url_of
+from utils import response_cache
+from utils.sse import TokenBuffer, DONE
 
 # 🔐 密钥 (保持与原项目一致)
 ENCRYPTION_KEY = b'8P_Gk9wz9qKj-4t8z9qKj-4t8z9qKj-4t8z9qKj-4t8=' 
@@ -60,6 +66,9 @@ def get_llm_config_by_id(model_id):
         logger.error(f"读取配置失败: {e}")
     return None
 
+# 总结采样温度 (大于 0 时输出不确定，响应缓存据此决定是否缓存)
+SUMMARY_TEMPERATURE = 0.3
+
 def init_llm_instance(config_data):
     """初始化 LLM 实例"""
     if not config_data: raise ValueError("配置数据为空")
@@ -72,14 +81,15 @@ def init_llm_instance(config_data):
     print(f"🚀 初始化总结模型: [{llm_type}] {model_name}")
     
     if llm_type == "local":
-        return ChatOllama(model=model_name, base_url=base_url, temperature=0.3, num_ctx=8192)
+        return ChatOllama(model=model_name, base_url=base_url, temperature=SUMMARY_TEMPERATURE, num_ctx=8192)
     elif llm_type in ["online", "custom"]:
         return ChatOpenAI(
             api_key=api_key, 
             base_url=base_url, 
             model=model_name, 
-            temperature=0.3, # 总结任务稍微增加一点确定性
-            streaming=True
+            temperature=SUMMARY_TEMPERATURE, # 总结任务稍微增加一点确定性
+            streaming=True,
+            stream_usage=LLM_STREAM_USAGE
         )
     else:
         raise ValueError(f"不支持的模型类型: {llm_type}")
@@ -88,13 +98,21 @@ def init_llm_instance(config_data):
 # 2. 核心总结功能函数
 # ==========================================
 
-def ai_summary_stream(input_text, model_id, custom_instruction=None, user_id=None):
+SUMMARY_INSTRUCTIONS = """
+你是一个专业的文本分析与总结助手。
+要求：
+1. 保持客观，不添加原文不存在的信息。
+2. 输出格式直接为纯文本，不要Markdown代码块包裹。
+"""
+
+def ai_summary_stream(input_text, model_id, custom_instruction=None, user_id=None, regenerate_nonce=None):
     """
     对输入文本进行 AI 总结
     :param input_text: 前端传入的待总结文本
     :param model_id: 数据库中的模型 ID
     :param custom_instruction: (可选) 自定义总结要求，如'扩写'、'翻译'等，默认为'总结'
     :param user_id: (可选) 当前操作的用户 ID，用于权限校验或获取私有配置
+    :param regenerate_nonce: (可选) 前端生成标识，重试带相同值、重新生成换新值；不传时不走响应缓存
     """
     
     # 1. 验证输入
@@ -113,39 +131,63 @@ def ai_summary_stream(input_text, model_id, custom_instruction=None, user_id=Non
     if not custom_instruction:
         custom_instruction = "请对以下内容进行精炼的总结，提取核心观点，语言通顺、逻辑清晰。"
 
-    system_prompt = f"""
-你是一个专业的文本分析与总结助手。
-任务目标：{custom_instruction}
-要求：
-1. 保持客观，不添加原文不存在的信息。
-2. 输出格式直接为纯文本，不要Markdown代码块包裹。
-"""
+    # 静态要求在前，任务目标在后：默认指令下所有请求共享同一系统提示词前缀
+    system_prompt = build_system_prompt(SUMMARY_INSTRUCTIONS, f"任务目标：{custom_instruction}")
+
+    # 相同模型 + 指令 + 文本 + 生成标识的请求直接回放缓存 (LLM_RESPONSE_CACHE_ENABLED=1 时)；
+    # 采样温度大于 0，没有生成标识时不缓存，否则用户无法重新生成
+    cache_key = response_cache.cache_key(
+        "summary", model_id, system_prompt, input_text,
+        temperature=SUMMARY_TEMPERATURE, nonce=regenerate_nonce,
+    )
+    cached = response_cache.lookup("summary", cache_key)
+    if cached is not None:
+        logger.info("总结任务命中响应缓存")
+        yield from response_cache.replay(cached)
+        return
 
+    ticket = None
     try:
         # 4. 初始化模型
         llm = init_llm_instance(llm_config)
+        # 按优先级 / 用户公平排队，排队期间向前端推送 SSE queue 事件
+        # 摘要由用户在编辑器中触发并等待结果，按交互请求排队
+        ticket = llm_admission.request(llm, PRIORITY_INTERACTIVE, user=user_id)
+        for update in ticket.updates():
+            yield update.sse()
         
         messages = [
             SystemMessage(content=system_prompt),
             HumanMessage(content=f"【待处理文本】：\n{input_text}")
         ]
 
-        # 5. 流式生成
-        full_response = ""
-        for chunk in llm.stream(messages):
+        # 5. 流式生成 (按时间窗口合并 token 后以 SSE 格式返回)；多副本时由 llm_router 选副本并故障转移
+        def open_stream(url):
+            target = llm if url == url_of(llm) else init_llm_instance({**llm_config, "base_url": url})
+            return target.stream(messages)
+
+        buffer = TokenBuffer()
+        for chunk in observe_stream(llm_router.stream(llm, open_stream), llm):
             text_chunk = chunk.content if hasattr(chunk, 'content') else str(chunk)
-            if text_chunk:
-                full_response += text_chunk
-                # SSE 格式返回
-                yield f"data: {json.dumps({'content': text_chunk}, ensure_ascii=False)}\n\n"
+            frame = buffer.push(text_chunk)
+            if frame:
+                yield frame
+        frame = buffer.flush()
+        if frame:
+            yield frame
         
+        # 先写缓存再发结束标记：前端收到 [DONE] 后断开连接，生成器不会再继续执行
+        response_cache.store("summary", cache_key, buffer.text())
         # 结束标记
-        yield "data: [DONE]\n\n"
+        yield DONE
         logger.info("总结任务完成")
 
     except Exception as e:
         logger.error(f"Summary generation error: {e}")
         yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+    finally:
+        if ticket is not None:
+            ticket.release()
 
 # ==========================================
 # 3. 测试入口
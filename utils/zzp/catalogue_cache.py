@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+import threading
+import logging
+from sqlalchemy import create_engine, text
+from urllib.parse import quote_plus
+
+# ==========================================
+# 0. 基础配置与导入
+# ==========================================
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+from utils.zzp import sql_config as config
+from utils.shared_state import broadcast, subscribe
+
+logger = logging.getLogger(__name__)
+
+# 缓存兜底过期时间 (秒)。正常情况下由目录写操作主动失效，TTL 仅用于防止其他进程写库后长期脏读
+CATALOGUE_CACHE_TTL = int(os.getenv("CATALOGUE_CACHE_TTL", 600))
+
+_engine = None
+_engine_lock = threading.Lock()
+
+_cache_lock = threading.Lock()
+# report_name_id -> (expire_at, roots, root_index)
+_tree_cache = {}
+# (查询语句, 参数) -> (expire_at, report_name_id)
+_id_cache = {}
+# 失效代数：每次失效 +1。读库前记下代数，写回缓存时代数已变说明读库期间发生过失效，
+# 读到的可能是失效前的旧数据，不写回 (否则会覆盖掉这次失效)
+_generation = 0
+
+
+def get_db_connection():
+    """复用单个 Engine，避免每次查询都新建连接池"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                encoded_password = quote_plus(config.password)
+                db_url = f"mysql+pymysql://{config.username}:{encoded_password}@{config.host}:{config.port}/{config.database}"
+                _engine = create_engine(db_url, pool_recycle=3600, pool_pre_ping=True)
+    return _engine
+
+# ==========================================
+# 1. 缓存读取
+# ==========================================
+
+def resolve_report_name_id(id_sql: str, params: dict):
+    """
+    按调用方给定的 SQL 解析 report_name_id，并缓存结果。
+    未命中 (报告不存在) 的结果不缓存，避免新建报告后仍然查不到。
+    """
+    key = (id_sql, tuple(sorted(params.items())))
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _id_cache.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+        generation = _generation
+
+    with get_db_connection().connect() as connection:
+        row = connection.execute(text(id_sql), params).fetchone()
+    if not row:
+        return None
+
+    with _cache_lock:
+        if generation == _generation:
+            _id_cache[key] = (now + CATALOGUE_CACHE_TTL, row[0])
+    return row[0]
+
+
+def _load_tree(report_name_id):
+    """一次性拉取该报告的全部目录，在内存中组装为排好序的树"""
+    cat_sql = text("""
+        SELECT id, catalogue_name, level, sortOrder, parent_id
+        FROM report_catalogue
+        WHERE report_name_id = :report_id
+        ORDER BY level ASC, sortOrder ASC
+    """)
+    with get_db_connection().connect() as connection:
+        rows = connection.execute(cat_sql, {"report_id": report_name_id}).fetchall()
+
+    id_map = {}
+    for row in rows:
+        id_map[row[0]] = {
+            "id": row[0],
+            "title": row[1],
+            "level": row[2],
+            "sortOrder": row[3],
+            "parent_id": row[4],
+            "children": []
+        }
+
+    roots = []
+    for node in id_map.values():
+        if node["parent_id"] == 0:
+            roots.append(node)
+        else:
+            parent_node = id_map.get(node["parent_id"])
+            if parent_node:
+                parent_node["children"].append(node)
+
+    def sort_children_recursive(nodes):
+        nodes.sort(key=lambda x: x['sortOrder'])
+        for node in nodes:
+            if node['children']:
+                sort_children_recursive(node['children'])
+
+    sort_children_recursive(roots)
+
+    # 一级类目按名称建索引，同名时保留排序靠前的节点 (与原线性查找行为一致)
+    root_index = {}
+    for node in roots:
+        if node["level"] == 1:
+            root_index.setdefault(node["title"], node)
+
+    return roots, root_index
+
+
+def _get_cached_tree(report_name_id):
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _tree_cache.get(report_name_id)
+        if entry and entry[0] > now:
+            return entry[1], entry[2]
+        generation = _generation
+
+    roots, root_index = _load_tree(report_name_id)
+    with _cache_lock:
+        if generation == _generation:
+            _tree_cache[report_name_id] = (now + CATALOGUE_CACHE_TTL, roots, root_index)
+    return roots, root_index
+
+
+def get_catalogue_tree(report_name_id):
+    """
+    获取报告的完整目录树 (缓存的只读结构)。
+    调用方不要修改返回值，需要输出给前端时请使用 build_import_nodes 生成副本。
+    """
+    roots, _ = _get_cached_tree(report_name_id)
+    return roots
+
+
+def get_catalogue_subtree(report_name_id, category_name):
+    """从缓存树中按名称取出一级类目节点，未找到返回 None"""
+    _, root_index = _get_cached_tree(report_name_id)
+    return root_index.get(category_name)
+
+# ==========================================
+# 2. 输出格式化
+# ==========================================
+
+def build_import_nodes(nodes, report_type, report_name, with_origin_id=False):
+    """
+    将缓存树节点转换为前端使用的导入节点 (isimport=1，来源信息填充为自身)。
+    每次调用都会生成新的字典，不影响缓存。
+    """
+    result = []
+    for node in nodes:
+        item = {
+            "title": node["title"],
+            "level": node["level"],
+            "sortOrder": node["sortOrder"],
+            "isimport": 1,
+            "origintitle": node["title"],
+            "originreportType": report_type,
+            "originreportName": report_name,
+        }
+        if with_origin_id:
+            item["origin_catalogue_id"] = node["id"]
+        item["children"] = build_import_nodes(node["children"], report_type, report_name, with_origin_id)
+        result.append(item)
+    return result
+
+# ==========================================
+# 3. 缓存失效 (由目录写操作调用)
+# ==========================================
+
+def invalidate_catalogue_cache(report_name_id=None):
+    """
+    目录写操作 (导入、创建、删除、合并) 完成后调用。
+    指定 report_name_id 时只清理该报告的目录树；不指定时清空全部目录树。
+    报告 ID 映射总是整体清空，因为新增或删除报告会改变同名私有/公共报告的优先级。
+    多 worker 模式下同时通知其他 worker 清理各自的缓存。
+    """
+    _invalidate_local(report_name_id)
+    broadcast("catalogue_cache", report_name_id)
+
+
+def _invalidate_local(report_name_id=None):
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        if report_name_id is None:
+            _tree_cache.clear()
+        else:
+            _tree_cache.pop(report_name_id, None)
+        _id_cache.clear()
+
+
+subscribe("catalogue_cache", _invalidate_local)
@@ -1,15 +1,18 @@
 import os
 import json
-import shutil
 import pymysql
 import re
 import unicodedata
 import hashlib
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, bindparam
 from urllib.parse import quote_plus, quote
 from docx import Document
 import sys
 from utils.zzp.docx_to_html import convert_docx_to_html
+from utils.zzp.catalogue_cache import invalidate_catalogue_cache
+from utils.zzp.report_stats import refresh_report_stats
+from utils.zzp.report_path_index import lookup_report_path, register_report_path, SOURCE_REPORT
+from utils.blob_store import link_file, save_document
 # ==========================================
 # 文件名 / 路径安全处理（修复非法命名问题）
 # ==========================================
@@ -131,7 +134,11 @@ def get_source_file_path(connection, origin_type, origin_report, origin_title, u
     possible_dir_names = list(dict.fromkeys(possible_dir_names))
     
     def check_paths(file_name):
-        """辅助函数：遍历所有可能的目录，检查文件是否存在"""
+        """辅助函数：优先使用路径索引，再遍历所有可能的目录，检查文件是否存在"""
+        indexed_dir = lookup_report_path(user_id, SOURCE_REPORT, origin_type, origin_report)
+        if indexed_dir and os.path.exists(os.path.join(indexed_dir, file_name)):
+            return os.path.join(indexed_dir, file_name)
+
         for dir_name in possible_dir_names:
             # 尝试路径 1: 用户私有目录
             if user_id:
@@ -201,9 +208,172 @@ def get_source_file_path(connection, origin_type, origin_report, origin_title, u
         found_path = check_paths(file_name)
         if found_path:
             return found_path
-            
+
     return None
 
+# ==========================================
+# 2.1 批量解析导入节点的源文件 (替代逐节点查询)
+# ==========================================
+
+class DirListingCache:
+    """
+    单次请求内的目录列表缓存。
+    每个目录只 listdir 一次，之后的存在性判断都在内存集合中完成，
+    避免对同一批候选目录反复 os.path.exists。
+    """
+    def __init__(self):
+        self._listings = {}
+
+    def exists(self, path):
+        dir_name, file_name = os.path.split(path)
+        dir_name = dir_name or "."
+        if dir_name not in self._listings:
+            try:
+                self._listings[dir_name] = set(os.listdir(dir_name))
+            except OSError:
+                self._listings[dir_name] = set()
+        return file_name in self._listings[dir_name]
+
+
+def _source_key(node):
+    """导入节点的来源引用，相同引用只解析一次"""
+    return (
+        node.get("originreportType"),
+        node.get("originreportName"),
+        node.get("origintitle"),
+        node.get("origin_catalogue_id")
+    )
+
+
+def collect_import_refs(chapters, refs=None):
+    """递归收集整棵章节树中所有 isimport=1 节点的来源引用"""
+    if refs is None:
+        refs = set()
+    for node in chapters:
+        if node.get("isimport", 0) == 1:
+            refs.add(_source_key(node))
+        collect_import_refs(node.get("children", []), refs)
+    return refs
+
+
+def resolve_source_file_paths(connection, chapters, user_id=None):
+    """
+    在复制文件之前一次性解析整棵章节树的源文件路径。
+    与 get_source_file_path 的查找顺序保持一致 (ID 精确查找 -> 标题匹配；
+    storage_dir -> 归一化名称 -> 原始名称；用户私有 -> 公共)，
+    但每类数据只查询一次数据库，文件探测通过 DirListingCache 完成。
+    :return: dict，key 为来源引用，value 为源文件路径 (未找到为 None)
+    """
+    refs = collect_import_refs(chapters)
+    if not refs:
+        return {}
+
+    listing = DirListingCache()
+    origin_pairs = {(r[0], r[1]) for r in refs if r[0] and r[1]}
+    type_names = list({p[0] for p in origin_pairs})
+    report_names = list({p[1] for p in origin_pairs})
+
+    # 1. 批量查询 storage_dir 与标题匹配所需的目录记录 (私有优先于公共)
+    storage_dirs = {}
+    title_files = {}
+    if origin_pairs:
+        sql_dir = text("""
+            SELECT t.type_name, n.report_name, n.storage_dir, n.user_id
+            FROM report_name n
+            JOIN report_type t ON n.type_id = t.id
+            WHERE t.type_name IN :tnames
+              AND n.report_name IN :rnames
+              AND (n.user_id = :uid OR n.user_id IS NULL)
+            ORDER BY n.user_id DESC
+        """).bindparams(bindparam("tnames", expanding=True), bindparam("rnames", expanding=True))
+        for row in connection.execute(sql_dir, {"tnames": type_names, "rnames": report_names, "uid": user_id}):
+            if row[2]:
+                storage_dirs.setdefault((row[0], row[1]), row[2])
+
+        sql_titles = text("""
+            SELECT t.type_name, n.report_name, c.catalogue_name, c.file_name, n.user_id
+            FROM report_catalogue c
+            JOIN report_name n ON c.report_name_id = n.id
+            JOIN report_type t ON c.type_id = t.id
+            WHERE t.type_name IN :tnames
+              AND n.report_name IN :rnames
+              AND (n.user_id = :uid OR n.user_id IS NULL)
+            ORDER BY n.user_id DESC
+        """).bindparams(bindparam("tnames", expanding=True), bindparam("rnames", expanding=True))
+        for row in connection.execute(sql_titles, {"tnames": type_names, "rnames": report_names, "uid": user_id}):
+            if row[3]:
+                title_files.setdefault((row[0], row[1], row[2]), (row[3], row[4]))
+
+    # 2. 批量查询按 ID 引用的源目录
+    id_files = {}
+    origin_ids = list({r[3] for r in refs if r[3]})
+    if origin_ids:
+        sql_id = text("SELECT id, file_name FROM report_catalogue WHERE id IN :oids").bindparams(
+            bindparam("oids", expanding=True)
+        )
+        for row in connection.execute(sql_id, {"oids": origin_ids}):
+            if row[1]:
+                id_files[row[0]] = row[1]
+
+    user_root = server_config.get_user_report_dir(user_id) if user_id else None
+    public_root = server_config.get_user_report_dir(None)
+
+    def check_paths(origin_type, origin_report, file_name):
+        # 路径索引命中时只需确认文件仍在规范目录中
+        indexed_dir = lookup_report_path(user_id, SOURCE_REPORT, origin_type, origin_report)
+        if indexed_dir and listing.exists(os.path.join(indexed_dir, file_name)):
+            return os.path.join(indexed_dir, file_name)
+
+        dir_names = []
+        if (origin_type, origin_report) in storage_dirs:
+            dir_names.append(storage_dirs[(origin_type, origin_report)])
+        dir_names.append(safe_path_component(origin_report))
+        dir_names.append(origin_report)
+        for dir_name in dict.fromkeys(dir_names):
+            if user_root:
+                user_path = os.path.join(user_root, origin_type, dir_name, file_name)
+                if listing.exists(user_path):
+                    return user_path
+            public_path = os.path.join(public_root, origin_type, dir_name, file_name)
+            if listing.exists(public_path):
+                return public_path
+        return None
+
+    def locate(origin_type, origin_report, db_path):
+        if listing.exists(db_path):
+            return db_path
+        if not origin_type or not origin_report:
+            return None
+        return check_paths(origin_type, origin_report, os.path.basename(db_path))
+
+    # 3. 逐个引用在内存中完成匹配
+    resolved = {}
+    for ref in refs:
+        origin_type, origin_report, origin_title, origin_id = ref
+        found = None
+
+        # 策略 1: ID 精确查找
+        if origin_id and origin_id in id_files:
+            found = locate(origin_type, origin_report, id_files[origin_id])
+
+        # 策略 2: 标题匹配 (兼容标题中带旧编号的情况)
+        if not found:
+            clean_origin_title = re.sub(r'^[\d\.]+\s*', '', origin_title).strip() if origin_title else ""
+            matches = [
+                title_files[k] for k in dict.fromkeys([
+                    (origin_type, origin_report, origin_title),
+                    (origin_type, origin_report, clean_origin_title)
+                ]) if k in title_files
+            ]
+            if matches:
+                # 与单条查询的 ORDER BY n.user_id DESC 保持一致：私有模板优先
+                db_path = sorted(matches, key=lambda m: m[1] is None)[0][0]
+                found = locate(origin_type, origin_report, db_path)
+
+        resolved[ref] = found
+
+    return resolved
+
 def get_or_create_report_type(connection, type_name, user_id=None):
     # 1. 尝试查找用户私有类型
     if user_id is not None:
@@ -283,9 +453,14 @@ def create_docx_file(file_path, content_title):
     doc = Document()
     doc.add_heading(content_title, level=0)
     doc.add_paragraph(f"这是新创建的章节【{content_title}】。")
-    doc.save(file_path)
+    # 重新生成同名报告时，旧文件可能与其他报告共享内容，不能原地覆盖
+    save_document(doc, file_path)
 
-def process_node_recursive(connection, node, root_path, parent_prefix, parent_db_id, context_ids, created_files=None, user_id=None):
+def process_node_recursive(connection, node, root_path, parent_prefix, parent_db_id, context_ids, created_files=None, user_id=None, source_paths=None):
+    """
+    :param source_paths: resolve_source_file_paths 预先解析的源文件映射；
+                         为 None 时退回到逐节点调用 get_source_file_path
+    """
     if created_files is None:
         created_files = []
         
@@ -326,14 +501,17 @@ def process_node_recursive(connection, node, root_path, parent_prefix, parent_db
         origin_title = node.get("origintitle")
         origin_id = node.get("origin_catalogue_id") # [Best Practice] 尝试获取源 ID
         
-        # A. 去数据库查找源文件路径
-        source_path = get_source_file_path(connection, origin_type, origin_report, origin_title, user_id=user_id, origin_id=origin_id)
+        # A. 查找源文件路径 (优先使用预先批量解析的结果)
+        if source_paths is not None:
+            source_path = source_paths.get(_source_key(node))
+        else:
+            source_path = get_source_file_path(connection, origin_type, origin_report, origin_title, user_id=user_id, origin_id=origin_id)
         
         # B. 执行复制
         if source_path and os.path.exists(source_path):
             try:
-                # copy2 会保留文件的元数据（如修改时间）
-                shutil.copy2(source_path, target_file_path)
+                # 相同内容只在 blob 存储中保存一份，章节文件为硬链接 (不可用时退回复制)
+                link_file(source_path, target_file_path)
                 # print(f" -> [Copy] 从 {source_path} 复制到 {target_file_path}")
                 file_created = True
             except Exception as e:
@@ -380,7 +558,8 @@ def process_node_recursive(connection, node, root_path, parent_prefix, parent_db
             parent_db_id=current_node_db_id, 
             context_ids=context_ids,
             created_files=created_files,
-            user_id=user_id
+            user_id=user_id,
+            source_paths=source_paths
         )
     return created_files
 
@@ -477,6 +656,9 @@ def generate_merged_report_from_json(json_data, agent_user_id=None):
                 "report_name_db_id": report_name_db_id
             }
             
+            # [Optimization] 复制文件前一次性解析所有导入节点的源文件路径
+            source_paths = resolve_source_file_paths(connection, chapters, user_id=agent_user_id)
+            
             # 3. 递归处理
             for chapter in chapters:
                 process_node_recursive(
@@ -487,9 +669,14 @@ def generate_merged_report_from_json(json_data, agent_user_id=None):
                     parent_db_id=0, 
                     context_ids=context_ids,
                     created_files=created_files,
-                    user_id=agent_user_id
+                    user_id=agent_user_id,
+                    source_paths=source_paths
                 )
                 
+        # 事务提交后再失效目录树缓存，避免并发读取回填旧数据
+        invalidate_catalogue_cache(report_name_db_id)
+        refresh_report_stats(report_name_db_id)
+        register_report_path(agent_user_id, SOURCE_REPORT, report_type_str, report_name_str, root_path, report_name_db_id)
         print("=== ✅ 报告合并及生成成功！ ===")
         return created_files
         
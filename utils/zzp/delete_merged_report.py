@@ -1,7 +1,6 @@
 import os
 import sys
 import logging
-import shutil
 from sqlalchemy import create_engine, text
 from urllib.parse import quote_plus
 
@@ -13,6 +12,8 @@ if project_root not in sys.path:
     sys.path.append(project_root)
 from zzp import sql_config as config
 import server_config
+from utils.zzp.report_path_index import unregister_report_path, SOURCE_MERGE
+from utils.deletion_reaper import tombstone, move_to_trash, KIND_MERGED_REPORT
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -37,7 +38,12 @@ def delete_merged_report_task(merged_id: int, user_id=None):
     try:
         with engine.connect() as conn:
             # Step 1: 获取文件路径
-            query_sql = "SELECT file_path, merged_report_name, user_id FROM report_merged_record WHERE id = :mid"
+            query_sql = """
+                SELECT m.file_path, m.merged_report_name, m.user_id, t.type_name
+                FROM report_merged_record m
+                LEFT JOIN report_type t ON t.id = m.type_id
+                WHERE m.id = :mid
+            """
             params = {"mid": merged_id}
             
             sql_get = text(query_sql)
@@ -50,6 +56,7 @@ def delete_merged_report_task(merged_id: int, user_id=None):
             file_path = result[0]
             report_name = result[1]
             owner_id = result[2]
+            type_name = result[3]
             
             # 权限校验
             # 转换为字符串进行比较，避免 int vs str 类型不匹配问题
@@ -57,46 +64,33 @@ def delete_merged_report_task(merged_id: int, user_id=None):
                 logger.warning(f"⛔ 权限拒绝: 用户 {user_id} 试图删除属于用户 {owner_id} 的报告 (ID: {merged_id})")
                 return False
 
-            # Step 2: 执行物理文件删除
-            if file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logger.info(f"🗑️ [文件删除成功] {file_path}")
-                    
-                    # 2.1 删除同名 HTML 文件
-                    html_path = os.path.splitext(file_path)[0] + ".html"
-                    if os.path.exists(html_path):
-                        os.remove(html_path)
-                        logger.info(f"🗑️ [HTML删除成功] {html_path}")
-                        
-                    try:
-                        dir_name = os.path.dirname(file_path) # .../report_merge/{user_id}/{type_name}
-                        type_name = os.path.basename(dir_name)
-                        
-                        target_img_dir = os.path.join(
-                            server_config.EDITOR_IMAGE_DIR,
-                            "report_merge",
-                            str(owner_id),
-                            type_name,
-                            report_name
-                        )
-                        
-                        if os.path.exists(target_img_dir):
-                            shutil.rmtree(target_img_dir)
-                            logger.info(f"🗑️ [图片目录删除成功] {target_img_dir}")
-                    except Exception as e:
-                        logger.warning(f"⚠️ 计算或删除图片目录失败: {e}")
+            # Step 2: 收集待删除的物理路径 (合并文件、同名 HTML、图片目录)
+            paths_to_remove = []
+            if file_path:
+                paths_to_remove.append(file_path)
+                paths_to_remove.append(os.path.splitext(file_path)[0] + ".html")
 
-                except Exception as e:
-                    logger.error(f"❌ [文件删除失败] {file_path}: {e}")
-                    # 即使文件删除失败，我们通常也继续删除数据库记录
+                if not type_name:
+                    # 报告类型已被删除时，按合并文件所在目录推断: .../report_merge/{user_id}/{type_name}
+                    type_name = os.path.basename(os.path.dirname(file_path))
+                paths_to_remove.append(os.path.join(
+                    server_config.EDITOR_IMAGE_DIR,
+                    "report_merge",
+                    str(owner_id),
+                    type_name,
+                    report_name
+                ))
             else:
-                logger.warning(f"⚠️ 文件不存在，跳过物理删除: {file_path}")
+                logger.warning(f"⚠️ 文件路径为空，跳过物理删除: {merged_id}")
 
-            # Step 3: 删除数据库记录
+            # Step 3: 删除数据库记录并登记墓碑；提交后文件移入回收目录，由后台回收线程物理删除
             sql_delete = text("DELETE FROM report_merged_record WHERE id = :mid")
             conn.execute(sql_delete, {"mid": merged_id})
+            moves = tombstone(conn, KIND_MERGED_REPORT, paths_to_remove, user_id=owner_id, label=report_name)
             conn.commit()
+            move_to_trash(moves)
+            if type_name:
+                unregister_report_path(owner_id, type_name, report_name, source_type=SOURCE_MERGE)
             
             logger.info(f"✅ 数据库记录删除成功: {report_name} (ID: {merged_id})")
             return True
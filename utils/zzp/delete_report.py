@@ -1,10 +1,13 @@
 import os
 import sys
-import shutil  
 import logging
 from sqlalchemy import create_engine, text
 from urllib.parse import quote_plus
 from utils.zzp.create_catalogue import safe_path_component # 引入归一化函数
+from utils.zzp.catalogue_cache import invalidate_catalogue_cache
+from utils.zzp.report_stats import refresh_report_stats
+from utils.zzp.report_path_index import unregister_report_path
+from utils.deletion_reaper import tombstone, move_to_trash, KIND_REPORT
 
 # ==========================================
 # 0. 基础配置与导入
@@ -65,75 +68,59 @@ def delete_report_task(target_type_name: str, target_report_name: str, user_id:
                 return False
             
             # 循环处理每一条记录（解决重名导致删除不干净的问题）
+            # 各记录的移动计划合并，事务提交后统一执行：任一记录失败回滚时，磁盘上不做任何改动
+            moves = []
             for row in result_reports:
                 report_name_id = row[0]
                 report_user_id = row[1]
                 storage_dir = row[2]
                 
-                # Step 3: 获取关联文件路径 (仅用于日志或确认，删除主要依赖目录结构)
-                sql_files = text("SELECT file_name FROM report_catalogue WHERE report_name_id = :rid")
-                file_results = conn.execute(sql_files, {"rid": report_name_id}).fetchall()
-                
-                # [Fix] 直接构造目标目录路径，不再依赖文件路径反推 (因文件路径可能仅为文件名)
                 # 优先使用数据库记录中的 user_id，如果没有则使用传入的 user_id
                 effective_user_id = report_user_id if report_user_id is not None else user_id
                 base_dir = server_config.get_user_report_dir(effective_user_id)
                 
                 # [UPDATE] 物理清理策略：同时尝试删除 storage_dir, 归一化路径, 原始路径
-                paths_to_remove = set()
+                paths_to_remove = []
                 
                 # 1. 数据库记录的物理路径
                 if storage_dir:
-                    paths_to_remove.add(os.path.join(base_dir, target_type_name, storage_dir))
+                    paths_to_remove.append(os.path.join(base_dir, target_type_name, storage_dir))
                 
                 # 2. 归一化后的路径 (可能存在于旧系统或文件系统自动转换)
-                paths_to_remove.add(os.path.join(base_dir, target_type_name, safe_path_component(target_report_name)))
+                paths_to_remove.append(os.path.join(base_dir, target_type_name, safe_path_component(target_report_name)))
                 
                 # 3. 原始名称路径 (可能存在于旧系统)
-                paths_to_remove.add(os.path.join(base_dir, target_type_name, target_report_name))
-                
-                # 执行删除
-                deleted_any = False
-                for target_directory_to_remove in paths_to_remove:
-                    if target_directory_to_remove and os.path.exists(target_directory_to_remove):
-                        try:
-                            shutil.rmtree(target_directory_to_remove)
-                            logger.info(f"🗑️ [文件夹删除] {target_directory_to_remove}")
-                            deleted_any = True
-                        except Exception as e:
-                            logger.warning(f"⚠️ [文件夹删除异常] {e}")
-                
-                if not deleted_any:
-                    # 兜底：逐个删除文件 (如果文件夹删除失败或不存在，尝试删除已知文件)
-                    # 注意：这通常发生在文件分散或其他异常情况，一般情况 rmtree 足够
-                    for f_row in file_results:
-                        file_name = f_row[0]
-                        # ... (existing fallback logic if needed, but rmtree should cover it)
-                        # 这里简单保留原逻辑的意图，但在新架构下通常不需要
-                        pass
+                paths_to_remove.append(os.path.join(base_dir, target_type_name, target_report_name))
 
                 if user_id is not None:
-                    img_dir = os.path.join(
+                    paths_to_remove.append(os.path.join(
                         server_config.EDITOR_IMAGE_DIR,
                         "report",
                         str(user_id),
                         target_type_name,
                         target_report_name
-                    )
-                    if os.path.exists(img_dir):
-                        try:
-                            shutil.rmtree(img_dir)
-                            logger.info(f"🗑️ [图片目录删除] {img_dir}")
-                        except Exception as e:
-                            logger.warning(f"⚠️ [图片目录删除异常] {e}")
+                    ))
 
-                # Step 5: 删除数据库记录
+                # Step 3: 删除数据库记录
                 sql_delete = text("DELETE FROM report_name WHERE id = :rid")
                 conn.execute(sql_delete, {"rid": report_name_id})
+
+                # Step 4: 登记墓碑 (随本事务提交)；提交后再把目录移入回收目录 (rename，不遍历目录树)，
+                # 物理删除由后台回收线程完成 (utils/deletion_reaper.py)，不再在事务内 rmtree
+                moves += tombstone(
+                    conn, KIND_REPORT, paths_to_remove,
+                    user_id=effective_user_id, label=f"{target_type_name}/{target_report_name}"
+                )
             
-            # 事务在 with 块结束时自动提交
-            logger.info(f"✅ 删除成功: [{target_type_name}] - [{target_report_name}] (共清理 {len(result_reports)} 条记录)")
-            return True
+        # 事务在 with 块结束时自动提交，提交后再失效目录树缓存
+        for row in result_reports:
+            invalidate_catalogue_cache(row[0])
+            refresh_report_stats(row[0])
+            unregister_report_path(row[1] if row[1] is not None else user_id, target_type_name, target_report_name)
+        # 目录移入回收目录并唤醒后台回收线程删除目录树 (删除完成后由回收线程回收 blob)
+        move_to_trash(moves)
+        logger.info(f"✅ 删除成功: [{target_type_name}] - [{target_report_name}] (共清理 {len(result_reports)} 条记录)")
+        return True
 
     except Exception as e:
         logger.error(f"❌ 异常: {e}")
@@ -1,7 +1,7 @@
 import mammoth
 import os
 import logging
-import uuid
+import hashlib
 import sys
 import shutil
 from urllib.parse import unquote
@@ -22,10 +22,27 @@ except ImportError:
     except ImportError:
         logging.warning("server_config import failed in docx_to_html")
 
+from utils.blob_store import write_text, atomic_write
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def _store_image(save_dir, data, ext):
+    """
+    按内容哈希保存图片，返回文件名。
+    相同内容的图片 (重复转换同一章节、多个报告引用同一模板) 只写一次磁盘，URL 也保持稳定。
+    """
+    filename = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+    file_path = os.path.join(save_dir, filename)
+    if os.path.exists(file_path):
+        return filename
+
+    # 先写临时文件再重命名，避免并发转换读到写了一半的图片 (临时文件名含进程号和线程号，同进程多线程不会互相覆盖)
+    with atomic_write(file_path) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(data)
+    return filename
+
 def _get_image_converter(user_id=None, image_output_dir=None, image_url_prefix=None):
     """
     工厂函数：返回一个用于 mammoth 的 convert_image 处理函数
@@ -47,16 +64,12 @@ def _get_image_converter(user_id=None, image_output_dir=None, image_url_prefix=N
             if not os.path.exists(save_dir):
                 os.makedirs(save_dir)
 
-            # 生成唯一文件名
             ext = image.content_type.split("/")[-1]
             if not ext: ext = "png"
-            filename = f"{uuid.uuid4()}.{ext}"
-            file_path = os.path.join(save_dir, filename)
 
-            # 保存图片
+            # 保存图片 (文件名为内容哈希，已存在时跳过写入)
             with image.open() as image_bytes:
-                with open(file_path, "wb") as f:
-                    f.write(image_bytes.read())
+                filename = _store_image(save_dir, image_bytes.read(), ext)
 
             return {
                 "src": f"{url_prefix}{filename}"
@@ -108,8 +121,7 @@ def convert_docx_to_html(docx_path, user_id=None, image_output_dir=None, image_u
 
         # 写入 HTML 文件
         # 为了更好地支持中文，指定 utf-8 编码
-        with open(html_path, "w", encoding="utf-8") as html_file:
-            html_file.write(html_content)
+        write_text(html_path, html_content)
             
         logger.debug(f"HTML 生成成功: {html_path}")
         return True
@@ -167,8 +179,9 @@ def convert_docx_list_to_merged_html(docx_paths, output_html_path, user_id=None,
                                             
                                             target_full_path = os.path.join(image_output_dir, filename)
                                             
-                                            # 避免自我复制
-                                            if os.path.abspath(source_full_path) != os.path.abspath(target_full_path):
+                                            # 避免自我复制；图片以内容哈希命名，目标已存在即内容相同，无需再次复制
+                                            if os.path.abspath(source_full_path) != os.path.abspath(target_full_path) \
+                                                    and not os.path.exists(target_full_path):
                                                 shutil.copy2(source_full_path, target_full_path)
                                             
                                             # 更新 src 为新的 merged 路径
@@ -202,8 +215,7 @@ def convert_docx_list_to_merged_html(docx_paths, output_html_path, user_id=None,
             if content:
                 html_parts.append(content)
         final_html = "".join(html_parts)
-        with open(output_html_path, "w", encoding="utf-8") as f:
-            f.write(final_html)
+        write_text(output_html_path, final_html)
         return True
     except Exception as e:
         logger.error(f"合并 HTML 失败: {output_html_path}, 错误: {e}", exc_info=True)
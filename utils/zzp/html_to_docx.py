@@ -12,6 +12,7 @@ from docx.shared import Pt
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 import server_config
+from utils.blob_store import save_document
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -202,8 +203,8 @@ def convert_html_to_docx(html_content, output_docx_path):
             logger.warning(f"图片尺寸调整过程中出现警告 (不影响文档生成): {img_err}")
         # -----------------------
         
-        # 保存文件
-        doc.save(output_docx_path)
+        # 保存文件 (文件可能与其他报告共享 blob，不能原地写)
+        save_document(doc, output_docx_path)
         logger.info(f"✅ HTML -> Word 转换成功: {output_docx_path}")
         return True
         
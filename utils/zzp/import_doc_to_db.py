@@ -15,6 +15,12 @@ from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
 from utils.zzp.docx_to_html import convert_docx_to_html
 from utils.zzp.create_catalogue import safe_path_component
+from utils.zzp.catalogue_cache import invalidate_catalogue_cache
+from utils.zzp.report_stats import refresh_report_stats
+from utils.zzp.report_path_index import register_report_path, SOURCE_REPORT
+from utils.blob_store import save_document
+from utils.stage_profiler import StageProfiler
+from utils.log_config import route_print
 
 # ==========================================
 # Monkey Patch for python-docx
@@ -89,6 +95,9 @@ def _patched_unmarshal_relationships(pkg_reader, package, parts):
 PackageReader._walk_phys_parts = staticmethod(_patched_walk_phys_parts)
 Unmarshaller._unmarshal_relationships = staticmethod(_patched_unmarshal_relationships)
 
+# LOG_CAPTURE_PRINT=1 时本模块的 print (逐章节进度) 改走 logging
+print = route_print(__name__)
+
 # ==========================================
 # 0. 配置与环境
 # ==========================================
@@ -419,8 +428,10 @@ class WordProjectExtractor:
 
     # --- 主处理逻辑 ---
 
-    def split_and_import_to_db(self, input_path, report_type_str, report_name_str, progress_callback=None, user_id=None):
+    def split_and_import_to_db(self, input_path, report_type_str, report_name_str, progress_callback=None, user_id=None, profiler=None):
         print(f"=== 开始处理: {report_name_str} (User: {user_id}) ===")
+        # 分阶段统计耗时与内存，调用方传入时可在任务状态中展示
+        profiler = profiler or StageProfiler()
         
         # 0. 确保用户目录存在
         if user_id:
@@ -481,50 +492,53 @@ class WordProjectExtractor:
             # 2. 预处理：提取图片与建立映射
             print("正在提取图片资源...")
             if progress_callback: progress_callback(10, "正在提取图片资源...")
-            self.extract_docx_images(input_path, temp_image_dir)
-            self.paragraph_image_map = self.find_precise_image_mapping(input_path)
+            with profiler.stage("extract_images"):
+                self.extract_docx_images(input_path, temp_image_dir)
+            with profiler.stage("map_images"):
+                self.paragraph_image_map = self.find_precise_image_mapping(input_path)
             
             # 3. 加载文档并分析结构
             if progress_callback: progress_callback(15, "正在分析文档深度结构...")
-            source_doc = Document(input_path)
-            self.analyze_document_structure(source_doc)
-
-            # 4. 识别章节切分点
-            paragraphs = source_doc.paragraphs
-            current_level_counters = {}
-            sections = []
-            parent_id_stack = {0: 0}
-
-            for i, para in enumerate(paragraphs):
-                lvl = self.get_heading_level(para)
-                if lvl > 0:
-                    title_text = para.text.strip()
-                    if not title_text: continue
+            with profiler.stage("split"):
+                source_doc = Document(input_path)
+                self.analyze_document_structure(source_doc)
+
+                # 4. 识别章节切分点
+                paragraphs = source_doc.paragraphs
+                current_level_counters = {}
+                sections = []
+                parent_id_stack = {0: 0}
+
+                for i, para in enumerate(paragraphs):
+                    lvl = self.get_heading_level(para)
+                    if lvl > 0:
+                        title_text = para.text.strip()
+                        if not title_text: continue
                     
-                    # [Fix] 忽略过长的“标题”，视其为正文误用样式，避免将正文误判为章节
-                    if len(title_text) > 100:
-                        continue
-
-                    structure_index = -1
-                    for idx, item in enumerate(self.doc_structure):
-                        if item['type'] == 'paragraph' and item['index'] == i:
-                            structure_index = idx
-                            break
+                        # [Fix] 忽略过长的“标题”，视其为正文误用样式，避免将正文误判为章节
+                        if len(title_text) > 100:
+                            continue
+
+                        structure_index = -1
+                        for idx, item in enumerate(self.doc_structure):
+                            if item['type'] == 'paragraph' and item['index'] == i:
+                                structure_index = idx
+                                break
                     
-                    if structure_index == -1: continue
+                        if structure_index == -1: continue
 
-                    keys_to_del = [k for k in current_level_counters if k > lvl]
-                    for k in keys_to_del: del current_level_counters[k]
-                    current_level_counters[lvl] = current_level_counters.get(lvl, 0) + 1
-                    nums = [str(current_level_counters[k]) for k in sorted(current_level_counters.keys())]
+                        keys_to_del = [k for k in current_level_counters if k > lvl]
+                        for k in keys_to_del: del current_level_counters[k]
+                        current_level_counters[lvl] = current_level_counters.get(lvl, 0) + 1
+                        nums = [str(current_level_counters[k]) for k in sorted(current_level_counters.keys())]
                     
-                    sections.append({
-                        'title': title_text,
-                        'level': lvl,
-                        'numbering': ".".join(nums),
-                        'sort_order': current_level_counters[lvl],
-                        'structure_start_index': structure_index
-                    })
+                        sections.append({
+                            'title': title_text,
+                            'level': lvl,
+                            'numbering': ".".join(nums),
+                            'sort_order': current_level_counters[lvl],
+                            'structure_start_index': structure_index
+                        })
 
             print(f"识别到 {len(sections)} 个章节，开始切分...")
             if not sections:
@@ -548,31 +562,34 @@ class WordProjectExtractor:
                 file_name = f"{section['numbering']} {safe_title}.docx"
                 file_path = os.path.join(output_dir, file_name)
                 
-                new_doc = Document()
+                with profiler.stage("split"):
+                    new_doc = Document()
                 
-                for i in range(start_idx, end_idx):
-                    item = self.doc_structure[i]
+                    for i in range(start_idx, end_idx):
+                        item = self.doc_structure[i]
                     
-                    if item['type'] == 'paragraph':
-                        src_para = item['obj']
-                        para_index = item['index']
+                        if item['type'] == 'paragraph':
+                            src_para = item['obj']
+                            para_index = item['index']
                         
-                        num_str = f"{section['numbering']} " if i == start_idx else None
-                        img_files = self.paragraph_image_map.get(para_index, [])
+                            num_str = f"{section['numbering']} " if i == start_idx else None
+                            img_files = self.paragraph_image_map.get(para_index, [])
                         
-                        self.clone_paragraph_with_content(
-                            new_doc, 
-                            src_para, 
-                            numbering=num_str,
-                            image_dir=temp_image_dir,
-                            image_files=img_files
-                        )
+                            self.clone_paragraph_with_content(
+                                new_doc, 
+                                src_para, 
+                                numbering=num_str,
+                                image_dir=temp_image_dir,
+                                image_files=img_files
+                            )
                         
-                    elif item['type'] == 'table':
-                        self.clone_table(new_doc, item['obj'])
+                        elif item['type'] == 'table':
+                            self.clone_table(new_doc, item['obj'])
 
                 try:
-                    new_doc.save(file_path)
+                    # 重新导入同名报告时，旧章节可能与其他报告共享 blob
+                    with profiler.stage("save_docx"):
+                        save_document(new_doc, file_path)
                     print(f"   生成: {file_name}")
                     
                     # [新增] 生成 HTML
@@ -589,12 +606,13 @@ class WordProjectExtractor:
                     # 路径结构: report/{user_id}/{type}/{name}/images/
                     url_prefix = f"/python-api/report_files/{user_id}/{quote(report_type_str)}/{quote(report_name_str)}/images/"
                     
-                    convert_docx_to_html(
-                        file_path, 
-                        user_id=user_id,
-                        image_output_dir=images_dir,
-                        image_url_prefix=url_prefix
-                    )
+                    with profiler.stage("convert_html"):
+                        convert_docx_to_html(
+                            file_path, 
+                            user_id=user_id,
+                            image_output_dir=images_dir,
+                            image_url_prefix=url_prefix
+                        )
                     
                 except Exception as e:
                     print(f"   [保存失败] {file_name}: {e}")
@@ -618,13 +636,18 @@ class WordProjectExtractor:
                 
                 db_title = full_title[:250] if len(full_title) > 250 else full_title
                 
-                cat_id = insert_catalogue(
-                    conn, type_id, report_name_id, db_title, 
-                    current_lvl, section['sort_order'], parent_db_id, file_name
-                )
+                with profiler.stage("db_commit"):
+                    cat_id = insert_catalogue(
+                        conn, type_id, report_name_id, db_title, 
+                        current_lvl, section['sort_order'], parent_db_id, file_name
+                    )
                 parent_id_stack[current_lvl] = cat_id
 
-            trans.commit()
+            with profiler.stage("db_commit"):
+                trans.commit()
+            invalidate_catalogue_cache(report_name_id)
+            refresh_report_stats(report_name_id)
+            register_report_path(user_id, SOURCE_REPORT, report_type_str, report_name_str, output_dir, report_name_id)
             if progress_callback: progress_callback(99, "所有章节处理完成，正在清理...")
             print("=== 处理完成 ===")
             return True, "导入成功"
@@ -642,16 +665,17 @@ class WordProjectExtractor:
 # ==========================================
 # 4. 供路由调用的封装函数 (关键新增)
 # ==========================================
-def process_document(report_type, report_name, source_file, progress_callback=None, user_id=None):
+def process_document(report_type, report_name, source_file, progress_callback=None, user_id=None, profiler=None):
     """
     路由调用的入口函数
+    :param profiler: 可选的 StageProfiler，用于收集各阶段耗时与内存
     """
     if not os.path.exists(source_file):
         print(f"文件不存在: {source_file}")
         return False, f"文件不存在: {source_file}"
     
     extractor = WordProjectExtractor()
-    return extractor.split_and_import_to_db(source_file, report_type, report_name, progress_callback, user_id=user_id)
+    return extractor.split_and_import_to_db(source_file, report_type, report_name, progress_callback, user_id=user_id, profiler=profiler)
 
 # ==========================================
 # 5. 测试入口
@@ -7,8 +7,10 @@ from urllib.parse import quote_plus
 from docx import Document
 from docxcompose.composer import Composer 
 from utils.zzp.create_catalogue import safe_path_component # 引入归一化函数 
+from utils.zzp.report_path_index import lookup_report_path, register_report_path, SOURCE_REPORT, SOURCE_MERGE
 # [FIX] 复用 html_to_docx 中的修复逻辑，避免代码重复
 from utils.zzp.html_to_docx import auto_repair_headings
+from utils.blob_store import save_document
 
 # ==========================================
 # 0. 基础配置与导入
@@ -77,8 +79,8 @@ def merge_docx_files(source_files, target_path):
             else:
                 logger.warning(f"⚠️ 合并时跳过不存在的文件: {doc_path}")
 
-        # 3. 保存
-        composer.save(target_path)
+        # 3. 保存 (重新合并时旧文件可能与其他报告共享 blob)
+        save_document(composer, target_path)
         return True, "合并成功"
     except Exception as e:
         logger.error(f"合并文件出错: {e}")
@@ -112,44 +114,47 @@ def get_sorted_source_files(target_type_name: str, target_report_name: str, user
         # 确定报告的物理文件夹名称
         base_dir = server_config.get_user_report_dir(user_id)
         
-        # 优先使用数据库记录的 storage_dir
-        if storage_dir:
-             # [FIX] 即使数据库有记录，也要检查物理路径是否存在
-             # 如果不存在，尝试重新探测，避免因历史脏数据导致找不到文件
-             check_path = os.path.join(base_dir, target_type_name, storage_dir)
-             if os.path.exists(check_path):
-                 report_dir_name = storage_dir
-             else:
-                 logger.warning(f"数据库记录的 storage_dir '{storage_dir}' 物理不存在，尝试重新探测...")
-                 storage_dir = None # 强制进入下面的探测逻辑
+        # [Optimization] 优先读取路径索引 (内存缓存 -> report_path_index 表)，未命中才探测文件系统
+        full_report_dir = lookup_report_path(user_id, SOURCE_REPORT, target_type_name, target_report_name)
+        if not full_report_dir:
+            # 优先使用数据库记录的 storage_dir
+            if storage_dir:
+                 # [FIX] 即使数据库有记录，也要检查物理路径是否存在
+                 # 如果不存在，尝试重新探测，避免因历史脏数据导致找不到文件
+                 check_path = os.path.join(base_dir, target_type_name, storage_dir)
+                 if os.path.exists(check_path):
+                     report_dir_name = storage_dir
+                 else:
+                     logger.warning(f"数据库记录的 storage_dir '{storage_dir}' 物理不存在，尝试重新探测...")
+                     storage_dir = None # 强制进入下面的探测逻辑
 
-        if not storage_dir:
-             # 兼容旧数据：尝试归一化路径，如果不存在则使用原始名称
-             # [FIX] 增强逻辑：如果两个目录都存在，优先选择包含 report_catalogue 文件的那个
-             safe_name = safe_path_component(target_report_name)
-             safe_path = os.path.join(base_dir, target_type_name, safe_name)
-             raw_path = os.path.join(base_dir, target_type_name, target_report_name)
+            if not storage_dir:
+                 # 兼容旧数据：尝试归一化路径，如果不存在则使用原始名称
+                 # [FIX] 增强逻辑：如果两个目录都存在，优先选择包含 report_catalogue 文件的那个
+                 safe_name = safe_path_component(target_report_name)
+                 safe_path = os.path.join(base_dir, target_type_name, safe_name)
+                 raw_path = os.path.join(base_dir, target_type_name, target_report_name)
              
-             safe_exists = os.path.exists(safe_path)
-             raw_exists = os.path.exists(raw_path)
+                 safe_exists = os.path.exists(safe_path)
+                 raw_exists = os.path.exists(raw_path)
              
-             if safe_exists and not raw_exists:
-                 report_dir_name = safe_name
-             elif not safe_exists and raw_exists:
-                 report_dir_name = target_report_name
-             elif safe_exists and raw_exists:
-                 # 两个都存在，检查哪个里面有实际文件
-                 # 简单策略：检查目录是否为空，或者检查第一个文件的存在性
-                 # 这里我们稍微激进一点：如果 raw_path (新逻辑) 存在，优先用 raw_path，除非它是空的
-                 if os.listdir(raw_path):
+                 if safe_exists and not raw_exists:
+                     report_dir_name = safe_name
+                 elif not safe_exists and raw_exists:
                      report_dir_name = target_report_name
+                 elif safe_exists and raw_exists:
+                     # 两个都存在，检查哪个里面有实际文件
+                     # 简单策略：检查目录是否为空，或者检查第一个文件的存在性
+                     # 这里我们稍微激进一点：如果 raw_path (新逻辑) 存在，优先用 raw_path，除非它是空的
+                     if os.listdir(raw_path):
+                         report_dir_name = target_report_name
+                     else:
+                         report_dir_name = safe_name
                  else:
-                     report_dir_name = safe_name
-             else:
-                 # 都不存在，默认用 raw
-                 report_dir_name = target_report_name
+                     # 都不存在，默认用 raw
+                     report_dir_name = target_report_name
         
-        full_report_dir = os.path.join(base_dir, target_type_name, report_dir_name)
+            full_report_dir = os.path.join(base_dir, target_type_name, report_dir_name)
 
         sql_files = text("""
             SELECT file_name FROM report_catalogue 
@@ -158,12 +163,22 @@ def get_sorted_source_files(target_type_name: str, target_report_name: str, user
         """)
         file_results = conn.execute(sql_files, {"rid": report_name_id}).fetchall()
         raw_source_files = []
+        # 一次 listdir 代替逐个文件 os.path.exists
+        try:
+            existing_files = set(os.listdir(full_report_dir))
+        except OSError:
+            existing_files = set()
         for row in file_results:
             file_name = row[0]
             if file_name:
                 # 拼接完整路径
                 full_path = os.path.join(full_report_dir, file_name)
-                if os.path.exists(full_path):
+                if os.path.normpath(os.path.dirname(full_path)) == os.path.normpath(full_report_dir):
+                    file_exists = os.path.basename(full_path) in existing_files
+                else:
+                    # 数据库中存的是其他目录下的绝对路径
+                    file_exists = os.path.exists(full_path)
+                if file_exists:
                     raw_source_files.append(full_path)
                 else:
                     logger.warning(f"文件不存在: {full_path}")
@@ -211,8 +226,10 @@ def process_report_merge(type_name: str, report_name: str, user_id=None):
     # 5. [NEW] 如果合并成功，将记录写入数据库
     if success:
         try:
-            save_merged_record_to_db(type_name, report_name, target_path, user_id)
+            report_name_id = save_merged_record_to_db(type_name, report_name, target_path, user_id)
             logger.info(f"✅ 合并记录已写入数据库: {report_name}")
+            # 合并记录写入成功后再登记路径，避免索引指向没有记录的文件
+            register_report_path(user_id, SOURCE_MERGE, type_name, report_name, target_path, report_name_id)
         except Exception as db_e:
             logger.error(f"❌ 写入数据库失败: {db_e}")
             # 注意：这里虽然数据库写入失败，但文件合并是成功的。
@@ -225,6 +242,7 @@ def process_report_merge(type_name: str, report_name: str, user_id=None):
 def save_merged_record_to_db(type_name, report_name, file_path, user_id):
     """
     将合并后的报告记录写入 report_merged_record 表
+    :return: 关联的 report_name.id
     """
     engine = get_db_connection()
     with engine.begin() as conn: # 使用事务
@@ -292,6 +310,7 @@ def save_merged_record_to_db(type_name, report_name, file_path, user_id):
                 "path": file_path,
                 "uid": real_uid
             })
+    return report_name_id
 
 if __name__ == "__main__":
     INPUT_TYPE = "资产报告"
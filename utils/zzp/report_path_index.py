@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import threading
+import logging
+from sqlalchemy import text, bindparam
+
+# ==========================================
+# 0. 基础配置与导入
+# ==========================================
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+from utils.zzp.catalogue_cache import get_db_connection
+from utils.shared_state import broadcast, subscribe
+
+logger = logging.getLogger(__name__)
+
+# 报告物理路径索引表
+# user_id = 0 表示公共报告 (MySQL 唯一索引中 NULL 互不相等，因此不用 NULL)
+# source_type: report -> 报告章节目录；merge -> 合并后的 .docx 文件
+PATH_INDEX_DDL = """
+CREATE TABLE IF NOT EXISTS `report_path_index` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `user_id` INT NOT NULL DEFAULT 0 COMMENT '所属用户ID，0 表示公共',
+  `source_type` VARCHAR(16) NOT NULL COMMENT 'report: 章节目录 / merge: 合并文件',
+  `type_name` VARCHAR(255) NOT NULL COMMENT '报告类型名称',
+  `report_name` VARCHAR(255) NOT NULL COMMENT '报告名称',
+  `report_name_id` INT NULL COMMENT '关联 report_name.id',
+  `path` VARCHAR(1024) NOT NULL COMMENT '规范物理路径',
+  `update_time` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_path_index` (`user_id`, `source_type`, `type_name`, `report_name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='报告物理路径索引';
+"""
+
+SOURCE_REPORT = "report"
+SOURCE_MERGE = "merge"
+
+# 缓存兜底过期时间 (秒)，写操作会主动更新本进程缓存
+PATH_CACHE_TTL = int(os.getenv("REPORT_PATH_CACHE_TTL", 600))
+# 索引表不可用 (未迁移) 时，暂停查询的时间 (秒)
+_DISABLE_SECONDS = 60
+
+_cache_lock = threading.Lock()
+# (查询用户 user_id, (source_type, ...), type_name, report_name) -> (expire_at, path)
+# 用户查询命中公共行 (user_id = 0) 时，缓存在该用户自己的 key 下，所以公共行变化时要清理所有用户的缓存。
+# 未找到的结果同样缓存 (path 为 None)，登记 / 删除时由 register / unregister 及其广播清理。
+_path_cache = {}
+_index_disabled_until = 0.0
+
+
+def _owner(user_id):
+    return int(user_id) if user_id is not None else 0
+
+
+def _index_usable():
+    return time.monotonic() >= _index_disabled_until
+
+
+def _disable_index(e):
+    global _index_disabled_until
+    _index_disabled_until = time.monotonic() + _DISABLE_SECONDS
+    logger.warning(f"⚠️ report_path_index 不可用，{_DISABLE_SECONDS}s 内退回路径探测: {e}")
+
+
+def ensure_path_index_table(connection):
+    """创建索引表 (幂等)，供迁移脚本调用"""
+    connection.execute(text(PATH_INDEX_DDL))
+
+# ==========================================
+# 1. 查询
+# ==========================================
+
+def _source_types(source_type):
+    return (source_type,) if isinstance(source_type, str) else tuple(source_type)
+
+
+def lookup_report_path(user_id, source_type, type_name, report_name, resolver=None):
+    """
+    获取报告的规范物理路径：内存缓存 -> 索引表 (私有优先于公共)。
+    source_type 可以是多个类型 (按优先级排列的元组)，一次查询取优先级最高的一行。
+    两者都未命中时，如果提供了 resolver (旧的路径探测逻辑)，则调用一次，结果 (包括未找到) 缓存 PATH_CACHE_TTL 秒。
+    缓存命中时不再检查磁盘，路径变化由 register / unregister 主动清理缓存。
+    :return: 路径字符串，未找到返回 None
+    """
+    source_types = _source_types(source_type)
+    key = (_owner(user_id), source_types, type_name, report_name)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _path_cache.get(key)
+    if entry and entry[0] > now:
+        return entry[1]
+
+    path = None
+    if _index_usable():
+        try:
+            sql = text("""
+                SELECT source_type, path FROM report_path_index
+                WHERE user_id IN (:uid, 0)
+                  AND source_type IN :stypes
+                  AND type_name = :tname
+                  AND report_name = :rname
+                ORDER BY user_id DESC
+            """).bindparams(bindparam("stypes", expanding=True))
+            with get_db_connection().connect() as conn:
+                rows = conn.execute(sql, {
+                    "uid": key[0],
+                    "stypes": list(source_types),
+                    "tname": type_name,
+                    "rname": report_name
+                }).fetchall()
+            # 先按 source_type 优先级，同类型内私有优先于公共 (查询已按 user_id 降序)；
+            # 索引行指向的路径已不存在时 (被其他途径删除、移动) 跳过
+            for stype in source_types:
+                path = next((row[1] for row in rows if row[0] == stype and os.path.exists(row[1])), None)
+                if path:
+                    break
+        except Exception as e:
+            _disable_index(e)
+
+    if path is None and resolver is not None:
+        path = resolver()
+
+    with _cache_lock:
+        _path_cache[key] = (now + PATH_CACHE_TTL, path or None)
+    return path
+
+
+def lookup_chapter_path(user_id, type_name, report_name, chapter_file, resolver=None):
+    """章节文件路径 = 报告规范目录 + 文件名"""
+    report_dir = lookup_report_path(user_id, SOURCE_REPORT, type_name, report_name, resolver=resolver)
+    if not report_dir:
+        return None
+    return os.path.join(report_dir, chapter_file)
+
+# ==========================================
+# 2. 写入 (由报告创建/导入/合并/删除调用)
+# ==========================================
+
+def register_report_path(user_id, source_type, type_name, report_name, path, report_name_id=None, connection=None):
+    """登记 (或更新) 报告的规范物理路径，同步本进程缓存并让其他 worker 丢弃旧路径"""
+    key = (_owner(user_id), source_type, type_name, report_name)
+    sql = text("""
+        INSERT INTO report_path_index
+            (user_id, source_type, type_name, report_name, report_name_id, path)
+        VALUES (:uid, :stype, :tname, :rname, :rid, :path)
+        ON DUPLICATE KEY UPDATE path = VALUES(path), report_name_id = VALUES(report_name_id)
+    """)
+    params = {
+        "uid": key[0],
+        "stype": source_type,
+        "tname": type_name,
+        "rname": report_name,
+        "rid": report_name_id,
+        "path": path
+    }
+    try:
+        if connection is not None:
+            connection.execute(sql, params)
+        elif _index_usable():
+            with get_db_connection().begin() as conn:
+                conn.execute(sql, params)
+    except Exception as e:
+        # 索引只是加速手段，写入失败不影响主流程
+        _disable_index(e)
+
+    # 清理包含该类型的所有缓存 (含未找到的结果、多类型查询的 key)，再写入本类型的新路径
+    _drop_local(key[0], [source_type], type_name, report_name)
+    with _cache_lock:
+        _path_cache[(key[0], (source_type,), type_name, report_name)] = (time.monotonic() + PATH_CACHE_TTL, path)
+    broadcast("report_path", key[0], [source_type], type_name, report_name)
+
+
+def unregister_report_path(user_id, type_name, report_name, source_type=None):
+    """删除报告时移除索引；source_type 为 None 时同时移除章节目录和合并文件"""
+    owner = _owner(user_id)
+    source_types = [source_type] if source_type else [SOURCE_REPORT, SOURCE_MERGE]
+
+    _drop_local(owner, source_types, type_name, report_name)
+    broadcast("report_path", owner, source_types, type_name, report_name)
+
+    if not _index_usable():
+        return
+    try:
+        sql = text("""
+            DELETE FROM report_path_index
+            WHERE user_id = :uid AND source_type = :stype
+              AND type_name = :tname AND report_name = :rname
+        """)
+        with get_db_connection().begin() as conn:
+            for stype in source_types:
+                conn.execute(sql, {"uid": owner, "stype": stype, "tname": type_name, "rname": report_name})
+    except Exception as e:
+        _disable_index(e)
+
+
+def _drop_local(owner, source_types, type_name, report_name):
+    source_types = set(source_types)
+    with _cache_lock:
+        # 公共报告 (owner 0) 的路径可能缓存在任意用户的 key 下
+        stale = [key for key in _path_cache
+                 if (owner == 0 or key[0] == owner) and source_types.intersection(key[1])
+                 and key[2] == type_name and key[3] == report_name]
+        for key in stale:
+            _path_cache.pop(key, None)
+
+
+subscribe("report_path", _drop_local)
@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import threading
+import logging
+from sqlalchemy import text, bindparam
+
+# ==========================================
+# 0. 基础配置与导入
+# ==========================================
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+from utils.zzp.catalogue_cache import get_db_connection
+from utils.shared_state import broadcast, subscribe
+
+logger = logging.getLogger(__name__)
+
+# 报告目录层级统计 (反范式汇总表)
+# 模块页加载时需要每份报告的一/二/三级目录数量。原来每份报告单独执行一次 GROUP BY level，
+# 用户有几百个模板就是几百次数据库往返。现在由目录写操作 (导入/创建/删除) 维护该表，
+# 查询时与 report_name 做一次 JOIN 即可。
+STATS_DDL = """
+CREATE TABLE IF NOT EXISTS `report_catalogue_stats` (
+  `report_name_id` INT NOT NULL COMMENT '关联 report_name.id',
+  `level_1` INT NOT NULL DEFAULT 0 COMMENT '一级目录数',
+  `level_2` INT NOT NULL DEFAULT 0 COMMENT '二级目录数',
+  `level_3` INT NOT NULL DEFAULT 0 COMMENT '三级目录数',
+  `update_time` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`report_name_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='报告目录层级统计';
+"""
+
+# 按用户缓存统计结果 (秒)。目录写操作会主动清空，TTL 仅用于兜底
+REPORT_STATS_CACHE_TTL = int(os.getenv("REPORT_STATS_CACHE_TTL", 600))
+# 汇总表不可用 (未迁移) 时，暂停使用的时间 (秒)
+_DISABLE_SECONDS = 60
+
+_cache_lock = threading.Lock()
+# user_id -> (expire_at, stats_list)
+_stats_cache = {}
+_table_disabled_until = 0.0
+
+# 以 report_name 为主表：没有任何目录的报告也会写入一行 0，
+# 查询时 LEFT JOIN 结果为 NULL 就一定表示"尚未汇总"
+_REFRESH_SQL = """
+    INSERT INTO report_catalogue_stats (report_name_id, level_1, level_2, level_3)
+    SELECT n.id,
+           COALESCE(SUM(c.level = 1), 0),
+           COALESCE(SUM(c.level = 2), 0),
+           COALESCE(SUM(c.level = 3), 0)
+    FROM report_name n
+    LEFT JOIN report_catalogue c ON c.report_name_id = n.id
+    WHERE {where}
+    GROUP BY n.id
+    ON DUPLICATE KEY UPDATE
+        level_1 = VALUES(level_1), level_2 = VALUES(level_2), level_3 = VALUES(level_3)
+"""
+
+
+def _table_usable():
+    return time.monotonic() >= _table_disabled_until
+
+
+def _disable_table(e):
+    global _table_disabled_until
+    _table_disabled_until = time.monotonic() + _DISABLE_SECONDS
+    logger.warning(f"⚠️ report_catalogue_stats 不可用，{_DISABLE_SECONDS}s 内直接聚合 report_catalogue: {e}")
+
+
+def ensure_stats_table(connection):
+    """创建汇总表 (幂等)，供迁移脚本调用"""
+    connection.execute(text(STATS_DDL))
+
+
+def rebuild_report_stats(connection):
+    """全量重建汇总表，供迁移脚本调用"""
+    connection.execute(text("DELETE FROM report_catalogue_stats"))
+    connection.execute(text(_REFRESH_SQL.format(where="1 = 1")))
+
+# ==========================================
+# 1. 写入 (由目录写操作调用)
+# ==========================================
+
+def refresh_report_stats(report_name_id, connection=None):
+    """
+    重新统计一份报告的目录层级数量，并清空所有用户的统计缓存。
+    报告已被删除时移除其汇总行。在目录写事务提交后调用 (与 invalidate_catalogue_cache 同一位置)。
+    """
+    if _table_usable():
+        try:
+            if connection is not None:
+                _refresh(connection, report_name_id)
+            else:
+                with get_db_connection().begin() as conn:
+                    _refresh(conn, report_name_id)
+        except Exception as e:
+            # 汇总表只是加速手段，写入失败不影响主流程
+            _disable_table(e)
+
+    _clear_local()
+    broadcast("report_stats")
+
+
+def _refresh(connection, report_name_id):
+    connection.execute(
+        text("DELETE FROM report_catalogue_stats WHERE report_name_id = :rid"),
+        {"rid": report_name_id}
+    )
+    connection.execute(text(_REFRESH_SQL.format(where="n.id = :rid")), {"rid": report_name_id})
+
+
+def _clear_local():
+    with _cache_lock:
+        _stats_cache.clear()
+
+
+subscribe("report_stats", _clear_local)
+
+# ==========================================
+# 2. 查询
+# ==========================================
+
+def _visible_reports_clause(user_id):
+    if user_id is not None:
+        return "(n.user_id = :uid OR n.user_id IS NULL)", {"uid": user_id}
+    # 未指定用户时只返回公共报告
+    return "n.user_id IS NULL", {}
+
+
+_STATS_SELECT_SQL = """
+    SELECT n.id, t.type_name, n.report_name, s.level_1, s.level_2, s.level_3
+    FROM report_name n
+    JOIN report_type t ON n.type_id = t.id
+    LEFT JOIN report_catalogue_stats s ON s.report_name_id = n.id
+    WHERE {where}
+    ORDER BY n.id
+"""
+
+
+def _query_from_stats(connection, user_id):
+    where, params = _visible_reports_clause(user_id)
+    rows = connection.execute(text(_STATS_SELECT_SQL.format(where=where)), params).fetchall()
+
+    # 汇总表上线前就存在、尚未回填的报告：补算一次并写回
+    missing = [row[0] for row in rows if row[3] is None]
+    if not missing:
+        return rows
+    connection.execute(
+        text(_REFRESH_SQL.format(where="n.id IN :ids")).bindparams(bindparam("ids", expanding=True)),
+        {"ids": missing}
+    )
+    connection.commit()
+    return connection.execute(text(_STATS_SELECT_SQL.format(where=where)), params).fetchall()
+
+
+def _query_aggregate(connection, user_id):
+    """汇总表不可用时：一次分组聚合 report_catalogue"""
+    where, params = _visible_reports_clause(user_id)
+    return connection.execute(text(f"""
+        SELECT n.id, t.type_name, n.report_name,
+               COALESCE(SUM(c.level = 1), 0),
+               COALESCE(SUM(c.level = 2), 0),
+               COALESCE(SUM(c.level = 3), 0)
+        FROM report_name n
+        JOIN report_type t ON n.type_id = t.id
+        LEFT JOIN report_catalogue c ON c.report_name_id = n.id
+        WHERE {where}
+        GROUP BY n.id, t.type_name, n.report_name
+        ORDER BY n.id
+    """), params).fetchall()
+
+
+def get_report_stats(user_id=None):
+    """
+    用户可见的全部报告 (私有 + 公共) 及各层级目录数量，按用户缓存。
+    返回值是缓存对象，调用方不要修改。
+    :return: [{"type_name", "report_name", "level_1", "level_2", "level_3"}, ...]
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _stats_cache.get(user_id)
+        if entry and entry[0] > now:
+            return entry[1]
+
+    rows = None
+    with get_db_connection().connect() as connection:
+        if _table_usable():
+            try:
+                rows = _query_from_stats(connection, user_id)
+            except Exception as e:
+                connection.rollback()
+                _disable_table(e)
+        if rows is None:
+            rows = _query_aggregate(connection, user_id)
+
+    stats = [
+        {
+            "type_name": row[1],
+            "report_name": row[2],
+            "level_1": int(row[3]),
+            "level_2": int(row[4]),
+            "level_3": int(row[5])
+        }
+        for row in rows
+    ]
+    with _cache_lock:
+        _stats_cache[user_id] = (now + REPORT_STATS_CACHE_TTL, stats)
+    return stats
@@ -9,6 +9,7 @@ import sys
 import zipfile
 import shutil
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import xml.etree.ElementTree as ET
 
 # Word命名空间
@@ -34,6 +35,8 @@ class DocxExtractor:
         self.document_xml = None
         self.tree = None
         self.root = None
+        # 解压目录中除 document.xml 外的全部文件 [(绝对路径, 压缩包内路径)]，批量输出时共用
+        self._parts = None
 
     def __enter__(self):
         """上下文管理器入口"""
@@ -81,37 +84,90 @@ class DocxExtractor:
 
     def find_heading_indices(self, target_heading):
         """
-        查找目标标题在body中的索引位置
+        查找目标标题在body中的索引位置 (规则见 find_all_heading_ranges)
         返回: (起始索引, 结束索引) 或 None
         """
+        indices = self.find_all_heading_ranges([target_heading]).get(target_heading)
+        if indices is not None:
+            print(f"✓ 找到目标标题 '{target_heading}'，范围 {indices[0]} - {indices[1]}")
+        return indices
+
+    def find_all_heading_ranges(self, target_headings):
+        """
+        一次扫描 body，计算多个标题各自的内容范围：
+        从目标标题开始，到其后的下一个不同标题为止，没有下一个标题时到文档末尾。
+        同名标题连续出现时起始位置移到后一次出现；范围结束后再出现的同名标题忽略。
+        单个标题的提取 (find_heading_indices) 同样使用本方法，两条路径结果一致。
+        返回: {标题: (起始索引, 结束索引)}，未找到的标题不在结果中
+        """
         body = self.root.find('.//w:body', NAMESPACES)
         if body is None:
-            return None
+            return {}
 
-        start_idx = None
-        end_idx = None
+        wanted = set(target_headings)
+        ranges = {}
+        # 已找到起始、尚未找到结束的标题
+        open_heading = None
+        # 范围已结束的标题
+        closed = set()
+        idx = -1
 
         for idx, child in enumerate(body):
-            # 只处理段落元素
-            if child.tag == f'{{{NAMESPACES["w"]}}}p':
-                is_head, style = self.is_heading(child)
-                if is_head:
-                    text = self.get_paragraph_text(child).strip()
-
-                    if text == target_heading:
-                        start_idx = idx
-                        print(f"✓ 找到目标标题 '{target_heading}' 在索引 {idx}")
-                    elif start_idx is not None and end_idx is None:
-                        end_idx = idx
-                        print(f"✓ 找到下一个标题，结束索引 {idx}")
-                        break
-
-        # 如果找到起始但没有结束，说明到文档末尾
-        if start_idx is not None and end_idx is None:
-            end_idx = len(list(body))
-            print(f"✓ 内容延伸到文档末尾，结束索引 {end_idx}")
-
-        return (start_idx, end_idx) if start_idx is not None else None
+            if child.tag != f'{{{NAMESPACES["w"]}}}p':
+                continue
+            is_head, style = self.is_heading(child)
+            if not is_head:
+                continue
+            text = self.get_paragraph_text(child).strip()
+
+            if open_heading is not None and text != open_heading:
+                ranges[open_heading] = (ranges[open_heading][0], idx)
+                closed.add(open_heading)
+                open_heading = None
+            if text in wanted and text not in closed:
+                ranges[text] = (idx, None)
+                open_heading = text
+
+        if open_heading is not None:
+            ranges[open_heading] = (ranges[open_heading][0], idx + 1)
+
+        print(f"✓ 一次扫描定位 {len(ranges)}/{len(wanted)} 个标题")
+        return ranges
+
+    def _document_bytes(self, start_idx, end_idx):
+        """只包含 body[start_idx:end_idx] 的 document.xml (不修改共享的解析树)"""
+        new_root = ET.Element(self.root.tag, self.root.attrib)
+        body = self.root.find('.//w:body', NAMESPACES)
+        for child in self.root:
+            if child is body:
+                new_body = ET.SubElement(new_root, body.tag, body.attrib)
+                new_body.extend(list(body)[start_idx:end_idx])
+            else:
+                new_root.append(child)
+        return ET.tostring(new_root, encoding='UTF-8', xml_declaration=True)
+
+    def _list_parts(self):
+        """解压目录中除 document.xml 外的全部文件，只遍历一次"""
+        if self._parts is None:
+            document_arcname = os.path.join('word', 'document.xml')
+            parts = []
+            for root, dirs, files in os.walk(self.temp_dir):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    arcname = os.path.relpath(file_path, self.temp_dir)
+                    if arcname != document_arcname:
+                        parts.append((file_path, arcname))
+            self._parts = parts
+        return self._parts
+
+    def _write_range(self, start_idx, end_idx, output_path):
+        """直接从共享解压目录写出新文档：不复制临时目录，document.xml 在内存中生成"""
+        document = self._document_bytes(start_idx, end_idx)
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for file_path, arcname in self._list_parts():
+                zipf.write(file_path, arcname)
+            zipf.writestr('word/document.xml', document)
+        return end_idx - start_idx
 
     def extract_to_new_document(self, target_heading, output_path):
         """
@@ -125,48 +181,39 @@ class DocxExtractor:
             return False
 
         start_idx, end_idx = indices
-
-        # 创建新文档目录
-        output_temp = f"{output_path}_temp"
-        if os.path.exists(output_temp):
-            shutil.rmtree(output_temp)
-
-        # 复制整个文档结构
-        shutil.copytree(self.temp_dir, output_temp)
-
-        # 读取新文档的document.xml
-        new_doc_xml = os.path.join(output_temp, 'word', 'document.xml')
-        new_tree = ET.parse(new_doc_xml)
-        new_root = new_tree.getroot()
-        new_body = new_root.find('.//w:body', NAMESPACES)
-
-        # 清空新body的内容
-        for child in list(new_body):
-            new_body.remove(child)
-
-        # 复制指定范围的所有元素
-        body = self.root.find('.//w:body', NAMESPACES)
-        extracted_count = 0
-
-        for idx, child in enumerate(list(body)):
-            if start_idx <= idx < end_idx:
-                new_body.append(child)
-                extracted_count += 1
-
-        # 保存修改后的document.xml
-        new_tree.write(new_doc_xml, encoding='UTF-8', xml_declaration=True)
+        extracted_count = self._write_range(start_idx, end_idx, output_path)
 
         print(f"✓ 已提取 {extracted_count} 个元素（段落/表格/图片等）")
-
-        # 打包成新的docx文件
-        self.pack(output_temp, output_path)
-
-        # 清理临时目录
-        shutil.rmtree(output_temp)
-
         print(f"✓ 成功保存到: {output_path}")
         return True
 
+    def extract_many(self, targets, workers=1):
+        """
+        批量提取：共用一次解压和一次标题扫描，逐个 (或并行) 写出。
+        参数:
+            targets: [(标题, 输出路径), ...]
+            workers: 并行写出的线程数 (压缩在 zlib 中进行，不占用 GIL)
+        返回: {标题: 是否成功}
+        """
+        ranges = self.find_all_heading_ranges([heading for heading, _ in targets])
+
+        def write(item):
+            heading, output_path = item
+            if heading not in ranges:
+                print(f"❌ 未找到标题: {heading}")
+                return heading, False
+            start_idx, end_idx = ranges[heading]
+            count = self._write_range(start_idx, end_idx, output_path)
+            print(f"✓ [{heading}] 已提取 {count} 个元素 -> {output_path}")
+            return heading, True
+
+        if workers > 1 and len(targets) > 1:
+            # 先生成共享的文件清单，避免各线程重复遍历
+            self._list_parts()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return dict(pool.map(write, targets))
+        return dict(write(item) for item in targets)
+
     def pack(self, directory, output_path):
         """将目录打包为docx文件"""
         with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
@@ -256,8 +303,12 @@ def extract_content(docx_path, target_heading, output_path=None):
     return success
 
 
-def batch_extract(docx_path, heading_list, output_dir=None):
-    """批量提取多个标题"""
+def batch_extract(docx_path, heading_list, output_dir=None, workers=1):
+    """
+    批量提取多个标题
+    文档只解压、解析一次，所有标题的范围在一次扫描中计算，各输出直接从同一个解压目录写出。
+    workers > 1 时并行写出。
+    """
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
 
@@ -265,28 +316,29 @@ def batch_extract(docx_path, heading_list, output_dir=None):
     print(f"批量提取模式 - 共 {len(heading_list)} 个标题")
     print(f"{'=' * 60}\n")
 
-    results = []
-
-    for i, heading in enumerate(heading_list, 1):
-        print(f"\n[{i}/{len(heading_list)}] 处理标题: {heading}")
-        print(f"{'-' * 60}")
+    base_name = os.path.splitext(os.path.basename(docx_path))[0]
+    targets = []
 
-        base_name = os.path.splitext(os.path.basename(docx_path))[0]
+    for heading in heading_list:
         safe_heading = heading.replace('/', '_').replace('\\', '_')[:50]
 
         if output_dir:
             output_path = os.path.join(output_dir, f"{base_name}_{safe_heading}.docx")
         else:
             output_path = f"{base_name}_{safe_heading}.docx"
+        targets.append((heading, output_path))
 
-        with DocxExtractor(docx_path) as extractor:
-            success = extractor.extract_to_new_document(heading, output_path)
+    with DocxExtractor(docx_path) as extractor:
+        outcome = extractor.extract_many(targets, workers=workers)
 
-        results.append({
+    results = [
+        {
             'heading': heading,
-            'output': output_path if success else None,
-            'success': success
-        })
+            'output': output_path if outcome.get(heading) else None,
+            'success': bool(outcome.get(heading))
+        }
+        for heading, output_path in targets
+    ]
 
     # 打印汇总
     print(f"\n{'=' * 60}")
@@ -319,6 +371,7 @@ def main():
         print("  3. 批量提取:")
         print("     python script.py batch 文档.docx '第一章' '第二章' '第三章'")
         print("     python script.py batch 文档.docx --output=输出目录 '第一章' '第二章'")
+        print("     python script.py batch 文档.docx --output=输出目录 --workers=4 '第一章' '第二章'")
 
         return
 
@@ -358,12 +411,17 @@ def main():
 
         docx_path = sys.argv[2]
 
-        # 检查是否指定输出目录
+        # 检查是否指定输出目录 / 并行数
         output_dir = None
+        workers = 1
         start_idx = 3
-        if sys.argv[3].startswith('--output='):
-            output_dir = sys.argv[3].split('=')[1]
-            start_idx = 4
+        while start_idx < len(sys.argv) and sys.argv[start_idx].startswith('--'):
+            option = sys.argv[start_idx]
+            if option.startswith('--output='):
+                output_dir = option.split('=', 1)[1]
+            elif option.startswith('--workers='):
+                workers = int(option.split('=', 1)[1])
+            start_idx += 1
 
         heading_list = sys.argv[start_idx:]
 
@@ -371,7 +429,7 @@ def main():
             print(f"❌ 文件不存在: {docx_path}")
             return
 
-        batch_extract(docx_path, heading_list, output_dir)
+        batch_extract(docx_path, heading_list, output_dir, workers=workers)
 
     else:
         print(f"❌ 未知命令: {command}")
@@ -395,4 +453,4 @@ if __name__ == "__main__":
     list_headings("generate_report/utils/zzp/word拆分/XA_证书.docx")
     extract_content("generate_report/utils/zzp/word拆分/XA_证书.docx","资质证书表及证明材料")
     # target = ["深圳数据交易所-数据商纪念证书","贵州省数据流通交易服务中心-数据商凭证","中国电子信息行业联合会会员"]
-    # batch_extract("XA_证书.docx",target,)
\ No newline at end of file
+    # batch_extract("XA_证书.docx",target,)
\ No newline at end of file
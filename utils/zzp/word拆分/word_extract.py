@@ -317,44 +317,37 @@ class WordProjectExtractor:
         返回：
             relationships：字典，存储图片关系映射
         """
-        relationships = {}
-
         try:
-            # 创建临时目录
-            temp_dir = tempfile.mkdtemp()
-
-            # 解压docx文件
             with zipfile.ZipFile(input_path, 'r') as zip_ref:
-                # 提取关系文件
-                rels_path = 'word/_rels/document.xml.rels'
-                if rels_path in zip_ref.namelist():
-                    zip_ref.extract(rels_path, temp_dir)
-
-                    # 解析关系文件
-                    rels_file = os.path.join(temp_dir, rels_path)
-                    if os.path.exists(rels_file):
-                        tree = ET.parse(rels_file)
-                        root = tree.getroot()
-
-                        for rel in root:  # 遍历关系文件的根元素root中的所有子元素rel
-                            rel_id = rel.get('Id')
-                            rel_type = rel.get('Type')
-                            rel_target = rel.get('Target')  # 关系的目标路径
-
-                            if 'image' in rel_type or 'media' in rel_target:  # 找出关系类型为image或目标路径为media的图片id和路径
-                                relationships[rel_id] = rel_target
-
-            # 清理临时目录
-            shutil.rmtree(temp_dir)
-
+                return self._read_image_relationships(zip_ref)
         except Exception as e:
             print(f"️   获取图片关系失败: {e}")
+            return {}
 
+    def _read_image_relationships(self, zip_ref):
+        """直接从压缩包读取关系文件 (不解压到磁盘)，返回 {关系id: 目标路径}"""
+        relationships = {}
+        rels_path = 'word/_rels/document.xml.rels'
+        if rels_path not in zip_ref.namelist():
+            return relationships
+
+        root = ET.fromstring(zip_ref.read(rels_path))
+        for rel in root:  # 遍历关系文件的根元素root中的所有子元素rel
+            rel_id = rel.get('Id')
+            rel_type = rel.get('Type') or ''
+            rel_target = rel.get('Target') or ''  # 关系的目标路径
+
+            if 'image' in rel_type or 'media' in rel_target:  # 找出关系类型为image或目标路径为media的图片id和路径
+                relationships[rel_id] = rel_target
         return relationships
 
     def find_precise_image_mapping(self, input_path):
         """
         为文档中的每个段落找到与之关联的图片
+        流式解析：直接从压缩包读取 document.xml，iterparse 一次遍历完成，
+        每处理完 body 的一个顶层元素就释放它，内存占用与文档大小无关 (200MB 的文档也只保留一个段落)。
+        段落编号规则与 body.findall('w:p') 一致：只统计 body 的直接子段落，表格内的段落不计；
+        段落内任意深度的 <a:blip> (inline / anchor / 文本框等) 都归属该段落，按出现顺序记录。
         参数：
             input_path：word路径
         返回：
@@ -362,93 +355,58 @@ class WordProjectExtractor:
         """
         paragraph_images = defaultdict(list)
 
-        try:
-            # 创建临时目录
-            temp_dir = tempfile.mkdtemp()
+        w_ns = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+        tag_body = f'{w_ns}body'
+        tag_p = f'{w_ns}p'
+        tag_blip = '{http://schemas.openxmlformats.org/drawingml/2006/main}blip'
+        attr_embed = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed'
 
-            # 使用 zipfile.ZipFile 打开输入的 Word 文档，并将其解压到临时目录中。
+        try:
             with zipfile.ZipFile(input_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-
-            # 读取主文档XML
-            document_path = os.path.join(temp_dir, 'word', 'document.xml')
-            if not os.path.exists(document_path):  # 若不存在主文档XML文件，则返回空的字典
-                return paragraph_images
-
-            # 解析XML
-            tree = ET.parse(document_path)
-            root = tree.getroot()
-
-            # 获取命名空间
-            ns = {
-                'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
-                'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
-                'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
-                'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing',
-                'pic': 'http://schemas.openxmlformats.org/drawingml/2006/picture'
-            }
-
-            # 查找文档主体（<w:body>），并获取其中的所有段落（<w:p> 元素）
-            body = root.find('w:body', ns)
-            if body is None:
-                return paragraph_images
-
-            paragraphs = body.findall('w:p', ns)
-
-            # 获取图片关系
-            image_rels = self.get_image_relationships(input_path)  # 字典，键是word中图片的id，值为关系路径
-
-            print(f"   找到 {len(image_rels)} 个图片关系")
-
-            # 为每个段落查找图片
-            for para_idx, para in enumerate(paragraphs):  # 遍历文档中的每个段落，para_idx 是段落的索引，para 是段落的 XML 元素
-                # 方法1：查找blip元素（最常见的图片引用）
-                blips = para.findall('.//a:blip', ns)  # 查找段落中的所有 <a:blip> 元素，这些元素通常用于引用图片
-                for blip in blips:
-                    embed_id = blip.get(
-                        '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')  # 获取 embed 属性的值，该值是图片的关系 ID
-                    if embed_id and embed_id in image_rels:  # 如果该id存在于图片关系映射中，则获取对应的图片文件路径，并将其添加到当前段落的图片列表中。
-                        image_file = image_rels[embed_id]
-                        # 提取文件名
-                        if '/' in image_file:
-                            image_file = image_file.split('/')[-1]
-                        paragraph_images[para_idx].append(image_file)
-
-                # 方法2：查找inline中的图片
-                drawings = para.findall('.//wp:inline', ns)
-                for drawing in drawings:
-                    blips = drawing.findall('.//a:blip', ns)
-                    for blip in blips:
-                        embed_id = blip.get(
-                            '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
-                        if embed_id and embed_id in image_rels:
-                            image_file = image_rels[embed_id]
-                            if '/' in image_file:
-                                image_file = image_file.split('/')[-1]
-                            if image_file not in paragraph_images[para_idx]:
-                                paragraph_images[para_idx].append(image_file)
-
-                # 方法3：查找anchor中的图片
-                anchors = para.findall('.//wp:anchor', ns)
-                for anchor in anchors:
-                    blips = anchor.findall('.//a:blip', ns)
-                    for blip in blips:
-                        embed_id = blip.get(
-                            '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
-                        if embed_id and embed_id in image_rels:
-                            image_file = image_rels[embed_id]
-                            if '/' in image_file:
-                                image_file = image_file.split('/')[-1]
-                            if image_file not in paragraph_images[para_idx]:
-                                paragraph_images[para_idx].append(image_file)
-
-            # 清理临时目录
-            shutil.rmtree(temp_dir)
+                if 'word/document.xml' not in zip_ref.namelist():  # 若不存在主文档XML文件，则返回空的字典
+                    return paragraph_images
+
+                # 获取图片关系
+                image_rels = self._read_image_relationships(zip_ref)  # 字典，键是word中图片的id，值为关系路径
+                print(f"   找到 {len(image_rels)} 个图片关系")
+
+                depth = 0            # 当前元素深度：document=1, body=2, body 的顶层元素=3
+                body = None
+                in_paragraph = False  # 当前是否位于 body 的某个顶层段落内
+                para_idx = 0
+
+                with zip_ref.open('word/document.xml') as stream:
+                    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+                        if event == 'start':
+                            depth += 1
+                            if depth == 2 and elem.tag == tag_body:
+                                body = elem
+                            elif depth == 3 and body is not None:
+                                in_paragraph = elem.tag == tag_p
+                            elif in_paragraph and elem.tag == tag_blip:
+                                # 属性在 start 事件时已经解析完成
+                                embed_id = elem.get(attr_embed)
+                                if embed_id and embed_id in image_rels:
+                                    image_file = image_rels[embed_id]
+                                    # 提取文件名
+                                    if '/' in image_file:
+                                        image_file = image_file.split('/')[-1]
+                                    paragraph_images[para_idx].append(image_file)
+                            continue
+
+                        if depth == 3 and body is not None:
+                            if in_paragraph:
+                                para_idx += 1
+                                in_paragraph = False
+                            # 顶层元素处理完毕，释放整棵子树
+                            elem.clear()
+                            body.remove(elem)
+                        elif depth == 2 and elem is body:
+                            body = None
+                        depth -= 1
 
         except Exception as e:
             print(f"   ️  建立图片映射失败: {e}")
-            if 'temp_dir' in locals() and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
 
         return paragraph_images
 